@@ -1,788 +1,788 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, abort, jsonify, request
 from flask_cors import CORS
 from datetime import datetime, timezone
-import threading
+from urllib.parse import urlencode
+import base64
+import itertools
+import json
+import os
 import time
-import math
-import requests
 
-from db import get_conn
+import psycopg2.pool
 
-# Arnhem config
-ARNHEM_LAT = 51.9851
-ARNHEM_LON = 5.8987
-
-# Statistieken-bubbel (km)
-BUBBLE_RADIUS_KM = 7.5
-
-# Opslag-bereik voor tracks (km) – optie C
-TRACK_RADIUS_KM = 20.0
-
-ADSB_URL = "https://opendata.adsb.fi/api/v3/lat/51.9851/lon/5.8987/dist/10"
+import collector
+import export
+import live
+import rollups
+import segmentation
+import tracks as tracks_lib
+from cache import cached
+from db import cursor as db_cursor, iter_rows
 
 app = Flask(__name__)
-CORS(app)
-
-collector_started = False  # ensures background thread runs only once
+CORS(app, expose_headers=["Link"])
 
-
-# -------------------------------------------------------------------
-# Database initialization
-# -------------------------------------------------------------------
-def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
-    with open("schema.sql") as f:
-        cur.execute(f.read())
-    conn.commit()
-    cur.close()
-    conn.close()
+# De collector draait als aparte service (python collector.py, zie
+# render.yaml); web-workers pollen en schrijven niet. Alleen voor lokaal
+# draaien in één proces: COLLECTOR_IN_WEB=1 start hem hier als thread.
+if os.environ.get("COLLECTOR_IN_WEB", "0") == "1":
+    collector.start_in_background()
 
 
 # -------------------------------------------------------------------
 # Query helper
 # -------------------------------------------------------------------
 def query(sql):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(sql)
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
+    with db_cursor() as cur:
+        cur.execute(sql)
+        return cur.fetchall()
+
+
+# Alle pool-verbindingen bezet (db.POOL_TIMEOUT_S): 503 i.p.v. een 500
+@app.errorhandler(psycopg2.pool.PoolError)
+def pool_exhausted(e):
+    return Response("database busy, retry shortly\n", status=503, mimetype="text/plain",
+                    headers={"Retry-After": "1"})
 
 
 # -------------------------------------------------------------------
-# Collector logic
+# Query-parameters
 # -------------------------------------------------------------------
-def haversine_km(lat1, lon1, lat2, lon2):
-    R = 6371.0
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = (
-        math.sin(dphi / 2) ** 2 +
-        math.cos(phi1) * math.cos(phi2) *
-        math.sin(dlambda / 2) ** 2
-    )
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-
-def save_positions(ac_list):
-    """
-    Sla ALLE metingen op binnen TRACK_RADIUS_KM (20 km),
-    zodat routes op de kaart volledig zichtbaar zijn.
-    """
-    conn = get_conn()
-    cur = conn.cursor()
-    now = int(datetime.now(timezone.utc).timestamp())
-
-    for ac in ac_list:
-        lat = ac.get("lat")
-        lon = ac.get("lon")
-        if lat is None or lon is None:
-            continue
-
-        # restrict to 20 km opslag-bereik
-        if haversine_km(ARNHEM_LAT, ARNHEM_LON, lat, lon) > TRACK_RADIUS_KM:
-            continue
-
-        cur.execute(
-            """
-            INSERT INTO positions (icao, callsign, ts, lat, lon, alt_ft, gs_kts)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """,
-            (
-                ac.get("icao"),
-                (ac.get("flight") or "").strip(),
-                now,
-                lat,
-                lon,
-                ac.get("alt_baro"),
-                ac.get("gs"),
-            )
-        )
+def arg_float(name):
+    value = request.args.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        abort(400, f"{name} must be a number")
 
-    conn.commit()
-    cur.close()
-    conn.close()
 
+def arg_time(name):
+    """Unix-seconden of een (UTC-)datum YYYY-MM-DD."""
+    value = request.args.get(name)
+    if value is None or value == "":
+        return None
+    if value.isdigit():
+        return int(value)
+    try:
+        dt = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except ValueError:
+        abort(400, f"{name} must be unix seconds or YYYY-MM-DD")
+    return int(dt.timestamp())
 
-def collector_loop():
-    print("Collector thread started")
-    init_db()
 
-    while True:
-        try:
-            r = requests.get(ADSB_URL, timeout=10)
-            r.raise_for_status()
-            ac = r.json().get("ac", [])
-            save_positions(ac)
-            print("Saved batch at", datetime.utcnow())
-        except Exception as e:
-            print("Collector error:", e)
-
-        time.sleep(10)
+def arg_int(name, default=None, minimum=None, maximum=None):
+    value = request.args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        abort(400, f"{name} must be an integer")
+    if minimum is not None and value < minimum:
+        abort(400, f"{name} must be at least {minimum}")
+    if maximum is not None and value > maximum:
+        abort(400, f"{name} must be at most {maximum}")
+    return value
+
+
+def arg_range(lo_name, hi_name):
+    """(lo, hi) uit twee float-parameters; elk mag ontbreken, maar lo < hi."""
+    lo = arg_float(lo_name)
+    hi = arg_float(hi_name)
+    if lo is not None and hi is not None and hi <= lo:
+        abort(400, f"{hi_name} must be greater than {lo_name}")
+    return lo, hi
+
+
+def arg_percentiles(name="percentiles"):
+    value = request.args.get(name)
+    if not value:
+        return ()
+    try:
+        ps = tuple(float(p) for p in value.split(","))
+    except ValueError:
+        abort(400, f"{name} must be a comma-separated list of numbers")
+    if any(p < 0 or p > 100 for p in ps):
+        abort(400, f"{name} must be between 0 and 100")
+    return ps
 
 
 # -------------------------------------------------------------------
-# Start collector once on first request
+# Tijdvenster en paginering
+#
+# Alle /api/*-endpoints (behalve ingest_stats en live) accepteren from/to (to
+# exclusief); lijsten ook limit en cursor. De cursor voor de volgende
+# pagina staat in de Link-header (rel="next") en is opaak voor de client.
 # -------------------------------------------------------------------
-@app.before_request
-def start_collector_once():
-    global collector_started
-    if not collector_started:
-        print("Launching collector thread...")
-        t = threading.Thread(target=collector_loop, daemon=True)
-        t.start()
-        collector_started = True
+MAX_LIMIT = 1000
 
 
-# -------------------------------------------------------------------
-# SQL-fragment voor bubbel-filter (7.5 km, Haversine in PostgreSQL)
-# -------------------------------------------------------------------
-BUBBLE_SQL = f"""
-  (6371 * 2 * ASIN(
-     SQRT(
-       POWER(SIN(RADIANS(lat - {ARNHEM_LAT})/2), 2) +
-       COS(RADIANS({ARNHEM_LAT})) * COS(RADIANS(lat)) *
-       POWER(SIN(RADIANS(lon - {ARNHEM_LON})/2), 2)
-     )
-   )) <= {BUBBLE_RADIUS_KM}
-"""
+def arg_window():
+    from_ts = arg_time("from")
+    to_ts = arg_time("to")
+    if from_ts is not None and to_ts is not None and to_ts <= from_ts:
+        abort(400, "to must be after from")
+    return from_ts, to_ts
 
 
-# -------------------------------------------------------------------
-# Helper: datumformat NL
-# -------------------------------------------------------------------
-def to_nl_date(ymd):
-    if not ymd:
+def flight_set():
+    """De FlightSet voor ?from=&to=; het venster gaat mee de query in."""
+    return segmentation.current(*arg_window())
+
+
+def arg_limit(default=None):
+    return arg_int("limit", default, minimum=1, maximum=MAX_LIMIT)
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def arg_cursor(*types):
+    """Gedecodeerde cursor als tuple van `types`, of None."""
+    value = request.args.get("cursor")
+    if not value:
         return None
     try:
-        dt = datetime.strptime(ymd, "%Y-%m-%d")
-        return dt.strftime("%d-%m-%Y")
-    except Exception:
-        return ymd  # fallback
+        values = json.loads(base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)))
+    except ValueError:
+        abort(400, "invalid cursor")
+    if (not isinstance(values, list) or len(values) != len(types)
+            or not all(isinstance(v, t) for v, t in zip(values, types))):
+        abort(400, "invalid cursor")
+    return tuple(values)
+
+
+def paginated(payload, next_cursor):
+    """jsonify(payload), met een Link-header naar de volgende pagina als die er is."""
+    resp = payload if isinstance(payload, Response) else jsonify(payload)
+    if next_cursor is not None:
+        args = request.args.to_dict(flat=False)
+        args["cursor"] = [encode_cursor(list(next_cursor))]
+        resp.headers["Link"] = f'<{request.path}?{urlencode(args, doseq=True)}>; rel="next"'
+    return resp
+
+
+# -------------------------------------------------------------------
+# Streaming
+#
+# Ongelimiteerde lijsten (ruwe hist_*/scatter, tracks) gaan als chunked
+# JSON-array de deur uit, direct vanuit een server-side cursor
+# (db.iter_rows): het geheugengebruik hangt niet af van de grootte van het
+# resultaat. Zulke responses slaat @cached niet op.
+# -------------------------------------------------------------------
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def stream_json(items):
+    """Chunked JSON-array uit een (lazy) iterable; zelfde opmaak als jsonify."""
+    def generate():
+        buf = ["["]
+        size = 1
+        sep = ""
+        for item in items:
+            text = sep + app.json.dumps(item, separators=(",", ":"))
+            sep = ","
+            buf.append(text)
+            size += len(text)
+            if size >= STREAM_CHUNK_BYTES:
+                yield "".join(buf)
+                buf = []
+                size = 0
+        buf.append("]\n")
+        yield "".join(buf)
+
+    return Response(generate(), mimetype="application/json")
+
+
+# -------------------------------------------------------------------
+# Dashboard-endpoints
+#
+# Alle onderstaande endpoints tellen dezelfde unieke vluchten in de bubbel.
+# Wat niet uit de rollups of een gepagineerde query komt, leidt af uit de
+# gedeelde FlightSet (segmentation.current()), die per data-versie (en per
+# venster) maar één keer uit de database komt.
+# -------------------------------------------------------------------
+
+# /api/last10 – laatste 10 (limit) unieke vluchten (op basis van bubbel-metingen)
+#
+# Keyset-paginering in SQL op (bubble_ts, callsign), in dezelfde volgorde
+# als de FlightSet; een pagina leest alleen zijn eigen limit + 1 vluchten
+# (idx_flights_bubble_ts, achterwaarts).
+LAST10_SQL = """
+    SELECT bubble_ts, callsign, gs_kts, alt_ft
+    FROM flights
+    WHERE in_bubble
+      AND bubble_ts >= %(from_ts)s
+      AND bubble_ts < %(to_ts)s
+      {cursor}
+    ORDER BY bubble_ts DESC, callsign COLLATE "C" DESC
+    LIMIT %(limit)s;
+"""
 
 
-# -------------------------------------------------------------------
-# /api/last10  – laatste 10 unieke vluchten (op basis van bubbel-metingen)
-# -------------------------------------------------------------------
-@app.get("/api/last10")
-def last10():
-    rows = query(f"""
-        WITH ordered AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            LAG(ts) OVER (PARTITION BY callsign ORDER BY ts) AS prev_ts
-          FROM positions
-          WHERE callsign IS NOT NULL
-            AND callsign <> ''
-            AND {BUBBLE_SQL}
-        ),
-        flagged AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            CASE
-              WHEN prev_ts IS NULL THEN 1
-              WHEN ts - prev_ts > 3600 THEN 1
-              ELSE 0
-            END AS is_new_flight
-          FROM ordered
-        ),
-        segmented AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            SUM(is_new_flight) OVER (PARTITION BY callsign ORDER BY ts) AS flight_seq
-          FROM flagged
-        ),
-        flights AS (
-          -- per vlucht (callsign, flight_seq) de laatste meting in de bubbel
-          SELECT DISTINCT ON (callsign, flight_seq)
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft
-          FROM segmented
-          ORDER BY callsign, flight_seq, ts DESC
-        )
-        SELECT callsign, ts, gs_kts, alt_ft
-        FROM flights
-        ORDER BY ts DESC
-        LIMIT 10;
-    """)
+def last10_page(n, before=None, from_ts=None, to_ts=None):
+    """n vluchten (nieuwste eerst) van vóór `before`; geeft (rijen, volgende cursor)."""
+    params = dict(rollups.window_params(from_ts, to_ts), limit=n + 1)
+    cursor_sql = ""
+    if before is not None:
+        cursor_sql = 'AND (bubble_ts, callsign COLLATE "C") < (%(c_ts)s, %(c_callsign)s)'
+        params.update(c_ts=before[0], c_callsign=before[1])
 
-    return jsonify([
+    with db_cursor() as cur:
+        cur.execute(LAST10_SQL.format(cursor=cursor_sql), params)
+        flights = cur.fetchall()
+
+    next_cursor = None
+    if len(flights) > n:
+        flights = flights[:n]
+        next_cursor = (flights[-1]["bubble_ts"], flights[-1]["callsign"])
+    rows = [
         {
-            "ts": datetime.fromtimestamp(r["ts"], tz=timezone.utc).isoformat(),
-            "callsign": r["callsign"],
-            "gs_kts": r["gs_kts"],
-            "alt_ft": r["alt_ft"],
+            "ts": segmentation.iso(f["bubble_ts"]),
+            "callsign": f["callsign"],
+            "gs_kts": f["gs_kts"],
+            "alt_ft": f["alt_ft"],
         }
-        for r in rows
-    ])
+        for f in flights
+    ]
+    return rows, next_cursor
+
+
+@app.get("/api/last10")
+@cached
+def last10():
+    n = arg_limit(10)
+    before = arg_cursor(int, str)
+    return paginated(*last10_page(n, before, *arg_window()))
+
+
+# daily_counts, stats, hourly_heatmap en top_callsigns komen uit de
+# rollup-tabellen (O(dagen)) zolang het venster op daggrenzen ligt, anders
+# uit de FlightSet van het venster.
+def daily_rows(from_ts, to_ts):
+    if rollups.covers(from_ts, to_ts):
+        with db_cursor() as cur:
+            return rollups.daily_counts(cur, from_ts, to_ts)
+    return segmentation.daily_counts(segmentation.current(from_ts, to_ts))
+
+
+def heatmap_rows(from_ts, to_ts):
+    if rollups.covers(from_ts, to_ts):
+        with db_cursor() as cur:
+            return rollups.hourly_heatmap(cur, from_ts, to_ts)
+    return segmentation.hourly_heatmap(segmentation.current(from_ts, to_ts))
+
+
+def callsign_rows(from_ts, to_ts, n=10, offset=0):
+    if rollups.covers(from_ts, to_ts):
+        with db_cursor() as cur:
+            return rollups.top_callsigns(cur, from_ts, to_ts, n, offset)
+    return segmentation.top_callsigns(segmentation.current(from_ts, to_ts), n, offset)
+
+
+def stats_of(from_ts, to_ts, days=None):
+    if rollups.covers(from_ts, to_ts):
+        if days is None:
+            days = daily_rows(from_ts, to_ts)
+        with db_cursor() as cur:
+            first_ts, last_ts = rollups.period(cur, from_ts, to_ts)
+        return segmentation.stats_from_days(
+            {r["day"]: r["flights"] for r in days}, first_ts, last_ts
+        )
+    return segmentation.stats(segmentation.current(from_ts, to_ts))
 
 
-# -------------------------------------------------------------------
 # /api/daily_counts – aantal unieke vluchten per dag (bubbel)
-# -------------------------------------------------------------------
+#
+# De cursor is de laatst geleverde dag; de volgende pagina begint de dag
+# erna (keyset), met limit + 1 dagen uit de rollups, of buiten daggrenzen
+# uit flights.
+DAYS_SQL = """
+    SELECT
+      to_char((to_timestamp(bubble_ts) AT TIME ZONE 'UTC')::DATE, 'YYYY-MM-DD') AS day,
+      COUNT(*)::INTEGER AS flights
+    FROM flights
+    WHERE in_bubble
+      AND bubble_ts >= %(from_ts)s
+      AND bubble_ts < %(to_ts)s
+    GROUP BY 1
+    ORDER BY 1
+    LIMIT %(limit)s;
+"""
+
+
 @app.get("/api/daily_counts")
+@cached
 def daily_counts():
-    rows = query(f"""
-        WITH ordered AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            LAG(ts) OVER (PARTITION BY callsign ORDER BY ts) AS prev_ts
-          FROM positions
-          WHERE callsign IS NOT NULL
-            AND callsign <> ''
-            AND {BUBBLE_SQL}
-        ),
-        flagged AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            CASE
-              WHEN prev_ts IS NULL THEN 1
-              WHEN ts - prev_ts > 3600 THEN 1
-              ELSE 0
-            END AS is_new_flight
-          FROM ordered
-        ),
-        segmented AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            SUM(is_new_flight) OVER (PARTITION BY callsign ORDER BY ts) AS flight_seq
-          FROM flagged
-        ),
-        flights AS (
-          SELECT DISTINCT ON (callsign, flight_seq)
-            callsign,
-            ts
-          FROM segmented
-          ORDER BY callsign, flight_seq, ts DESC
-        )
-        SELECT
-          to_char(to_timestamp(ts), 'YYYY-MM-DD') AS day,
-          COUNT(*) AS flights
-        FROM flights
-        GROUP BY day
-        ORDER BY day;
-    """)
-    return jsonify(rows)
+    limit = arg_limit()
+    after = arg_cursor(str)
+    from_ts, to_ts = arg_window()
+    if after is not None:
+        try:
+            day = datetime.strptime(after[0], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        except ValueError:
+            abort(400, "invalid cursor")
+        from_ts = max(from_ts or 0, int(day.timestamp()) + 86400)
+
+    fetch = None if limit is None else limit + 1  # LIMIT NULL = alles
+    with db_cursor() as cur:
+        if rollups.covers(from_ts, to_ts):
+            rows = rollups.daily_counts(cur, from_ts, to_ts, fetch)
+        else:
+            cur.execute(DAYS_SQL, dict(rollups.window_params(from_ts, to_ts), limit=fetch))
+            rows = [dict(r) for r in cur.fetchall()]
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1]["day"],)
+    return paginated(rows, next_cursor)
 
 
-# -------------------------------------------------------------------
 # /api/stats – gebaseerd op unieke vluchten in de bubbel
-# -------------------------------------------------------------------
 @app.get("/api/stats")
+@cached
 def stats():
-    conn = get_conn()
-    cur = conn.cursor()
+    return jsonify(stats_of(*arg_window()))
 
-    # Eerste en laatste ruwe meting (meetperiode, alle data binnen 20 km)
-    cur.execute("""
-        SELECT MIN(ts) AS first_ts, MAX(ts) AS last_ts
-        FROM positions;
-    """)
-    row0 = cur.fetchone()
-    first_ts = row0["first_ts"]
-    last_ts = row0["last_ts"]
-
-    # Unieke vluchten in de bubbel
-    cur.execute(f"""
-        WITH ordered AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            LAG(ts) OVER (PARTITION BY callsign ORDER BY ts) AS prev_ts
-          FROM positions
-          WHERE callsign IS NOT NULL
-            AND callsign <> ''
-            AND {BUBBLE_SQL}
-        ),
-        flagged AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            CASE
-              WHEN prev_ts IS NULL THEN 1
-              WHEN ts - prev_ts > 3600 THEN 1
-              ELSE 0
-            END AS is_new_flight
-          FROM ordered
-        ),
-        segmented AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            SUM(is_new_flight) OVER (PARTITION BY callsign ORDER BY ts) AS flight_seq
-          FROM flagged
-        ),
-        flights AS (
-          SELECT DISTINCT ON (callsign, flight_seq)
-            callsign,
-            ts
-          FROM segmented
-          ORDER BY callsign, flight_seq, ts DESC
-        )
-        SELECT
-          COUNT(*) AS total,
-          ARRAY_AGG(
-            JSON_BUILD_OBJECT(
-              'day', to_char(to_timestamp(ts), 'YYYY-MM-DD'),
-              'ts', ts
-            )
-            ORDER BY ts
-          ) AS daily_detail
-        FROM flights;
-    """)
-    row1 = cur.fetchone()
-    total = row1["total"]
-    daily_detail = row1["daily_detail"] or []
-
-    cur.close()
-    conn.close()
-
-    # daily_detail is een array van {day, ts}; reduceer naar counts per dag
-    day_counts = {}
-    for item in daily_detail:
-        day = item["day"]
-        day_counts[day] = day_counts.get(day, 0) + 1
-
-    days = len(day_counts)
-    median = 0
-    max_flights = 0
-    max_day = None
-
-    if days > 0:
-        counts = list(day_counts.values())
-        sorted_counts = sorted(counts)
-        mid = days // 2
-        if days % 2 == 1:
-            median = sorted_counts[mid]
-        else:
-            median = (sorted_counts[mid - 1] + sorted_counts[mid]) / 2
-
-        max_flights = max(counts)
-        for d, c in day_counts.items():
-            if c == max_flights:
-                max_day = d
-                break
-
-    def iso(ts):
-        if ts is None:
-            return None
-        return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
-
-    return jsonify({
-        "total_flights": total,
-        "first_ts": iso(first_ts),
-        "last_ts": iso(last_ts),
-        "days": days,
-        "median_per_day": median,
-        "max_per_day": max_flights,
-        "max_per_day_date": to_nl_date(max_day)
-    })
 
-
-# -------------------------------------------------------------------
 # /api/hourly_heatmap – unieke vluchten per weekday × uur (bubbel)
-# -------------------------------------------------------------------
 @app.get("/api/hourly_heatmap")
+@cached
 def hourly_heatmap():
-    rows = query(f"""
-        WITH ordered AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            LAG(ts) OVER (PARTITION BY callsign ORDER BY ts) AS prev_ts
-          FROM positions
-          WHERE callsign IS NOT NULL
-            AND callsign <> ''
-            AND {BUBBLE_SQL}
-        ),
-        flagged AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            CASE
-              WHEN prev_ts IS NULL THEN 1
-              WHEN ts - prev_ts > 3600 THEN 1
-              ELSE 0
-            END AS is_new_flight
-          FROM ordered
-        ),
-        segmented AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            SUM(is_new_flight) OVER (PARTITION BY callsign ORDER BY ts) AS flight_seq
-          FROM flagged
-        ),
-        flights AS (
-          SELECT DISTINCT ON (callsign, flight_seq)
-            callsign,
-            ts
-          FROM segmented
-          ORDER BY callsign, flight_seq, ts DESC
-        )
-        SELECT
-          EXTRACT(DOW FROM to_timestamp(ts))::INT AS dow,
-          EXTRACT(HOUR FROM to_timestamp(ts))::INT AS hour,
-          COUNT(*) AS flights
-        FROM flights
-        GROUP BY dow, hour
-        ORDER BY dow, hour;
-    """)
-    return jsonify(rows)
+    return jsonify(heatmap_rows(*arg_window()))
 
 
-# -------------------------------------------------------------------
 # /api/top_callsigns – aantal unieke vluchten per callsign (bubbel)
-# -------------------------------------------------------------------
 @app.get("/api/top_callsigns")
+@cached
 def top_callsigns():
-    rows = query(f"""
-        WITH ordered AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            LAG(ts) OVER (PARTITION BY callsign ORDER BY ts) AS prev_ts
-          FROM positions
-          WHERE callsign IS NOT NULL
-            AND callsign <> ''
-            AND {BUBBLE_SQL}
-        ),
-        flagged AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            CASE
-              WHEN prev_ts IS NULL THEN 1
-              WHEN ts - prev_ts > 3600 THEN 1
-              ELSE 0
-            END AS is_new_flight
-          FROM ordered
-        ),
-        segmented AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            SUM(is_new_flight) OVER (PARTITION BY callsign ORDER BY ts) AS flight_seq
-          FROM flagged
-        ),
-        flights AS (
-          SELECT DISTINCT ON (callsign, flight_seq)
-            callsign,
-            ts
-          FROM segmented
-          ORDER BY callsign, flight_seq, ts DESC
-        )
-        SELECT
-          callsign,
-          COUNT(*) AS flights
-        FROM flights
-        GROUP BY callsign
-        ORDER BY flights DESC
-        LIMIT 10;
-    """)
-    return jsonify(rows)
+    n = arg_limit(10)
+    offset = (arg_cursor(int) or (0,))[0]
+    if offset < 0:
+        abort(400, "invalid cursor")
+    rows = callsign_rows(*arg_window(), n + 1, offset)
+
+    next_cursor = None
+    if len(rows) > n:
+        rows = rows[:n]
+        next_cursor = (offset + n,)
+    return paginated(rows, next_cursor)
+
+
+# /api/hist_speed en /api/hist_altitude
+#
+# Zonder parameters: ruwe waarden (kts / ft) van unieke vluchten (bubbel),
+# gestreamd.
+# Met ?bin=<breedte> komen er tellingen per bin terug, optioneel met
+# min/max (bereik) en percentiles=50,90,99.
+def histogram_response(column):
+    width = arg_float("bin")
+    if width is None:
+        rows = segmentation.iter_values((column,), *arg_window())
+        return stream_json(r[column] for r in rows)
+    if width <= 0:
+        abort(400, "bin must be positive")
+
+    lo, hi = arg_range("min", "max")
+    percentiles = arg_percentiles()
+
+    fs = flight_set()
+    try:
+        result = segmentation.histogram(getattr(fs, column), width, lo, hi, percentiles)
+    except ValueError as e:
+        abort(400, str(e))
+    return jsonify(result)
 
 
-# -------------------------------------------------------------------
-# /api/hist_speed – ruwe snelheden (kts) van unieke vluchten (bubbel)
-# -------------------------------------------------------------------
 @app.get("/api/hist_speed")
+@cached
 def hist_speed():
-    rows = query(f"""
-        WITH ordered AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            LAG(ts) OVER (PARTITION BY callsign ORDER BY ts) AS prev_ts
-          FROM positions
-          WHERE callsign IS NOT NULL
-            AND callsign <> ''
-            AND {BUBBLE_SQL}
-        ),
-        flagged AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            CASE
-              WHEN prev_ts IS NULL THEN 1
-              WHEN ts - prev_ts > 3600 THEN 1
-              ELSE 0
-            END AS is_new_flight
-          FROM ordered
-        ),
-        segmented AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            SUM(is_new_flight) OVER (PARTITION BY callsign ORDER BY ts) AS flight_seq
-          FROM flagged
-        ),
-        flights AS (
-          SELECT DISTINCT ON (callsign, flight_seq)
-            gs_kts
-          FROM segmented
-          ORDER BY callsign, flight_seq, ts DESC
-        )
-        SELECT gs_kts
-        FROM flights
-        WHERE gs_kts IS NOT NULL;
-    """)
+    return histogram_response("gs_kts")
 
-    return jsonify([r["gs_kts"] for r in rows])
 
-
-# -------------------------------------------------------------------
-# /api/hist_altitude – ruwe hoogtes (ft) van unieke vluchten (bubbel)
-# -------------------------------------------------------------------
 @app.get("/api/hist_altitude")
+@cached
 def hist_altitude():
-    rows = query(f"""
-        WITH ordered AS (
-          SELECT
-            callsign,
-            ts,
-            alt_ft,
-            LAG(ts) OVER (PARTITION BY callsign ORDER BY ts) AS prev_ts
-          FROM positions
-          WHERE callsign IS NOT NULL
-            AND callsign <> ''
-            AND {BUBBLE_SQL}
-        ),
-        flagged AS (
-          SELECT
-            callsign,
-            ts,
-            alt_ft,
-            CASE
-              WHEN prev_ts IS NULL THEN 1
-              WHEN ts - prev_ts > 3600 THEN 1
-              ELSE 0
-            END AS is_new_flight
-          FROM ordered
-        ),
-        segmented AS (
-          SELECT
-            callsign,
-            ts,
-            alt_ft,
-            SUM(is_new_flight) OVER (PARTITION BY callsign ORDER BY ts) AS flight_seq
-          FROM flagged
-        ),
-        flights AS (
-          SELECT DISTINCT ON (callsign, flight_seq)
-            alt_ft
-          FROM segmented
-          ORDER BY callsign, flight_seq, ts DESC
-        )
-        SELECT alt_ft
-        FROM flights
-        WHERE alt_ft IS NOT NULL;
-    """)
+    return histogram_response("alt_ft")
 
-    return jsonify([r["alt_ft"] for r in rows])
 
-# -------------------------------------------------------------------
 # /api/scatter – speed vs altitude of unique flights (bubble)
-# -------------------------------------------------------------------
+#
+# Zonder mode: alle punten (gestreamd). mode=density geeft tellingen per cel
+# (gs_bin × alt_bin kts/ft, optioneel gs_min/gs_max/alt_min/alt_max),
+# mode=sample een reservoir-steekproef van max_points punten (standaard
+# SCATTER_MAX_POINTS, hooguit SCATTER_POINTS_LIMIT).
+SCATTER_GS_BIN = 20
+SCATTER_ALT_BIN = 1000
+SCATTER_MAX_POINTS = 2000
+SCATTER_POINTS_LIMIT = 10000
+
+
 @app.get("/api/scatter")
+@cached
 def scatter():
-    rows = query(f"""
-        WITH ordered AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            LAG(ts) OVER (PARTITION BY callsign ORDER BY ts) AS prev_ts
-          FROM positions
-          WHERE callsign IS NOT NULL
-            AND callsign <> ''
-            AND {BUBBLE_SQL}       -- only measurements inside 7.5 km bubble
-        ),
-        flagged AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            CASE
-              WHEN prev_ts IS NULL THEN 1
-              WHEN ts - prev_ts > 3600 THEN 1
-              ELSE 0
-            END AS is_new_flight
-          FROM ordered
-        ),
-        segmented AS (
-          SELECT
-            callsign,
-            ts,
-            gs_kts,
-            alt_ft,
-            SUM(is_new_flight) OVER (PARTITION BY callsign ORDER BY ts)
-              AS flight_seq
-          FROM flagged
-        ),
-        flights AS (
-          -- take last measurement inside bubble per unique flight
-          SELECT DISTINCT ON (callsign, flight_seq)
-            gs_kts,
-            alt_ft,
-            ts
-          FROM segmented
-          ORDER BY callsign, flight_seq, ts DESC
+    mode = request.args.get("mode")
+    if mode is None:
+        return stream_json(segmentation.iter_values(("gs_kts", "alt_ft"), *arg_window()))
+    if mode not in ("density", "sample"):
+        abort(400, "mode must be density or sample")
+
+    gs_range = arg_range("gs_min", "gs_max")
+    alt_range = arg_range("alt_min", "alt_max")
+    if mode == "sample":
+        max_points = arg_int(
+            "max_points", SCATTER_MAX_POINTS, minimum=1, maximum=SCATTER_POINTS_LIMIT
         )
-        SELECT gs_kts, alt_ft
-        FROM flights
-        WHERE gs_kts IS NOT NULL
-          AND alt_ft IS NOT NULL;
-    """)
+    fs = flight_set()
+    pairs = segmentation.scatter_pairs(fs.gs_kts, fs.alt_ft, gs_range, alt_range)
+
+    if mode == "sample":
+        return jsonify(segmentation.scatter_sample(pairs, max_points, arg_int("seed", 0)))
+
+    gs_bin = arg_float("gs_bin")
+    alt_bin = arg_float("alt_bin")
+    gs_bin = SCATTER_GS_BIN if gs_bin is None else gs_bin
+    alt_bin = SCATTER_ALT_BIN if alt_bin is None else alt_bin
+    if gs_bin <= 0 or alt_bin <= 0:
+        abort(400, "gs_bin and alt_bin must be positive")
+    try:
+        result = segmentation.scatter_density(pairs, gs_bin, alt_bin, gs_range, alt_range)
+    except ValueError as e:
+        abort(400, str(e))
+    return jsonify(result)
+
+
+# /api/dashboard – alle bovenstaande (behalve last10) in één response
+#
+# hist_speed, hist_altitude en scatter in begrensde vorm (vaste bins, zie
+# segmentation.distributions); de ruwe lijsten staan achter de links.
+@app.get("/api/dashboard")
+@cached
+def dashboard():
+    from_ts, to_ts = arg_window()
+    fs = segmentation.current(from_ts, to_ts)
+    if not rollups.covers(from_ts, to_ts):
+        out = segmentation.dashboard(fs)
+    else:
+        days = daily_rows(from_ts, to_ts)
+        out = dict({
+            "stats": stats_of(from_ts, to_ts, days),
+            "daily_counts": days,
+            "hourly_heatmap": heatmap_rows(from_ts, to_ts),
+            "top_callsigns": callsign_rows(from_ts, to_ts),
+        }, **segmentation.distributions(fs))
+
+    window = {k: v for k, v in request.args.items() if k in ("from", "to")}
+    query_string = "?" + urlencode(window) if window else ""
+    out["links"] = {
+        name: f"/api/{name}{query_string}"
+        for name in ("hist_speed", "hist_altitude", "scatter")
+    }
+    return jsonify(out)
+
+
+# -------------------------------------------------------------------
+# /api/tracks – routes van de 10 (limit) meest recente vluchten (volledige track)
+#
+# Optioneel: tolerance=<m> (Douglas-Peucker), max_points=<n> per track
+# (hooguit TRACK_POINTS_LIMIT) en format=points (standaard), arrays
+# (parallelle lijsten, ts in unix seconden) of polyline (Google encoded
+# polyline + ts/alt_ft-lijsten).
+# from/to selecteert vluchten die het venster overlappen.
+# -------------------------------------------------------------------
+TRACK_FORMATS = ("points", "arrays", "polyline")
+TRACK_POINTS_LIMIT = 5000
+
+TRACK_FLIGHTS_SQL = """
+    SELECT callsign, flight_seq, first_ts, last_ts
+    FROM flights
+    WHERE last_ts >= %(from_ts)s
+      AND first_ts < %(to_ts)s
+      {cursor}
+    ORDER BY last_ts DESC, callsign DESC, flight_seq DESC
+    LIMIT %(limit)s;
+"""
 
-    return jsonify([
-        {
-            "gs_kts": r["gs_kts"],
-            "alt_ft": r["alt_ft"]
-        }
-        for r in rows
-    ])
+TRACK_POINTS_SQL = """
+    SELECT
+      lf.n,
+      p.callsign,
+      p.ts,
+      p.lat,
+      p.lon,
+      p.alt_ft
+    FROM unnest(%(callsigns)s::TEXT[], %(first_ts)s::BIGINT[], %(last_ts)s::BIGINT[])
+      WITH ORDINALITY AS lf (callsign, first_ts, last_ts, n)
+    JOIN positions p
+      ON p.callsign = lf.callsign
+     AND p.callsign <> ''   -- laat idx_positions_callsign_ts toe
+     AND p.ts BETWEEN lf.first_ts AND lf.last_ts
+    ORDER BY lf.n, p.ts ASC;
+"""
 
 
-# -------------------------------------------------------------------
-# /api/tracks – routes van de 10 meest recente vluchten (volledige track)
-# -------------------------------------------------------------------
 @app.get("/api/tracks")
+@cached
 def tracks():
-    conn = get_conn()
-    cur = conn.cursor()
-
-    cur.execute("""
-        WITH ordered AS (
-          SELECT
-            callsign,
-            ts,
-            lat,
-            lon,
-            alt_ft,
-            LAG(ts) OVER (PARTITION BY callsign ORDER BY ts) AS prev_ts
-          FROM positions
-          WHERE callsign IS NOT NULL
-            AND callsign <> ''
-        ),
-        flagged AS (
-          SELECT
-            callsign,
-            ts,
-            lat,
-            lon,
-            alt_ft,
-            CASE
-              WHEN prev_ts IS NULL THEN 1
-              WHEN ts - prev_ts > 3600 THEN 1
-              ELSE 0
-            END AS is_new_flight
-          FROM ordered
-        ),
-        segmented AS (
-          SELECT
-            callsign,
-            ts,
-            lat,
-            lon,
-            alt_ft,
-            SUM(is_new_flight) OVER (PARTITION BY callsign ORDER BY ts) AS flight_seq
-          FROM flagged
-        ),
-        flights AS (
-          -- per vlucht: laatste tijdstip
-          SELECT DISTINCT ON (callsign, flight_seq)
-            callsign,
-            flight_seq,
-            ts AS last_ts
-          FROM segmented
-          ORDER BY callsign, flight_seq, ts DESC
-        ),
-        latest10 AS (
-          SELECT *
-          FROM flights
-          ORDER BY last_ts DESC
-          LIMIT 10
+    tolerance = arg_float("tolerance")
+    max_points = arg_int("max_points", minimum=2, maximum=TRACK_POINTS_LIMIT)
+    fmt = request.args.get("format", "points")
+    if fmt not in TRACK_FORMATS:
+        abort(400, "format must be one of " + ", ".join(TRACK_FORMATS))
+    from_ts, to_ts = arg_window()
+    limit = arg_limit(10)
+    before = arg_cursor(int, str, int)
+
+    params = {
+        "from_ts": 0 if from_ts is None else from_ts,
+        "to_ts": segmentation.TS_MAX if to_ts is None else to_ts,
+        "limit": limit + 1,
+    }
+    cursor_sql = ""
+    if before is not None:
+        cursor_sql = "AND (last_ts, callsign, flight_seq) < (%(c_ts)s, %(c_callsign)s, %(c_seq)s)"
+        params.update(c_ts=before[0], c_callsign=before[1], c_seq=before[2])
+
+    with db_cursor() as cur:
+        cur.execute(TRACK_FLIGHTS_SQL.format(cursor=cursor_sql), params)
+        flights = cur.fetchall()
+
+    next_cursor = None
+    if len(flights) > limit:
+        flights = flights[:limit]
+        last = flights[-1]
+        next_cursor = (last["last_ts"], last["callsign"], last["flight_seq"])
+
+    # punten per vlucht gestreamd; er staat steeds maar één track in het geheugen
+    rows = iter_rows(TRACK_POINTS_SQL, {
+        "callsigns": [f["callsign"] for f in flights],
+        "first_ts": [f["first_ts"] for f in flights],
+        "last_ts": [f["last_ts"] for f in flights],
+    })
+    out = (
+        track_json(list(pts), fmt, tolerance, max_points)
+        for _, pts in itertools.groupby(rows, key=lambda r: r["n"])
+    )
+    return paginated(stream_json(out), next_cursor)
+
+
+def track_json(pts, fmt, tolerance, max_points):
+    cs = pts[0]["callsign"]
+    lats = [r["lat"] for r in pts]
+    lons = [r["lon"] for r in pts]
+    keep = tracks_lib.simplify(lats, lons, tolerance, max_points)
+
+    if fmt == "points":
+        return {"callsign": cs, "points": [
+            {
+                "ts": datetime.fromtimestamp(pts[i]["ts"], tz=timezone.utc).isoformat(),
+                "lat": pts[i]["lat"],
+                "lon": pts[i]["lon"],
+                "alt_ft": pts[i]["alt_ft"],
+            }
+            for i in keep
+        ]}
+
+    track = {
+        "callsign": cs,
+        "ts": [pts[i]["ts"] for i in keep],
+        "alt_ft": [pts[i]["alt_ft"] for i in keep],
+    }
+    if fmt == "arrays":
+        track["lat"] = [lats[i] for i in keep]
+        track["lon"] = [lons[i] for i in keep]
+    else:
+        track["polyline"] = tracks_lib.encode_polyline(
+            [lats[i] for i in keep], [lons[i] for i in keep]
         )
+    return track
+
+
+# -------------------------------------------------------------------
+# /api/regions – de regio's van de collector met hun aantal unieke
+# vluchten (bubbel); /api/regions/<name>/stats – /api/stats voor één
+# regio. Beide met from/to. De overige endpoints tellen alle regio's samen.
+# -------------------------------------------------------------------
+REGIONS_SQL = """
+    SELECT
+      region,
+      COUNT(*) FILTER (
+        WHERE in_bubble AND bubble_ts >= %(from_ts)s AND bubble_ts < %(to_ts)s
+      )::INTEGER AS flights,
+      MAX(last_ts) AS last_ts
+    FROM flights
+    WHERE last_ts >= %(from_ts)s
+      AND first_ts < %(to_ts)s
+    GROUP BY region;
+"""
+
+REGION_DAYS_SQL = """
+    SELECT
+      to_char((to_timestamp(bubble_ts) AT TIME ZONE 'UTC')::DATE, 'YYYY-MM-DD') AS day,
+      COUNT(*)::INTEGER AS flights
+    FROM flights
+    WHERE in_bubble
+      AND region = %(region)s
+      AND bubble_ts >= %(from_ts)s
+      AND bubble_ts < %(to_ts)s
+    GROUP BY 1
+    ORDER BY 1;
+"""
+
+# periode uit de vluchten van de regio (positions heeft geen regio-index)
+REGION_PERIOD_SQL = """
+    SELECT MIN(first_ts) AS first_ts, MAX(last_ts) AS last_ts
+    FROM flights
+    WHERE region = %(region)s
+      AND last_ts >= %(from_ts)s
+      AND first_ts < %(to_ts)s;
+"""
+
+
+@app.get("/api/regions")
+@cached
+def region_list():
+    params = rollups.window_params(*arg_window())
+    with db_cursor() as cur:
+        cur.execute(REGIONS_SQL, params)
+        counts = {r["region"]: r for r in cur.fetchall()}
+
+    out = []
+    for region in collector.REGIONS:
+        row = counts.get(region.name)
+        out.append(dict(
+            region.as_dict(),
+            flights=row["flights"] if row else 0,
+            last_ts=segmentation.iso(row["last_ts"]) if row else None,
+        ))
+    return jsonify(out)
+
+
+@app.get("/api/regions/<name>/stats")
+@cached
+def region_stats(name):
+    if name not in {r.name for r in collector.REGIONS}:
+        abort(404, f"unknown region {name}")
+    from_ts, to_ts = arg_window()
+    params = dict(rollups.window_params(from_ts, to_ts), region=name)
+    with db_cursor() as cur:
+        cur.execute(REGION_DAYS_SQL, params)
+        days = {r["day"]: r["flights"] for r in cur.fetchall()}
+        cur.execute(REGION_PERIOD_SQL, params)
+        period = cur.fetchone()
+
+    first_ts, last_ts = period["first_ts"], period["last_ts"]
+    if first_ts is not None and from_ts is not None:
+        first_ts = max(first_ts, from_ts)
+    if last_ts is not None and to_ts is not None:
+        last_ts = min(last_ts, to_ts - 1)
+    return jsonify(dict(segmentation.stats_from_days(days, first_ts, last_ts), region=name))
+
+
+# -------------------------------------------------------------------
+# /api/export – positions of flights over from/to als bestand
+# (format=arrow, parquet of csv), gestreamd vanuit COPY; zie export.py
+# -------------------------------------------------------------------
+@app.get("/api/export")
+@cached
+def export_data():
+    kind = request.args.get("kind", "positions")
+    if kind not in export.EXPORTS:
+        abort(400, "kind must be one of " + ", ".join(sorted(export.EXPORTS)))
+    fmt = request.args.get("format") or export.default_format()
+    try:
+        export.check_format(fmt)
+    except ValueError as e:
+        abort(400, str(e))
+    from_ts, to_ts = arg_window()
+
+    name = export.filename(kind, from_ts, to_ts, fmt)
+    return Response(
+        export.iter_export(kind, from_ts, to_ts, fmt),
+        mimetype=export.MIMETYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    )
+
+
+# -------------------------------------------------------------------
+# /api/live – Server-Sent Events: na elke batch de toestellen in bereik en,
+# als ze veranderd zijn, last10 en stats (zonder venster). Elk "update"-
+# event bevat alleen de onderdelen die nieuw zijn voor deze client; het
+# eerste event alles. Zie live.py voor de fan-out.
+# -------------------------------------------------------------------
+LIVE_AIRCRAFT_SQL = """
+    SELECT icao, callsign, ts, lat, lon, alt_ft, gs_kts, dist_km, in_bubble, region
+    FROM live_positions
+    ORDER BY dist_km, icao;
+"""
+
+
+def live_state():
+    """De live-state, één keer per batch opgebouwd door de listener van live.py."""
+    aircraft = [dict(r, ts=segmentation.iso(r["ts"])) for r in query(LIVE_AIRCRAFT_SQL)]
+    return {
+        "aircraft": aircraft,
+        "last10": last10_page(10)[0],
+        "stats": stats_of(None, None),
+    }
+
+
+@app.get("/api/live")
+def live_stream():
+    live.start(live_state)
+    # vol: de EventSource probeert het na Retry-After opnieuw
+    if not live.broadcaster.subscribe(live.LIVE_MAX_SUBSCRIBERS):
+        return Response("too many live subscribers\n", status=503, mimetype="text/plain",
+                        headers={"Retry-After": str(int(live.LIVE_RETRY_S))})
+
+    def generate():
+        seen = {}
+        deadline = time.monotonic() + live.LIVE_MAX_S
+        yield f"retry: {int(live.LIVE_RETRY_S * 1000)}\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            parts = live.broadcaster.wait(seen, min(live.LIVE_KEEPALIVE_S, remaining))
+            if parts:
+                data = app.json.dumps(parts, separators=(",", ":"))
+                yield f"event: update\ndata: {data}\n\n"
+            else:
+                yield ": keepalive\n\n"
+
+    resp = Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # niet bufferen achter een proxy
+    })
+    # ook als de generator nooit start (client meteen weg)
+    resp.call_on_close(live.broadcaster.unsubscribe)
+    return resp
+
+
+# -------------------------------------------------------------------
+# /api/ingest_stats – tellers van de collector (dedup / onderdrukking, spool)
+# -------------------------------------------------------------------
+@app.get("/api/ingest_stats")
+def ingest_stats():
+    rows = query("""
         SELECT
-          s.callsign,
-          s.ts,
-          s.lat,
-          s.lon,
-          s.alt_ft
-        FROM segmented s
-        JOIN latest10 lf
-          ON s.callsign = lf.callsign
-         AND s.flight_seq = lf.flight_seq
-        ORDER BY lf.last_ts DESC, s.ts ASC;
+          data_version, updated_ts, rows_seen, rows_suppressed, rows_written,
+          replayed_batches, spool_dropped, replay_lag_s,
+          spool_pending_batches, spool_pending_bytes
+        FROM ingest_state
+        WHERE id = 1;
     """)
-
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    grouped = {}
-    for r in rows:
-        cs = r["callsign"]
-        grouped.setdefault(cs, []).append({
-            "ts": datetime.fromtimestamp(r["ts"], tz=timezone.utc).isoformat(),
-            "lat": r["lat"],
-            "lon": r["lon"],
-            "alt_ft": r["alt_ft"],
-        })
-
-    return jsonify([
-        {"callsign": cs, "points": pts}
-        for cs, pts in grouped.items()
-    ])
+    row = dict(rows[0]) if rows else {}
+    if row.get("updated_ts") is not None:
+        row["updated_ts"] = datetime.fromtimestamp(
+            row["updated_ts"], tz=timezone.utc
+        ).isoformat()
+    return jsonify(row)
 
 
 @app.get("/")
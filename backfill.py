@@ -0,0 +1,516 @@
+"""
+Historische import van gearchiveerde ADS-B-data in positions.
+
+    # adsb.fi /v3-snapshots (één JSON per poll, evt. gzipped) en/of readsb
+    # globe-history (traces/xx/trace_full_<hex>.json)
+    python backfill.py /data/adsbfi /data/globe_history/2024/05 --workers 8
+
+    # flights en rollups pas na de laatste import opnieuw opbouwen
+    python backfill.py /data/adsbfi --no-rebuild
+    python backfill.py --rebuild-only
+
+Bestanden gaan in chunks over een process pool; elke worker parset en
+filtert met dezelfde regels als de collector (ingest.position_rows:
+regio's, opslagstraal en bubbel; dedup.ChangeFilter). De rijen gaan per
+checkpoint met COPY naar een staging-tabel en van daaruit met ON CONFLICT
+(icao, ts) DO NOTHING naar positions, in dezelfde transactie als de
+bestandsnamen in backfill_files: een afgebroken import gaat bij een
+nieuwe run verder waar hij gebleven was.
+
+Daarna worden flights, de rollups en position_days opnieuw opgebouwd, voor
+zover de import ze raakt (zie rebuild); de rest, ook geschiedenis waarvan
+de posities door retentie al weg zijn, blijft staan. De hele run houdt de
+collector-lock vast: stop de collector zolang hij loopt.
+"""
+import argparse
+import gzip
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import psycopg2.extras
+
+import collector
+import ingest
+import partitions
+import rollups
+from db import POSITION_COLUMNS, copy_rows, get_conn
+from dedup import ChangeFilter
+from segmentation import FLIGHT_COLUMNS, FLIGHT_GAP_S
+
+FILE_SUFFIXES = (".json", ".json.gz")
+
+STAGING_SQL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS positions_staging
+    ON COMMIT DELETE ROWS
+    AS SELECT {', '.join(POSITION_COLUMNS)} FROM positions WITH NO DATA;
+"""
+
+MERGE_SQL = f"""
+    INSERT INTO positions ({', '.join(POSITION_COLUMNS)})
+    SELECT {', '.join(POSITION_COLUMNS)} FROM positions_staging
+    ON CONFLICT (icao, ts) DO NOTHING;
+"""
+
+CHECKPOINT_SQL = """
+    INSERT INTO backfill_files (path, rows, imported_ts) VALUES %s
+    ON CONFLICT (path) DO UPDATE SET
+      rows = EXCLUDED.rows,
+      imported_ts = EXCLUDED.imported_ts;
+"""
+
+
+# -------------------------------------------------------------------
+# Bestanden lezen en filteren (in de workers)
+# -------------------------------------------------------------------
+def iter_files(paths):
+    """Alle .json(.gz)-bestanden onder paths; per map op naam (= tijd) gesorteerd."""
+    for path in paths:
+        if os.path.isfile(path):
+            yield os.path.abspath(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(FILE_SUFFIXES):
+                    yield os.path.abspath(os.path.join(root, name))
+
+
+def chunked(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def load_json(path):
+    """readsb schrijft globe-history gzipped, ook zonder .gz-extensie."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+    return json.loads(data)
+
+
+def snapshot_records(data, path):
+    """
+    Een poll-snapshot: adsb.fi /v3 (ac, now in ms) of readsb aircraft.json
+    (aircraft, now in seconden). Zonder now telt de mtime van het bestand.
+    """
+    now = data.get("now")
+    if isinstance(now, (int, float)):
+        ts = int(now / 1000 if now > 1e11 else now)
+    else:
+        ts = int(os.path.getmtime(path))
+
+    # het adres staat hier in hex; ingest.icao() leest dat
+    return data.get("ac") or data.get("aircraft") or [], ts
+
+
+def trace_records(data):
+    """
+    Een readsb-trace: punten [dt, lat, lon, alt, gs, ...] t.o.v. timestamp.
+    De callsign staat alleen in het (optionele) details-object op index 8
+    en geldt tot er een nieuwe komt.
+    """
+    icao = data.get("icao")
+    base = data.get("timestamp") or 0
+    records = []
+    ts = []
+    callsign = None
+    for point in data["trace"]:
+        details = point[8] if len(point) > 8 else None
+        if isinstance(details, dict) and details.get("flight"):
+            callsign = details["flight"]
+        records.append({
+            "icao": icao,
+            "flight": callsign,
+            "lat": point[1],
+            "lon": point[2],
+            "alt_baro": point[3],
+            "gs": point[4],
+        })
+        ts.append(int(base + point[0]))
+    return records, ts
+
+
+def parse_chunk(paths):
+    """
+    Parse en filter een reeks bestanden. Geeft (rijen, [(pad, rijen)],
+    [(pad, fout)], gelezen metingen) terug.
+    """
+    change_filter = ChangeFilter()
+    rows = []
+    done = []
+    failed = []
+    read = 0
+    for path in paths:
+        try:
+            data = load_json(path)
+            if "trace" in data:
+                # één toestel in tijdvolgorde: meting voor meting filteren
+                records, ts = trace_records(data)
+                kept = []
+                for row in ingest.position_rows(records, collector.REGIONS, ts):
+                    if change_filter.filter([row]):
+                        change_filter.remember([row], row[2])
+                        kept.append(row)
+            else:
+                records, ts = snapshot_records(data, path)
+                kept = change_filter.filter(ingest.position_rows(records, collector.REGIONS, ts))
+                change_filter.remember(kept, ts)
+        except Exception as e:
+            failed.append((path, str(e)))
+            continue
+        read += len(records)
+        rows.extend(kept)
+        done.append((path, len(kept)))
+    return rows, done, failed, read
+
+
+# -------------------------------------------------------------------
+# Wegschrijven per checkpoint
+# -------------------------------------------------------------------
+class Importer:
+    """Verzamelt worker-resultaten en schrijft ze per checkpoint weg."""
+
+    def __init__(self, conn, checkpoint_rows):
+        self.conn = conn
+        self.checkpoint_rows = checkpoint_rows
+        self.rows = []
+        self.files = []
+        self.first_ts = None
+        self.last_ts = None
+        self.started = time.monotonic()
+        self.files_done = 0
+        self.files_skipped = 0
+        self.files_failed = 0
+        self.rows_read = 0
+        self.rows_written = 0
+
+    def add(self, result):
+        rows, files, failed, read = result
+        for path, error in failed:
+            print("Skipped", path, "-", error)
+        self.files_failed += len(failed)
+        self.rows_read += read
+        self.rows.extend(rows)
+        self.files.extend(files)
+        if len(self.rows) >= self.checkpoint_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.files:
+            return
+        now = int(time.time())
+        written = 0
+        if self.rows:
+            lo = min(r[2] for r in self.rows)
+            hi = max(r[2] for r in self.rows)
+            self.first_ts = lo if self.first_ts is None else min(self.first_ts, lo)
+            self.last_ts = hi if self.last_ts is None else max(self.last_ts, hi)
+            # partities in een eigen transactie: geen lock op positions tijdens de COPY
+            with self.conn.cursor() as cur:
+                partitions.ensure_partitions(cur, lo, hi)
+            self.conn.commit()
+
+        with self.conn.cursor() as cur:
+            if self.rows:
+                copy_rows(cur, "positions_staging", POSITION_COLUMNS, self.rows)
+                cur.execute(MERGE_SQL)
+                written = cur.rowcount
+            psycopg2.extras.execute_values(
+                cur, CHECKPOINT_SQL, [(path, n, now) for path, n in self.files]
+            )
+            cur.execute("""
+                UPDATE ingest_state SET data_version = data_version + 1
+                WHERE id = 1
+            """)
+        self.conn.commit()
+
+        self.files_done += len(self.files)
+        self.rows_written += written
+        elapsed = time.monotonic() - self.started
+        print(
+            f"Checkpoint: {self.files_done} files, {self.rows_read} read,"
+            f" {self.rows_written} written"
+            f" ({self.rows_read / max(elapsed, 1e-9) * 60:,.0f} rows/min)"
+        )
+        self.rows = []
+        self.files = []
+
+
+def import_files(conn, paths, workers, chunk_files, checkpoint_rows):
+    with conn.cursor() as cur:
+        cur.execute("SELECT path FROM backfill_files")
+        done = {r["path"] for r in cur.fetchall()}
+        cur.execute(STAGING_SQL)
+    conn.commit()
+
+    importer = Importer(conn, checkpoint_rows)
+
+    def todo():
+        for path in iter_files(paths):
+            if path in done:
+                importer.files_skipped += 1
+            else:
+                yield path
+
+    # spawn: workers erven geen open databaseverbindingen van dit proces
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        # begrensd aantal chunks onderweg: het geheugen groeit niet met de archiefgrootte
+        in_flight = deque()
+        for chunk in chunked(todo(), chunk_files):
+            in_flight.append(pool.submit(parse_chunk, chunk))
+            if len(in_flight) >= 2 * workers:
+                importer.add(in_flight.popleft().result())
+        while in_flight:
+            importer.add(in_flight.popleft().result())
+    importer.flush()
+
+    if importer.files_skipped:
+        print(f"Skipped {importer.files_skipped} files imported by an earlier run")
+    if importer.files_failed:
+        print(f"{importer.files_failed} files could not be read (retried on the next run)")
+    return importer
+
+
+# -------------------------------------------------------------------
+# flights, rollups en position_days opnieuw opbouwen
+#
+# Alleen wat de import raakt: per callsign met posities in [from_ts, to_ts]
+# het venster plus zijn vluchten die daar binnen FLIGHT_GAP_S van liggen.
+# Opeenvolgende vluchten van een callsign liggen verder dan de gap uit
+# elkaar, dus vluchten buiten dat bereik segmenteren precies hetzelfde en
+# blijven staan. Dat is ook nodig: na retentie zijn hun posities weg.
+# -------------------------------------------------------------------
+RANGES_SQL = f"""
+    CREATE TEMP TABLE rebuild_ranges ON COMMIT DROP AS
+    WITH imported AS (
+      SELECT DISTINCT callsign
+      FROM positions
+      WHERE ts >= %(from_ts)s
+        AND ts <= %(to_ts)s
+        AND callsign <> ''
+    ),
+    touched AS (
+      SELECT callsign, MIN(first_ts) AS lo, MAX(last_ts) AS hi
+      FROM flights
+      WHERE last_ts >= %(from_ts)s - {FLIGHT_GAP_S}
+        AND first_ts <= %(to_ts)s + {FLIGHT_GAP_S}
+      GROUP BY callsign
+    )
+    SELECT
+      i.callsign,
+      LEAST(%(from_ts)s, t.lo) AS lo,
+      GREATEST(%(to_ts)s, t.hi) AS hi,
+      0 AS base_seq
+    FROM imported i
+    LEFT JOIN touched t USING (callsign);
+"""
+
+# Vluchten die deels vóór de oudste bewaarde positie liggen (retentie)
+# kunnen niet uit positions worden herbouwd; die callsigns blijven staan.
+UNRETAINED_SQL = """
+    DELETE FROM rebuild_ranges
+    WHERE lo < (SELECT MIN(ts) FROM positions)
+    RETURNING callsign;
+"""
+
+DELETE_FLIGHTS_SQL = """
+    DELETE FROM flights f
+    USING rebuild_ranges r
+    WHERE f.callsign = r.callsign
+      AND f.last_ts >= r.lo
+      AND f.first_ts <= r.hi
+    RETURNING f.*;
+"""
+
+# nieuwe flight_seq's na de hoogste die de callsign nog heeft
+BASE_SEQ_SQL = """
+    UPDATE rebuild_ranges r SET base_seq = COALESCE(
+      (SELECT MAX(flight_seq) FROM flights f WHERE f.callsign = r.callsign), 0
+    );
+"""
+
+# collector.FLIGHTS_BACKFILL_SQL, maar per callsign over zijn bereik
+REBUILD_FLIGHTS_SQL = f"""
+    WITH ordered AS (
+      SELECT
+        p.callsign,
+        p.ts,
+        p.gs_kts,
+        p.alt_ft,
+        COALESCE(p.in_bubble, FALSE) AS in_bubble,
+        p.region,
+        LAG(p.ts) OVER (PARTITION BY p.callsign ORDER BY p.ts) AS prev_ts
+      FROM rebuild_ranges r
+      JOIN positions p
+        ON p.callsign = r.callsign
+       AND p.callsign <> ''
+       AND p.ts BETWEEN r.lo AND r.hi
+    ),
+    flagged AS (
+      SELECT
+        *,
+        CASE
+          WHEN prev_ts IS NULL THEN 1
+          WHEN ts - prev_ts > {FLIGHT_GAP_S} THEN 1
+          ELSE 0
+        END AS is_new_flight
+      FROM ordered
+    ),
+    segmented AS (
+      SELECT
+        *,
+        SUM(is_new_flight) OVER (PARTITION BY callsign ORDER BY ts) AS flight_seq
+      FROM flagged
+    ),
+    bubble_last AS (
+      SELECT DISTINCT ON (callsign, flight_seq)
+        callsign,
+        flight_seq,
+        ts,
+        gs_kts,
+        alt_ft,
+        region
+      FROM segmented
+      WHERE in_bubble
+      ORDER BY callsign, flight_seq, ts DESC
+    )
+    INSERT INTO flights (
+      callsign, flight_seq, first_ts, last_ts,
+      in_bubble, bubble_ts, gs_kts, alt_ft, points, region
+    )
+    SELECT
+      s.callsign,
+      r.base_seq + s.flight_seq,
+      MIN(s.ts),
+      MAX(s.ts),
+      b.ts IS NOT NULL,
+      b.ts,
+      b.gs_kts,
+      b.alt_ft,
+      COUNT(*),
+      COALESCE(b.region, (ARRAY_AGG(s.region ORDER BY s.ts DESC))[1])
+    FROM segmented s
+    JOIN rebuild_ranges r
+      ON r.callsign = s.callsign
+    LEFT JOIN bubble_last b
+      ON b.callsign = s.callsign
+     AND b.flight_seq = s.flight_seq
+    GROUP BY s.callsign, r.base_seq, s.flight_seq, b.ts, b.gs_kts, b.alt_ft, b.region;
+"""
+
+
+def rebuild(conn, first_ts=None, last_ts=None):
+    """
+    Bouw flights, de rollups en position_days opnieuw op voor wat
+    [first_ts, last_ts] raakt; zonder venster voor alle bewaarde posities.
+    Alleen met de collector-lock (zie main): de segmenter van een draaiende
+    collector zou anders naar vluchten verwijzen die hier opnieuw genummerd
+    worden.
+    """
+    started = time.monotonic()
+    now = int(time.time())
+    today = now - now % 86400
+    with conn.cursor() as cur:
+        if first_ts is None or last_ts is None:
+            cur.execute("SELECT MIN(ts) AS lo, MAX(ts) AS hi FROM positions")
+            row = cur.fetchone()
+            if row["lo"] is None:
+                print("Nothing to rebuild: positions is empty")
+                return True
+            first_ts, last_ts = row["lo"], row["hi"]
+
+        cur.execute(RANGES_SQL, {"from_ts": first_ts, "to_ts": last_ts})
+        cur.execute(UNRETAINED_SQL)
+        skipped = cur.rowcount
+        cur.execute(DELETE_FLIGHTS_SQL)
+        old = [{c: r[c] for c in FLIGHT_COLUMNS} for r in cur.fetchall()]
+        # alleen afgesloten vluchten staan in de rollups
+        rollups.remove_flights(cur, [f for f in old if f["closed"]])
+        cur.execute(BASE_SEQ_SQL)
+        cur.execute(REBUILD_FLIGHTS_SQL)
+        rebuilt = cur.rowcount
+        # herbouwde vluchten zijn open; wat buiten de gap valt gaat nu dicht
+        # en in de rollups
+        closed = collector.resume_flights(cur, now)
+
+        from_ts = first_ts - first_ts % 86400
+        to_ts = min(last_ts - last_ts % 86400 + 86400, today)
+        days = partitions.summarize_days(cur, from_ts, to_ts) if to_ts > from_ts else 0
+        cur.execute("""
+            UPDATE ingest_state SET data_version = data_version + 1
+            WHERE id = 1
+        """)
+    conn.commit()
+
+    if skipped:
+        print(f"Left {skipped} callsigns alone: their flights reach past retained positions")
+    print(
+        f"Rebuilt {len(old)} -> {rebuilt} flights ({len(closed)} closed,"
+        f" {len(collector.segmenter.open)} open) and {days} position days"
+        f" in {time.monotonic() - started:.1f} s"
+    )
+    return True
+
+
+def take_collector_lock(conn):
+    """
+    De collector-lock voor deze sessie (zolang conn open is). Zonder lock
+    zou een draaiende collector tegelijk schrijven en segmenteren.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_try_advisory_lock(%s) AS locked", (collector.COLLECTOR_LOCK_ID,))
+        locked = cur.fetchone()["locked"]
+    conn.commit()
+    return locked
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("paths", nargs="*", help="bestanden of mappen met snapshots/traces")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-files", type=int, default=32,
+                        help="bestanden per taak voor een worker")
+    parser.add_argument("--checkpoint-rows", type=int, default=200_000,
+                        help="rijen per COPY-transactie")
+    parser.add_argument("--no-rebuild", action="store_true",
+                        help="flights en rollups niet opnieuw opbouwen")
+    parser.add_argument("--rebuild-only", action="store_true",
+                        help="niets importeren, alleen opnieuw opbouwen (alle bewaarde posities)")
+    args = parser.parse_args(argv)
+    if not args.paths and not args.rebuild_only:
+        parser.error("no paths given")
+
+    conn = get_conn()
+    try:
+        if not take_collector_lock(conn):
+            print("Collector is running: stop it before importing or rebuilding")
+            return 1
+        collector.init_db()
+        if args.rebuild_only:
+            return 0 if rebuild(conn) else 1
+
+        importer = import_files(
+            conn, args.paths, args.workers, args.chunk_files, args.checkpoint_rows
+        )
+        if not args.no_rebuild and importer.rows_written:
+            if not rebuild(conn, importer.first_ts, importer.last_ts):
+                return 1
+        return 1 if importer.files_failed else 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
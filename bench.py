@@ -0,0 +1,328 @@
+"""
+Reproduceerbare benchmark voor alle /api/*-endpoints.
+
+    # synthetische data genereren in een lokale (!) database
+    python bench.py generate --rows 1M --days 90 --reset
+
+    # alle endpoints draaien via de Flask test client, of tegen een
+    # lokaal draaiende gunicorn met --url http://127.0.0.1:8000
+    python bench.py run --requests 30 --out bench.json
+
+    # vergelijken met een eerdere run; exit-code 1 bij regressie
+    python bench.py run --compare baseline.json --threshold 1.25
+
+Per endpoint: p50/p95/p99-latency (ms), payload-grootte en het aantal door
+PostgreSQL gelezen tuples per request (uit pg_stat_user_tables; benadering,
+want de statistieken van andere sessies tellen mee).
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+# de benchmark mag nooit zelf gaan pollen
+os.environ.setdefault("COLLECTOR_IN_WEB", "0")
+
+import collector  # noqa: E402
+import partitions  # noqa: E402
+import rollups  # noqa: E402
+from db import POSITION_COLUMNS, copy_rows, cursor  # noqa: E402
+
+# endpoints die streamen of geen query-laag meten
+SKIP_ENDPOINTS = {"/api/ingest_stats", "/api/export", "/api/live"}
+
+# callsign-pool: lijnvluchten, vracht, GA en helikopters (traumaheli/politie)
+CALLSIGN_PREFIXES = ["KLM", "TRA", "EZY", "RYR", "DLH", "MPH", "PH", "LIFE", "ZXP"]
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    factor = {"K": 1_000, "M": 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip("KM")) * factor)
+
+
+# -------------------------------------------------------------------
+# Synthetische data
+# -------------------------------------------------------------------
+def synthetic_flights(n_rows, days, now, seed):
+    """
+    Genereer rechte passages door het opslaggebied (TRACK_RADIUS_KM) met
+    een meting per 10 s, tot er n_rows rijen zijn. Yieldt tuples in
+    POSITION_COLUMNS-volgorde.
+    """
+    rng = random.Random(seed)
+    callsigns = [
+        f"{rng.choice(CALLSIGN_PREFIXES)}{rng.randint(1, 9999)}" for _ in range(2000)
+    ]
+    km_per_deg_lat = 111.195
+    km_per_deg_lon = km_per_deg_lat * math.cos(math.radians(collector.ARNHEM_LAT))
+    radius = collector.TRACK_RADIUS_KM
+    start = now - days * 86400
+
+    emitted = 0
+    flight_no = 0
+    while emitted < n_rows:
+        flight_no += 1
+        icao = f"{flight_no:06x}"
+        callsign = rng.choice(callsigns)
+        heli = callsign.startswith(("LIFE", "ZXP"))
+        gs = rng.uniform(60, 140) if heli else rng.uniform(120, 480)
+        alt = rng.uniform(300, 2500) if heli else rng.uniform(1500, 39000)
+
+        # in- en uittredepunt op de rand, met willekeurige offset van het centrum
+        bearing = rng.uniform(0, 2 * math.pi)
+        offset = rng.uniform(-0.9, 0.9) * radius
+        half = math.sqrt(max(radius ** 2 - offset ** 2, 1.0))
+        x0 = offset * math.cos(bearing) - half * math.sin(bearing)
+        y0 = offset * math.sin(bearing) + half * math.cos(bearing)
+        x1 = offset * math.cos(bearing) + half * math.sin(bearing)
+        y1 = offset * math.sin(bearing) - half * math.cos(bearing)
+
+        speed_kms = gs * 1.852 / 3600
+        steps = max(int(2 * half / speed_kms / 10), 1)
+        ts0 = int(rng.uniform(start, now))
+        for i in range(steps + 1):
+            if emitted >= n_rows:
+                return
+            f = i / steps
+            x = x0 + (x1 - x0) * f
+            y = y0 + (y1 - y0) * f
+            dist = math.hypot(x, y)
+            yield (
+                icao,
+                callsign,
+                ts0 + i * 10,
+                collector.ARNHEM_LAT + y / km_per_deg_lat,
+                collector.ARNHEM_LON + x / km_per_deg_lon,
+                round(alt + rng.uniform(-50, 50)),
+                round(gs + rng.uniform(-5, 5), 1),
+                round(dist, 3),
+                dist <= collector.BUBBLE_RADIUS_KM,
+                collector.DEFAULT_REGION.name,
+            )
+            emitted += 1
+
+
+def ensure_local(force):
+    url = urlparse(os.environ["DATABASE_URL"])
+    host = url.hostname or "localhost"
+    if host not in ("localhost", "127.0.0.1", "::1") and not force:
+        sys.exit(f"refusing to generate data on non-local host {host!r} (use --force)")
+
+
+def generate(args):
+    ensure_local(args.force)
+    n_rows = parse_size(args.rows)
+    now = int(time.time())
+
+    collector.init_db()
+    with cursor() as cur:
+        if args.reset:
+            cur.execute("TRUNCATE positions, flights, position_days, " + rollups.TABLES)
+        partitions.ensure_partitions(cur, now - args.days * 86400, now)
+
+    started = time.monotonic()
+    with cursor() as cur:
+        copy_rows(
+            cur,
+            "positions",
+            POSITION_COLUMNS,
+            synthetic_flights(n_rows, args.days, now, args.seed),
+        )
+    print(f"Loaded {n_rows} rows in {time.monotonic() - started:.1f} s")
+
+    # flights en rollups opnieuw opbouwen zoals na een migratie
+    with cursor() as cur:
+        cur.execute("TRUNCATE flights, position_days, " + rollups.TABLES)
+    collector.init_db()
+    with cursor() as cur:
+        collector.resume_flights(cur, int(time.time()))
+        cur.execute("ANALYZE")
+    print(f"Done in {time.monotonic() - started:.1f} s")
+
+
+# -------------------------------------------------------------------
+# Endpoints draaien
+# -------------------------------------------------------------------
+def discover_endpoints(flask_app):
+    paths = []
+    for rule in flask_app.url_map.iter_rules():
+        path = str(rule)
+        if (path.startswith("/api/") and "GET" in rule.methods
+                and not rule.arguments and path not in SKIP_ENDPOINTS):
+            paths.append(path)
+    return sorted(paths)
+
+
+def tuples_read():
+    """Totaal gelezen tuples over alle tabellen (seq + index)."""
+    with cursor() as cur:
+        cur.execute("SELECT pg_stat_clear_snapshot()")
+        cur.execute("""
+            SELECT COALESCE(SUM(COALESCE(seq_tup_read, 0) + COALESCE(idx_tup_fetch, 0)), 0)
+              AS n
+            FROM pg_stat_user_tables;
+        """)
+        return int(cur.fetchone()["n"])
+
+
+def percentile(values, p):
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo, hi = math.floor(k), math.ceil(k)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def make_client(args):
+    if args.url:
+        import requests
+        session = requests.Session()
+
+        def fetch(path):
+            r = session.get(args.url.rstrip("/") + path, timeout=300)
+            return r.status_code, r.content
+        import app as flask_app_module
+        return fetch, flask_app_module.app
+
+    import app as flask_app_module
+    import segmentation
+    from cache import response_cache
+    client = flask_app_module.app.test_client()
+
+    def fetch(path):
+        if not args.warm:
+            # meet de query-laag, niet de cache of de gedeelde FlightSet
+            response_cache.clear()
+            segmentation.reset()
+        r = client.get(path)
+        return r.status_code, r.get_data()
+    return fetch, flask_app_module.app
+
+
+def run(args):
+    fetch, flask_app = make_client(args)
+    endpoints = args.endpoints or discover_endpoints(flask_app)
+
+    with cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS n FROM positions")
+        n_positions = cur.fetchone()["n"]
+        cur.execute("SELECT COUNT(*) AS n FROM flights")
+        n_flights = cur.fetchone()["n"]
+        cur.execute("SHOW server_version")
+        server_version = cur.fetchone()["server_version"]
+
+    results = {}
+    for path in endpoints:
+        for _ in range(args.warmup):
+            fetch(path)
+        time.sleep(1.1)  # laat backends hun statistieken flushen
+        before = tuples_read()
+
+        latencies = []
+        size = 0
+        status = None
+        for _ in range(args.requests):
+            t0 = time.perf_counter()
+            status, body = fetch(path)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            size = len(body)
+
+        time.sleep(1.1)
+        scanned = tuples_read() - before
+        results[path] = {
+            "status": status,
+            "requests": args.requests,
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "mean_ms": round(statistics.mean(latencies), 2),
+            "payload_bytes": size,
+            "rows_scanned_per_request": round(scanned / args.requests),
+        }
+        r = results[path]
+        print(f"{path:28s} p50 {r['p50_ms']:9.2f}  p95 {r['p95_ms']:9.2f}  "
+              f"p99 {r['p99_ms']:9.2f} ms  {size:>10d} B  "
+              f"{r['rows_scanned_per_request']:>10d} rows")
+
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    report = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "commit": commit,
+            "mode": "http" if args.url else "test_client",
+            "cache": "warm" if args.warm else "cold",
+            "positions": n_positions,
+            "flights": n_flights,
+            "server_version": server_version,
+        },
+        "endpoints": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Wrote", args.out)
+
+    if args.compare:
+        return compare(report, args.compare, args.threshold)
+    return 0
+
+
+def compare(report, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["endpoints"]
+    regressions = 0
+    for path, r in report["endpoints"].items():
+        old = baseline.get(path)
+        if not old or not old["p95_ms"]:
+            continue
+        ratio = r["p95_ms"] / old["p95_ms"]
+        if ratio > threshold:
+            regressions += 1
+            print(f"REGRESSION {path}: p95 {old['p95_ms']} -> {r['p95_ms']} ms ({ratio:.2f}x)")
+    return 1 if regressions else 0
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    g = sub.add_parser("generate", help="synthetische posities laden")
+    g.add_argument("--rows", default="1M", help="aantal rijen, bv. 1M, 10M, 50M")
+    g.add_argument("--days", type=int, default=90)
+    g.add_argument("--seed", type=int, default=1)
+    g.add_argument("--reset", action="store_true", help="eerst alle data wissen")
+    g.add_argument("--force", action="store_true", help="ook op een niet-lokale host")
+
+    r = sub.add_parser("run", help="endpoints benchmarken")
+    r.add_argument("--requests", type=int, default=20)
+    r.add_argument("--warmup", type=int, default=2)
+    r.add_argument("--url", help="gunicorn/HTTP-basis-URL i.p.v. de test client")
+    r.add_argument("--warm", action="store_true", help="response-cache en FlightSet niet legen")
+    r.add_argument("--endpoints", nargs="*", help="alleen deze paden")
+    r.add_argument("--out", help="JSON-rapport schrijven naar dit pad")
+    r.add_argument("--compare", help="eerder JSON-rapport als baseline")
+    r.add_argument("--threshold", type=float, default=1.25,
+                   help="toegestane p95-verslechtering (factor)")
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        generate(args)
+        return 0
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
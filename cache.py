@@ -0,0 +1,139 @@
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import psycopg2
+from flask import Response, make_response, request
+
+from db import cursor as db_cursor
+
+# In-process cache voor de analytics-endpoints.
+# Entries horen bij een data-versie. De collector verhoogt die versie in
+# ingest_state na elke batch; elke worker leest hem hooguit eens per
+# CACHE_VERSION_POLL_S seconden, waarna oude entries niet meer geraakt worden.
+CACHE_TTL_S = float(os.environ.get("CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "256"))
+CACHE_VERSION_POLL_S = float(os.environ.get("CACHE_VERSION_POLL", "2"))
+
+_version = 0
+_modified = datetime.now(timezone.utc).replace(microsecond=0)
+_next_poll = 0.0
+_version_lock = threading.Lock()
+
+
+def bump_data_version():
+    """Aanroepen na een opgeslagen batch: lees de versie bij de volgende request opnieuw."""
+    global _next_poll
+    with _version_lock:
+        _next_poll = 0.0
+
+
+def data_version():
+    """(versie, tijdstip van laatste batch) zoals vastgelegd in ingest_state."""
+    global _version, _modified, _next_poll
+    with _version_lock:
+        if time.monotonic() < _next_poll:
+            return _version, _modified
+        # andere threads gebruiken de huidige versie zolang wij hem ophalen
+        _next_poll = time.monotonic() + CACHE_VERSION_POLL_S
+
+    try:
+        with db_cursor() as cur:
+            cur.execute("SELECT data_version, updated_ts FROM ingest_state WHERE id = 1")
+            row = cur.fetchone()
+    except psycopg2.Error as e:
+        print("Cache version error:", e)
+        row = None
+
+    with _version_lock:
+        if row is not None:
+            _version = row["data_version"]
+            if row["updated_ts"] is not None:
+                _modified = datetime.fromtimestamp(row["updated_ts"], tz=timezone.utc)
+        return _version, _modified
+
+
+class ResponseCache:
+    """LRU-cache met TTL; een entry telt alleen voor zijn eigen data-versie."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_s=CACHE_TTL_S):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()  # key -> (version, expires, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl_s, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+# response-headers die mee in de cache gaan (paginering)
+CACHED_HEADERS = ("Link",)
+
+
+def cached(view):
+    """
+    Decorator voor GET-endpoints: cachet de response per pad + query-
+    parameters en zet ETag/Last-Modified, zodat een herhaalde request
+    tussen twee batches een 304 krijgt.
+
+    De ETag is een hash van de body, zodat alle gunicorn-workers dezelfde
+    ETag geven voor dezelfde data. Gestreamde responses worden niet gebufferd
+    en dus ook niet gecachet; die krijgen een zwakke ETag op basis van de
+    data-versie en de request.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        version, modified = data_version()
+
+        entry = response_cache.get(key, version)
+        if entry is None:
+            resp = make_response(view(*args, **kwargs))
+            if resp.status_code != 200:
+                return resp
+            if resp.is_streamed:
+                tag = hashlib.sha1(repr((version, key)).encode()).hexdigest()
+                resp.set_etag(tag, weak=True)
+                resp.last_modified = modified
+                resp.cache_control.no_cache = True
+                return resp.make_conditional(request)
+            body = resp.get_data()
+            headers = [(h, resp.headers[h]) for h in CACHED_HEADERS if h in resp.headers]
+            entry = (body, resp.mimetype, hashlib.sha1(body).hexdigest(), headers)
+            response_cache.put(key, version, entry)
+
+        body, mimetype, etag, headers = entry
+        resp = Response(body, mimetype=mimetype, headers=headers)
+        resp.set_etag(etag)
+        resp.last_modified = modified
+        resp.cache_control.no_cache = True
+        return resp.make_conditional(request)
+
+    return wrapper
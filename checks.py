@@ -0,0 +1,136 @@
+"""
+EXPLAIN-controle voor de indexstrategie op positions.
+
+    python checks.py [--analyze]
+
+Controleert dat de segmentatie-window (PARTITION BY callsign ORDER BY ts)
+zonder Sort-node draait, d.w.z. dat idx_positions_callsign_ts de volgorde
+levert, dat de track-lookup per vlucht die index gebruikt en dat een
+tijdvenster (?from=) via idx_flights_bubble_ts in de query terechtkomt. Exit-code 1
+als een check faalt. Op een heel kleine tabel kiest de planner soms toch
+een seq scan + sort; draai dan eerst met --analyze op representatieve data.
+"""
+import sys
+import time
+
+import segmentation
+from db import cursor
+
+SEGMENT_WINDOW_SQL = """
+    SELECT
+      callsign,
+      ts,
+      gs_kts,
+      alt_ft,
+      LAG(ts) OVER (PARTITION BY callsign ORDER BY ts) AS prev_ts
+    FROM positions
+    WHERE callsign <> ''
+"""
+
+TRACK_LOOKUP_SQL = """
+    SELECT ts, lat, lon, alt_ft
+    FROM positions
+    WHERE callsign = %(callsign)s
+      AND callsign <> ''
+      AND ts BETWEEN %(first_ts)s AND %(last_ts)s
+    ORDER BY ts
+"""
+
+INDEX_NAME = "idx_positions_callsign_ts"
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(cur, sql, params=None):
+    cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    return cur.fetchone()["QUERY PLAN"][0]["Plan"]
+
+
+def index_names(cur, index_name=INDEX_NAME):
+    """De gepartitioneerde index plus de indexen die hij per partitie heeft."""
+    cur.execute("""
+        SELECT c.relname AS name
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s);
+    """, (index_name,))
+    return {index_name} | {r["name"] for r in cur.fetchall()}
+
+
+def uses_index(cur, plan, index_name=INDEX_NAME):
+    names = index_names(cur, index_name)
+    return any(n.get("Index Name") in names for n in plan_nodes(plan))
+
+
+def check_segment_window(cur):
+    plan = explain(cur, SEGMENT_WINDOW_SQL)
+    windows = [n for n in plan_nodes(plan) if n["Node Type"] == "WindowAgg"]
+    sorted_input = any(
+        n["Node Type"] in ("Sort", "Incremental Sort")
+        for w in windows
+        for n in plan_nodes(w)
+    )
+    return bool(windows) and not sorted_input and uses_index(cur, plan), plan
+
+
+def check_track_lookup(cur):
+    cur.execute("""
+        SELECT callsign, first_ts, last_ts
+        FROM flights
+        ORDER BY last_ts DESC
+        LIMIT 1;
+    """)
+    flight = cur.fetchone() or {"callsign": "X", "first_ts": 0, "last_ts": 0}
+    plan = explain(cur, TRACK_LOOKUP_SQL, dict(flight))
+    # een korte Sort boven een bitmap scan is prima; het gaat om de index
+    return uses_index(cur, plan), plan
+
+
+def check_windowed_flights(cur):
+    now = int(time.time())
+    plan = explain(cur, segmentation.FLIGHTS_SQL, {
+        "from_ts": now - 7 * 86400,
+        "to_ts": segmentation.TS_MAX,
+    })
+    return uses_index(cur, plan, "idx_flights_bubble_ts"), plan
+
+
+CHECKS = [
+    ("segmentation window sorted by index", check_segment_window),
+    ("track lookup uses index", check_track_lookup),
+    ("7-day flight set uses idx_flights_bubble_ts", check_windowed_flights),
+]
+
+
+def describe(plan, depth=0):
+    line = "  " * depth + plan["Node Type"]
+    if plan.get("Index Name"):
+        line += f" using {plan['Index Name']}"
+    elif plan.get("Relation Name"):
+        line += f" on {plan['Relation Name']}"
+    lines = [line]
+    for child in plan.get("Plans", []):
+        lines.extend(describe(child, depth + 1))
+    return lines
+
+
+def main(argv):
+    failed = 0
+    with cursor() as cur:
+        if "--analyze" in argv:
+            cur.execute("ANALYZE positions")
+        for name, check in CHECKS:
+            ok, plan = check(cur)
+            print(("OK   " if ok else "FAIL ") + name)
+            if not ok:
+                failed += 1
+                print("\n".join("     " + line for line in describe(plan)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
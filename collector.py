@@ -1,80 +1,790 @@
 import os
+import queue
+import random
+import threading
 import time
 import math
 import requests
+import psycopg2
+import psycopg2.extras
+import psycopg2.pool
 from datetime import datetime, timezone
-from db import get_conn
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
 
+from cache import bump_data_version
+from db import POSITION_COLUMNS, copy_rows, cursor, get_conn, insert_positions
+from dedup import ChangeFilter
+from live import LIVE_CHANNEL
+from segmentation import FLIGHT_COLUMNS, StreamingSegmenter
+from spool import Spool
+import ingest
+import partitions
+import regions
+import rollups
+
+# Arnhem config (de standaardregio, en de regio van rijen van vóór REGIONS)
 ARNHEM_LAT = 51.9851
 ARNHEM_LON = 5.8987
-BUBBLE_RADIUS_KM = 5.0
-ADSB_URL = "https://opendata.adsb.fi/api/v3/lat/51.9851/lon/5.8987/dist/3"
-
-def haversine_km(lat1, lon1, lat2, lon2):
-    R = 6371.0
-    import math
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+# Statistieken-bubbel (km)
+BUBBLE_RADIUS_KM = 7.5
+
+# Opslag-bereik voor tracks (km) – optie C
+TRACK_RADIUS_KM = 20.0
+
+# dist is in NM: 10 NM ≈ 18.5 km, het TRACK_RADIUS_KM-filter doet de rest.
+# Met ADSB_URL kan er bv. een lokale stub-server voor in de plaats.
+DEFAULT_REGION = regions.Region(
+    "arnhem", ARNHEM_LAT, ARNHEM_LON,
+    fetch_nm=10,
+    track_km=TRACK_RADIUS_KM,
+    bubble_km=BUBBLE_RADIUS_KM,
+    url=os.environ.get("ADSB_URL"),
+)
+
+# Meerdere steden tegelijk: zie regions.py
+REGIONS = (
+    regions.parse(os.environ["REGIONS"]) if os.environ.get("REGIONS") else [DEFAULT_REGION]
+)
+
+POLL_INTERVAL_S = float(os.environ.get("POLL_INTERVAL_S", "10"))
+FETCH_TIMEOUT_S = float(os.environ.get("FETCH_TIMEOUT_S", "10"))
+
+# Na fouten (429, 5xx, timeouts) exponentieel langer wachten, tot dit maximum;
+# een Retry-After van de server gaat altijd voor als die langer is.
+BACKOFF_MAX_S = float(os.environ.get("BACKOFF_MAX_S", "300"))
+
+# Batches tussen poller en writer; loopt hij vol (database te traag of
+# weg), dan valt de oudste batch af in plaats van dat het pollen stokt.
+WRITE_QUEUE_SIZE = int(os.environ.get("WRITE_QUEUE_SIZE", "30"))
+
+# Is de database weg, dan gaan batches naar de lokale spool (spool.py);
+# die wordt elke SPOOL_RETRY_S in stukken van SPOOL_REPLAY_BATCHES batches
+# (één transactie per stuk) teruggespeeld.
+SPOOL_RETRY_S = float(os.environ.get("SPOOL_RETRY_S", "30"))
+SPOOL_REPLAY_BATCHES = int(os.environ.get("SPOOL_REPLAY_BATCHES", "100"))
+
+# Alleen deze fouten betekenen "database (even) weg" en gaan naar de spool;
+# een fout in de data zelf zou bij elke replay opnieuw optreden.
+DB_UNREACHABLE = (psycopg2.OperationalError, psycopg2.InterfaceError, psycopg2.pool.PoolError)
+
+# Er mag maar één collector tegelijk schrijven (over alle processen heen);
+# dat regelen we met een PostgreSQL advisory lock op deze sleutel.
+COLLECTOR_LOCK_ID = 0x41524E48  # "ARNH"
+LEADER_RETRY_S = 30
+
+# per-ICAO laatst opgeslagen meting (alleen in het collector-proces)
+change_filter = ChangeFilter()
+
+# open vluchten per callsign (alleen in het collector-proces)
+segmenter = StreamingSegmenter()
+
+# aantal rijen in live_positions (None: onbekend, bv. na een herstart)
+_live_rows = None
+
+_thread_started = False
+_thread_lock = threading.Lock()
+
+
+# -------------------------------------------------------------------
+# Bubbel-filter
+#
+# Elke meting krijgt bij ingest dist_km en in_bubble (ingest.position_rows), zodat queries
+# gewoon op de kolom in_bubble filteren (flights.in_bubble wordt daaruit
+# afgeleid). De SQL-varianten hieronder zijn alleen nodig om oude rijen bij
+# te werken; die zijn allemaal van de standaardregio (Arnhem).
+# -------------------------------------------------------------------
+DISTANCE_SQL = f"""
+  (6371 * 2 * ASIN(
+     SQRT(
+       POWER(SIN(RADIANS(lat - {ARNHEM_LAT})/2), 2) +
+       COS(RADIANS({ARNHEM_LAT})) * COS(RADIANS(lat)) *
+       POWER(SIN(RADIANS(lon - {ARNHEM_LON})/2), 2)
+     )
+   ))
+"""
+
+# Vult dist_km/in_bubble voor rijen van vóór deze kolommen
+DISTANCE_BACKFILL_SQL = f"""
+    UPDATE positions SET
+      dist_km = {DISTANCE_SQL},
+      in_bubble = {DISTANCE_SQL} <= {BUBBLE_RADIUS_KM}
+    WHERE dist_km IS NULL
+      AND lat IS NOT NULL
+      AND lon IS NOT NULL;
+"""
+
+
+# -------------------------------------------------------------------
+# flights-tabel: één rij per unieke vlucht (callsign, flight_seq)
+#
+# Een callsign krijgt een nieuwe flight_seq zodra hij langer dan 3600 s
+# niet gezien is. bubble_ts/gs_kts/alt_ft zijn de laatste meting binnen
+# de bubbel; in_bubble geeft aan of de vlucht de bubbel ooit raakte.
+# region is de regio van bubble_ts, of zonder bubbel van de laatste meting.
+#
+# De segmentatie zelf gebeurt in het geheugen (segmentation.
+# StreamingSegmenter); de upsert schrijft alleen de nieuwe toestand weg.
+# Een nieuwe vlucht (flight_seq None) krijgt MAX + 1.
+# -------------------------------------------------------------------
+FLIGHT_UPSERT_SQL = """
+    INSERT INTO flights AS f (
+      callsign, flight_seq, first_ts, last_ts,
+      in_bubble, bubble_ts, gs_kts, alt_ft, points, closed, region
+    )
+    SELECT
+      b.callsign,
+      COALESCE(
+        b.flight_seq,
+        (SELECT COALESCE(MAX(flight_seq), 0) + 1 FROM flights WHERE callsign = b.callsign)
+      ),
+      b.first_ts,
+      b.last_ts,
+      b.in_bubble,
+      b.bubble_ts,
+      b.gs_kts,
+      b.alt_ft,
+      b.points,
+      b.closed,
+      b.region
+    FROM (VALUES %s) AS b (
+      callsign, flight_seq, first_ts, last_ts,
+      in_bubble, bubble_ts, gs_kts, alt_ft, points, closed, region
+    )
+    ON CONFLICT (callsign, flight_seq) DO UPDATE SET
+      last_ts = EXCLUDED.last_ts,
+      in_bubble = EXCLUDED.in_bubble,
+      bubble_ts = EXCLUDED.bubble_ts,
+      gs_kts = EXCLUDED.gs_kts,
+      alt_ft = EXCLUDED.alt_ft,
+      points = EXCLUDED.points,
+      closed = EXCLUDED.closed,
+      region = EXCLUDED.region
+    RETURNING callsign, flight_seq;
+"""
+
+# expliciete types: anders wordt een kolom met alleen NULLs als text gezien
+FLIGHT_UPSERT_TEMPLATE = (
+    "(%s, %s::INTEGER, %s::BIGINT, %s::BIGINT, %s::BOOLEAN, %s::BIGINT,"
+    " %s::DOUBLE PRECISION, %s::DOUBLE PRECISION, %s::INTEGER, %s::BOOLEAN, %s)"
+)
+
+# Eenmalige opbouw vanuit bestaande positions (alleen als flights leeg is)
+FLIGHTS_BACKFILL_SQL = """
+    WITH ordered AS (
+      SELECT
+        callsign,
+        ts,
+        gs_kts,
+        alt_ft,
+        COALESCE(in_bubble, FALSE) AS in_bubble,
+        region,
+        LAG(ts) OVER (PARTITION BY callsign ORDER BY ts) AS prev_ts
+      FROM positions
+      WHERE callsign IS NOT NULL
+        AND callsign <> ''
+    ),
+    flagged AS (
+      SELECT
+        *,
+        CASE
+          WHEN prev_ts IS NULL THEN 1
+          WHEN ts - prev_ts > 3600 THEN 1
+          ELSE 0
+        END AS is_new_flight
+      FROM ordered
+    ),
+    segmented AS (
+      SELECT
+        *,
+        SUM(is_new_flight) OVER (PARTITION BY callsign ORDER BY ts) AS flight_seq
+      FROM flagged
+    ),
+    bubble_last AS (
+      SELECT DISTINCT ON (callsign, flight_seq)
+        callsign,
+        flight_seq,
+        ts,
+        gs_kts,
+        alt_ft,
+        region
+      FROM segmented
+      WHERE in_bubble
+      ORDER BY callsign, flight_seq, ts DESC
+    )
+    INSERT INTO flights (
+      callsign, flight_seq, first_ts, last_ts,
+      in_bubble, bubble_ts, gs_kts, alt_ft, points, region
+    )
+    SELECT
+      s.callsign,
+      s.flight_seq,
+      MIN(s.ts),
+      MAX(s.ts),
+      b.ts IS NOT NULL,
+      b.ts,
+      b.gs_kts,
+      b.alt_ft,
+      COUNT(*),
+      COALESCE(b.region, (ARRAY_AGG(s.region ORDER BY s.ts DESC))[1])
+    FROM segmented s
+    LEFT JOIN bubble_last b
+      ON b.callsign = s.callsign
+     AND b.flight_seq = s.flight_seq
+    WHERE NOT EXISTS (SELECT 1 FROM flights)
+    GROUP BY s.callsign, s.flight_seq, b.ts, b.gs_kts, b.alt_ft, b.region;
+"""
+
+# Eenmalig na het toevoegen van flights.points: tellen uit positions
+FLIGHT_POINTS_BACKFILL_SQL = """
+    UPDATE flights f SET points = (
+      SELECT COUNT(*)
+      FROM positions p
+      WHERE p.callsign = f.callsign
+        AND p.callsign <> ''
+        AND p.ts BETWEEN f.first_ts AND f.last_ts
+    );
+"""
+
+
+# -------------------------------------------------------------------
+# Database initialization
+# -------------------------------------------------------------------
+def column_exists(cur, table, column):
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = %s AND column_name = %s;
+    """, (table, column))
+    return cur.fetchone() is not None
+
 
 def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
-    with open("schema.sql") as f:
-        cur.execute(f.read())
-    conn.commit()
-    cur.close()
-    conn.close()
-
-def save(ac_list):
-    conn = get_conn()
-    cur = conn.cursor()
-    now = int(datetime.now(timezone.utc).timestamp())
-
-    for ac in ac_list:
-        lat = ac.get("lat")
-        lon = ac.get("lon")
-        if lat is None or lon is None:
-            continue
-
-        if haversine_km(ARNHEM_LAT, ARNHEM_LON, lat, lon) > BUBBLE_RADIUS_KM:
-            continue
-
-        cur.execute("""
-            INSERT INTO positions (icao, callsign, ts, lat, lon, alt_ft, gs_kts)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, (
-            ac.get("icao"),
-            (ac.get("flight") or "").strip(),
-            now,
-            lat,
-            lon,
-            ac.get("alt_baro"),
-            ac.get("gs"),
-        ))
-
-    conn.commit()
-    cur.close()
-    conn.close()
-
-def main():
-    # Make sure tables exist
-    init_db()
+    now = int(time.time())
+    with cursor() as cur:
+        # oude ongepartitioneerde tabel opzij zetten (eenmalig)
+        legacy = partitions.detach_legacy_positions(cur)
+        had_distance = column_exists(cur, "positions", "dist_km")
+        had_points = column_exists(cur, "flights", "points")
+        cur.execute("SELECT to_regclass('flight_days') IS NOT NULL AS present")
+        had_rollups = cur.fetchone()["present"]
+        with open("schema.sql") as f:
+            cur.execute(f.read())
+        partitions.ensure_partitions(cur, now, now + 32 * 86400)
+        if legacy:
+            partitions.import_legacy_positions(cur)
+        if legacy or not had_distance:
+            cur.execute(DISTANCE_BACKFILL_SQL)
+        if not had_points:
+            cur.execute(FLIGHT_POINTS_BACKFILL_SQL)
+        # eenmalig: vluchten afleiden uit bestaande posities (no-op als flights gevuld is)
+        cur.execute(FLIGHTS_BACKFILL_SQL)
+        if not had_rollups:
+            rollups.fill(cur)
+        partitions.maintain(cur, now)
+
+
+def resume_flights(cur, now):
+    """
+    Open vluchten terughalen uit het laatste uur; wat daarbuiten nog open
+    stond wordt gesloten en in de rollups opgeteld. Geeft de gesloten
+    vluchten terug.
+    """
+    closed = segmenter.rebuild(cur, now)
+    rollups.add_flights(cur, closed)
+    return closed
+
+
+# -------------------------------------------------------------------
+# Ingest
+# -------------------------------------------------------------------
+INGEST_STATE_SQL = """
+    UPDATE ingest_state SET
+      data_version = data_version + 1,
+      updated_ts = %(updated_ts)s,
+      rows_seen = rows_seen + %(seen)s,
+      rows_suppressed = rows_suppressed + %(suppressed)s,
+      rows_written = rows_written + %(written)s,
+      replayed_batches = replayed_batches + %(replayed)s,
+      replay_lag_s = COALESCE(%(replay_lag_s)s, replay_lag_s),
+      spool_dropped = spool_dropped + %(dropped)s,
+      spool_pending_batches = %(pending_batches)s,
+      spool_pending_bytes = %(pending_bytes)s
+    WHERE id = 1;
+"""
+
+# live_positions = alle metingen van de laatste batch; de NOTIFY gaat pas
+# bij de commit de deur uit (zie live.py)
+LIVE_CLEAR_SQL = "DELETE FROM live_positions;"
+LIVE_NOTIFY_SQL = "SELECT pg_notify(%s, %s);"
+
+def save_batches(batches, replay_lag_s=None, dropped=0, spool_stats=None):
+    """
+    Schrijf gefilterde batches [(fetched_ts, rows)], met rows zoals
+    ingest.position_rows ze geeft, in volgorde en in één transactie weg:
+    één live batch, of een stuk uit de spool. Werkt daarnaast de
+    flights-tabel bij via de StreamingSegmenter (zie FLIGHT_UPSERT_SQL).
+
+    Metingen die niet veranderd zijn t.o.v. de vorige van hetzelfde
+    toestel worden overgeslagen (zie dedup.ChangeFilter). ChangeFilter en
+    segmenter lopen per batch mee; mislukt de transactie, dan gaan ze
+    terug naar hun state van daarvoor.
+
+    De laatste batch komt (ongefilterd) in live_positions, met een NOTIFY
+    voor /api/live.
+
+    replay_lag_s en dropped zijn voor een replay uit de spool (tellers in
+    ingest_state); spool_stats (Spool.stats()) is de achterstand in de
+    spool bij het begin van deze write. Geeft (aantal opgeslagen rijen, afgeronde vluchten, duur
+    in seconden) terug; een afgeronde vlucht is een dict met FLIGHT_COLUMNS.
+    """
+    global _live_rows
+    started = time.monotonic()
+    last_ts, live_rows = batches[-1]
+    # lege lucht, niets af te sluiten en live_positions al leeg: geen database nodig
+    if (not any(rows for _, rows in batches) and _live_rows == 0
+            and not segmenter.feed(last_ts, ())[1]):
+        return 0, [], time.monotonic() - started
+
+    filter_state = change_filter.snapshot()
+    segmenter_state = segmenter.snapshot()
+    seen = 0
+    kept_all = []
+    closed_all = []
+    try:
+        with cursor() as cur:
+            for now, rows in batches:
+                # één flights-rij per callsign per batch; een meting in de bubbel wint
+                flights = {}  # callsign -> (callsign, ts, in_bubble, gs_kts, alt_ft, region)
+                for _, callsign, _, _, _, alt_ft, gs_kts, _, in_bubble, region in rows:
+                    if callsign and (callsign not in flights or in_bubble):
+                        flights[callsign] = (callsign, now, in_bubble, gs_kts, alt_ft, region)
+
+                # onveranderde / dubbele metingen niet opnieuw opslaan; flights wordt
+                # wel met alle metingen bijgewerkt, zodat last_ts actueel blijft
+                kept = change_filter.filter(rows)
+                changed, closed = segmenter.feed(now, flights.values())
+                records = closed + list(changed.values())
+                assigned = upsert_flights(cur, records) if records else {}
+                rollups.add_flights(cur, closed)
+
+                # de volgende batch bouwt hierop voort
+                change_filter.remember(kept, now)
+                segmenter.apply(changed, closed, assigned)
+                seen += len(rows)
+                kept_all.extend(kept)
+                closed_all.extend(closed)
+
+            written = insert_positions(cur, kept_all)
+            cur.execute(INGEST_STATE_SQL, {
+                "updated_ts": last_ts,
+                "seen": seen,
+                "suppressed": seen - len(kept_all),
+                "written": written,
+                "replayed": len(batches) if replay_lag_s is not None else 0,
+                "replay_lag_s": replay_lag_s,
+                "dropped": dropped,
+                "pending_batches": spool_stats["pending_batches"] if spool_stats else 0,
+                "pending_bytes": spool_stats["pending_bytes"] if spool_stats else 0,
+            })
+
+            cur.execute(LIVE_CLEAR_SQL)
+            copy_rows(cur, "live_positions", POSITION_COLUMNS, live_rows)
+            cur.execute(LIVE_NOTIFY_SQL, (LIVE_CHANNEL, str(last_ts)))
+    except Exception:
+        change_filter.restore(filter_state)
+        segmenter.restore(segmenter_state)
+        raise
+
+    # nieuwe data: gecachte API-responses zijn verouderd
+    _live_rows = len(live_rows)
+    bump_data_version()
+    return written, closed_all, time.monotonic() - started
+
+
+def upsert_flights(cur, records):
+    """Vlucht-records wegschrijven; geeft callsign -> toegekende flight_seq."""
+    returned = psycopg2.extras.execute_values(
+        cur,
+        FLIGHT_UPSERT_SQL,
+        [tuple(f[c] for c in FLIGHT_COLUMNS) for f in records],
+        template=FLIGHT_UPSERT_TEMPLATE,
+        page_size=len(records),
+        fetch=True,
+    )
+    assigned = {}
+    for r in returned:
+        seq = assigned.get(r["callsign"], 0)
+        assigned[r["callsign"]] = max(seq, r["flight_seq"])
+    return assigned
+
+
+# -------------------------------------------------------------------
+# Leader election: alleen de houder van de advisory lock pollt
+# -------------------------------------------------------------------
+LEADER_LOCK_SQL = "SELECT pg_try_advisory_lock(%s) AS locked;"
+
+
+class LeaderLock:
+    """
+    De collector-lock. Een advisory lock hoort bij de sessie: conn moet
+    open blijven zolang we leader zijn. Valt de verbinding weg (database
+    herstart of onbereikbaar), dan weten we niet of een ander de lock nu
+    heeft; tot dat weer te zeggen is blijven we leader, zodat er naar de
+    spool gepold blijft worden.
+    """
 
+    def __init__(self):
+        self.conn = None
+
+    def try_acquire(self):
+        """
+        Eén poging; True als we de lock hebben, False als een andere sessie
+        hem heeft. Is de database onbereikbaar, dan DB_UNREACHABLE.
+        """
+        conn = get_conn()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(LEADER_LOCK_SQL, (COLLECTOR_LOCK_ID,))
+                locked = cur.fetchone()["locked"]
+        except BaseException:
+            conn.close()
+            raise
+        if locked:
+            self.conn = conn
+        else:
+            conn.close()
+        return locked
+
+    def acquire(self):
+        """Blokkeert tot dit proces de lock heeft."""
+        while True:
+            try:
+                if self.try_acquire():
+                    return
+            except psycopg2.Error as e:
+                print("Collector lock error:", e)
+            time.sleep(LEADER_RETRY_S)
+
+    def held(self):
+        """
+        Nog leader? Is de lock-verbinding weg, dan opnieuw proberen; pas als
+        dat laat zien dat een andere sessie de lock heeft, zijn we het niet
+        meer.
+        """
+        if self.conn is not None:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                return True
+            except psycopg2.Error as e:
+                print("Collector lock connection lost:", e)
+                self.release()
+        try:
+            if self.try_acquire():
+                print("Collector lock re-acquired")
+                return True
+            return False
+        except DB_UNREACHABLE:
+            return True
+        except psycopg2.Error as e:
+            print("Collector lock error:", e)
+            return False
+
+    def release(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+# -------------------------------------------------------------------
+# Collector loop
+#
+# De poller haalt op een vaste cadans (zonder drift) alle regio's
+# tegelijk op, voegt de antwoorden samen en zet elke batch in een
+# begrensde queue; een aparte writer-thread schrijft ze weg. Zo houdt een
+# trage insert het pollen niet op, en een trage fetch het schrijven niet.
+# Backoff geldt per regio: één falende regio houdt de rest niet op.
+# -------------------------------------------------------------------
+def new_session():
+    session = requests.Session()  # keep-alive: één verbinding hergebruiken
+    session.headers["User-Agent"] = "arnhem-flights-collector"
+    return session
+
+
+def fetch_aircraft(session, region):
+    r = session.get(region.url, timeout=FETCH_TIMEOUT_S)
+    r.raise_for_status()
+    return r.json().get("ac") or []
+
+
+def merge_aircraft(responses):
+    """
+    Antwoorden van overlappende regio's samenvoegen: per ICAO (ingest.icao)
+    één meting, die met de meest recente positie (laagste seen_pos).
+    Toestellen zonder ICAO blijven allemaal staan.
+    """
+    merged = {}
+    anonymous = []
+    for ac_list in responses:
+        for ac in ac_list:
+            icao = ingest.icao(ac)
+            if icao is None:
+                anonymous.append(ac)
+                continue
+            seen = merged.get(icao)
+            if seen is None or position_age(ac) < position_age(seen):
+                merged[icao] = ac
+    return list(merged.values()) + anonymous
+
+
+def position_age(ac):
+    age = ingest.numeric(ac.get("seen_pos"))
+    return math.inf if age is None else age
+
+
+def retry_after_s(response):
+    """Retry-After in seconden (getal of HTTP-datum), of None."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_s(failures, response=None):
+    """Wachttijd na `failures` mislukte polls op rij (met wat jitter)."""
+    delay = min(POLL_INTERVAL_S * 2 ** (failures - 1), BACKOFF_MAX_S)
+    delay *= random.uniform(0.9, 1.1)
+    server = retry_after_s(response)
+    if server is not None:
+        delay = max(delay, server)
+    return delay
+
+
+def enqueue(batches, item):
     while True:
         try:
-            r = requests.get(ADSB_URL, timeout=10)
-            r.raise_for_status()
-            data = r.json()
-            save(data.get("ac", []))
-            print("Saved batch at", datetime.utcnow())
+            batches.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                batches.get_nowait()
+                print("Write queue full, dropped oldest batch")
+            except queue.Empty:
+                pass
+
+
+def spool_batch(spool, fetched_ts, rows):
+    try:
+        spool.append(fetched_ts, rows)
+    except OSError as e:
+        print("Spool error, batch lost:", e)
+
+
+def writer_loop(batches, spool):
+    """
+    Schrijft batches uit de queue weg tot er None binnenkomt; doet ook het
+    onderhoud. Is de database onbereikbaar (DB_UNREACHABLE), dan gaat de
+    batch naar de spool. Zolang die niet leeg is, sluiten nieuwe batches
+    daar achter aan (de volgorde blijft zo gelijk) en wordt hij per stuk
+    naar PostgreSQL teruggespeeld. Elke andere fout zit in de batch zelf:
+    die wordt gelogd en overgeslagen, zodat hij de rest niet blokkeert.
+    De spool is van de aanroeper (zie collector_loop).
+    """
+    retry_at = 0.0
+    reported_dropped = 0
+    replay_batches = SPOOL_REPLAY_BATCHES
+    next_maintenance = time.monotonic() + partitions.MAINTENANCE_INTERVAL_S
+    while True:
+        replay = len(spool) > 0 and time.monotonic() >= retry_at
+        try:
+            item = batches.get(block=not replay, timeout=POLL_INTERVAL_S)
+        except queue.Empty:
+            item = ()
+        if item is None:
+            return
+
+        if item:
+            fetched_ts, ac = item
+            rows = None
+            try:
+                rows = ingest.position_rows(ac, REGIONS, fetched_ts)
+                if len(spool):
+                    spool_batch(spool, fetched_ts, rows)
+                else:
+                    written, closed, elapsed = save_batches([(fetched_ts, rows)])
+                    print(
+                        "Saved batch at", datetime.utcnow(),
+                        f"({written} rows, {len(closed)} flights closed in {elapsed * 1000:.0f} ms,"
+                        f" {batches.qsize()} queued)"
+                    )
+            except DB_UNREACHABLE as e:
+                spool_batch(spool, fetched_ts, rows)
+                stats = spool.stats()
+                print(f"Database unreachable, spooled batch ({stats['pending_batches']} pending,"
+                      f" {stats['pending_bytes'] / 1e6:.1f} MB):", e)
+                retry_at = time.monotonic() + SPOOL_RETRY_S
+            except Exception as e:
+                print(f"Dropped batch of {fetched_ts} ({len(ac)} aircraft):", repr(e))
+
+        if replay:
+            chunk = spool.peek(replay_batches)
+            lag_s = int(time.time()) - chunk[0][0]
+            try:
+                written, closed, elapsed = save_batches(
+                    chunk, replay_lag_s=lag_s, dropped=spool.dropped - reported_dropped
+                )
+            except DB_UNREACHABLE as e:
+                print("Spool replay error:", e)
+                retry_at = time.monotonic() + SPOOL_RETRY_S
+            except Exception as e:
+                if len(chunk) > 1:
+                    # één batch is fout: batch voor batch verder om hem te vinden
+                    print("Spool replay error, replaying one batch at a time:", repr(e))
+                    replay_batches = 1
+                else:
+                    print(f"Dropped spooled batch of {chunk[0][0]}:", repr(e))
+                    spool.discard(1)
+            else:
+                spool.consume(len(chunk))
+                reported_dropped = spool.dropped
+                replay_batches = SPOOL_REPLAY_BATCHES
+                print(
+                    f"Replayed {len(chunk)} batches from spool ({written} rows,"
+                    f" {len(closed)} flights closed in {elapsed * 1000:.0f} ms,"
+                    f" lag {lag_s} s, {len(spool)} pending)"
+                )
+
+        if time.monotonic() >= next_maintenance:
+            next_maintenance += partitions.MAINTENANCE_INTERVAL_S
+            try:
+                with cursor() as cur:
+                    partitions.maintain(cur, int(time.time()))
+            except Exception as e:
+                print("Maintenance error:", e)
+
+
+def poll_loop(lock, batches):
+    """
+    Pollt zolang we leader zijn (lock.held(), een LeaderLock); elke
+    POLL_INTERVAL_S, gemeten vanaf de start.
+    """
+    sessions = {r.name: new_session() for r in REGIONS}
+    failures = {r.name: 0 for r in REGIONS}
+    not_before = {r.name: 0.0 for r in REGIONS}  # monotonic, na backoff
+    pool = ThreadPoolExecutor(max_workers=len(REGIONS), thread_name_prefix="fetch")
+    next_poll = time.monotonic()
+    try:
+        while lock.held():
+            fetched_ts = int(time.time())
+            due = [r for r in REGIONS if not_before[r.name] <= next_poll]
+            futures = [(r, pool.submit(fetch_aircraft, sessions[r.name], r)) for r in due]
+
+            responses = []
+            for region, future in futures:
+                try:
+                    responses.append(future.result())
+                except (requests.RequestException, ValueError) as e:
+                    failures[region.name] += 1
+                    delay = backoff_s(failures[region.name], getattr(e, "response", None))
+                    not_before[region.name] = time.monotonic() + delay
+                    print(f"Fetch error {region.name} ({failures[region.name]}x,"
+                          f" retry in {delay:.0f} s):", e)
+                else:
+                    failures[region.name] = 0
+            if responses:
+                enqueue(batches, (fetched_ts, merge_aircraft(responses)))
+
+            # vaste cadans: plannen vanaf het vorige slot, niet vanaf nu;
+            # gemiste slots (na een trage fetch) overslaan
+            next_poll += POLL_INTERVAL_S
+            now = time.monotonic()
+            if next_poll < now:
+                next_poll += math.ceil((now - next_poll) / POLL_INTERVAL_S) * POLL_INTERVAL_S
+            time.sleep(next_poll - now)
+    finally:
+        pool.shutdown(wait=True)
+        for session in sessions.values():
+            session.close()
+
+
+def stop_writer(batches, writer, spool):
+    """
+    Writer stoppen als we geen leader meer zijn. Wat nog in de queue staat
+    gaat niet meer naar de database maar naar de spool; de volgende keer
+    als leader wordt het teruggespeeld. Geeft het aantal gespoolde batches.
+    """
+    pending = []
+    while True:
+        try:
+            pending.append(batches.get_nowait())
+        except queue.Empty:
+            break
+    if writer is not None:
+        batches.put(None)
+        writer.join()
+
+    spooled = 0
+    for fetched_ts, ac in pending:
+        try:
+            spool_batch(spool, fetched_ts, ingest.position_rows(ac, REGIONS, fetched_ts))
+            spooled += 1
         except Exception as e:
-            print("Error:", e)
+            print(f"Dropped batch of {fetched_ts} ({len(ac)} aircraft):", repr(e))
+    return spooled
+
+
+def collector_loop():
+    print("Collector started, waiting for leader lock...")
+
+    while True:
+        lock = LeaderLock()
+        lock.acquire()
+        print("Collector is leader, polling", ", ".join(r.url for r in REGIONS))
+        batches = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        spool = Spool()
+        writer = None
+        try:
+            init_db()
+            with cursor() as cur:
+                closed = resume_flights(cur, int(time.time()))
+            print(f"Segmenter: {len(segmenter.open)} open flights, {len(closed)} closed")
+            writer = threading.Thread(target=writer_loop, args=(batches, spool), daemon=True)
+            writer.start()
+            poll_loop(lock, batches)
+        except Exception as e:
+            print("Collector error:", e)
+        finally:
+            spooled = stop_writer(batches, writer, spool)
+            if spooled:
+                print(f"Spooled {spooled} queued batches")
+            spool.close()
+            lock.release()
+        print("Collector lost leader lock")
+
+
+def start_in_background():
+    """
+    Start de collector als daemon-thread in dit proces (COLLECTOR_IN_WEB=1,
+    voor lokaal draaien). Meerdere processen mogen dit aanroepen: alleen de
+    leader pollt, de rest probeert elke LEADER_RETRY_S seconden de lock te
+    krijgen.
+    """
+    global _thread_started
+    with _thread_lock:
+        if _thread_started:
+            return
+        threading.Thread(target=collector_loop, daemon=True).start()
+        _thread_started = True
 
-        time.sleep(10)  # stay well under rate limits
 
 if __name__ == "__main__":
-    main()
+    collector_loop()
@@ -1,7 +1,223 @@
+import itertools
 import os
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
+
+# Kolomvolgorde van de tuples die insert_positions verwacht
+POSITION_COLUMNS = (
+    "icao", "callsign", "ts", "lat", "lon", "alt_ft", "gs_kts", "dist_km", "in_bubble",
+    "region",
+)
+
+# Pool-instellingen (per proces; elke gunicorn-worker krijgt een eigen pool)
+POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.environ.get("DB_POOL_MAX", "5"))
+POOL_TIMEOUT_S = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+
+# Rijen per round trip bij het streamen met een server-side cursor
+STREAM_FETCH_SIZE = int(os.environ.get("DB_STREAM_FETCH_SIZE", "2000"))
+
+# Verbindingen die langer idle waren krijgen bij checkout eerst een SELECT 1
+HEALTHCHECK_IDLE_S = float(os.environ.get("DB_HEALTHCHECK_IDLE", "30"))
+
+_pool = None
+_pool_pid = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+_last_used = {}  # id(conn) -> monotonic tijd van laatste checkin
+_stream_ids = itertools.count()
+
 
 def get_conn():
+    """Losse verbinding buiten de pool (voor lang lopende sessies)."""
     url = os.environ["DATABASE_URL"]
     return psycopg2.connect(url, cursor_factory=psycopg2.extras.RealDictCursor)
+
+
+def _get_pool():
+    global _pool, _pool_pid, _pool_slots
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                # Na een fork de verbindingen van de parent niet hergebruiken:
+                # gewoon een nieuwe pool voor dit proces opbouwen.
+                _pool = psycopg2.pool.ThreadedConnectionPool(
+                    POOL_MIN,
+                    POOL_MAX,
+                    os.environ["DATABASE_URL"],
+                    cursor_factory=psycopg2.extras.RealDictCursor,
+                )
+                _pool_slots = threading.BoundedSemaphore(POOL_MAX)
+                _pool_pid = pid
+                _last_used.clear()
+    return _pool, _pool_slots
+
+
+def _healthy(conn):
+    if conn.closed:
+        return False
+    idle = time.monotonic() - _last_used.get(id(conn), 0)
+    if idle < HEALTHCHECK_IDLE_S:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout(pool):
+    # Een paar pogingen: een verbroken verbinding wordt weggegooid en de
+    # pool maakt een nieuwe aan.
+    for _ in range(POOL_MAX + 1):
+        conn = pool.getconn()
+        if _healthy(conn):
+            return conn
+        _last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError("no healthy database connection available")
+
+
+@contextmanager
+def connection():
+    """
+    Leen een verbinding uit de pool. Commit bij succes, rollback bij een
+    exceptie; verbroken verbindingen worden gesloten i.p.v. teruggezet.
+
+        with connection() as conn:
+            with conn.cursor() as cur:
+                ...
+    """
+    pool, slots = _get_pool()
+    # ThreadedConnectionPool gooit een PoolError als hij vol zit; de
+    # semaphore laat threads in plaats daarvan wachten op een vrije plek.
+    if not slots.acquire(timeout=POOL_TIMEOUT_S):
+        raise psycopg2.pool.PoolError("timed out waiting for a database connection")
+    conn = None
+    broken = False
+    try:
+        conn = _checkout(pool)
+        yield conn
+        conn.commit()
+    except Exception as e:
+        if conn is not None:
+            broken = conn.closed or isinstance(
+                e, (psycopg2.OperationalError, psycopg2.InterfaceError)
+            )
+            if not broken:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+        raise
+    finally:
+        if conn is not None:
+            if broken:
+                _last_used.pop(id(conn), None)
+            else:
+                _last_used[id(conn)] = time.monotonic()
+            pool.putconn(conn, close=broken)
+        slots.release()
+
+
+@contextmanager
+def cursor():
+    """Kortere vorm van connection() voor één cursor."""
+    with connection() as conn:
+        with conn.cursor() as cur:
+            yield cur
+
+
+def iter_rows(sql, params=None, size=STREAM_FETCH_SIZE):
+    """
+    Generator over de rijen van een query via een named (server-side)
+    cursor, `size` rijen per fetchmany. Er staan dus nooit meer dan `size`
+    rijen in het geheugen. De pool-verbinding blijft bezet zolang de
+    generator loopt; pas als hij klaar is (of gesloten wordt) komt hij vrij.
+    """
+    with connection() as conn:
+        cur = conn.cursor(name=f"stream_{os.getpid()}_{next(_stream_ids)}")
+        try:
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(size)
+                if not rows:
+                    break
+                yield from rows
+        except GeneratorExit:
+            # afgebroken download: cursor en transactie niet open laten staan
+            cur.close()
+            conn.rollback()
+            raise
+        cur.close()
+
+
+def insert_positions(cur, rows):
+    """
+    Schrijf een hele batch posities in één INSERT (één round trip).
+    rows: tuples in POSITION_COLUMNS-volgorde. Rijen die (icao, ts) al
+    hebben worden overgeslagen. Geeft het aantal geschreven rijen terug.
+    """
+    if not rows:
+        return 0
+    psycopg2.extras.execute_values(
+        cur,
+        f"INSERT INTO positions ({', '.join(POSITION_COLUMNS)}) VALUES %s"
+        " ON CONFLICT (icao, ts) DO NOTHING",
+        rows,
+        page_size=len(rows),
+    )
+    return cur.rowcount
+
+
+class _CopyStream:
+    """File-achtig object dat COPY-tekstregels uit een iterator levert."""
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buf = b""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buf) < size:
+            try:
+                self._buf += next(self._lines).encode()
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buf)
+        chunk, self._buf = self._buf[:size], self._buf[size:]
+        return chunk
+
+
+def _copy_value(v):
+    if v is None:
+        return "\\N"
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    s = str(v)
+    if isinstance(v, str):
+        s = (s.replace("\\", "\\\\").replace("\t", "\\t")
+              .replace("\n", "\\n").replace("\r", "\\r"))
+    return s
+
+
+def copy_rows(cur, table, columns, rows):
+    """
+    Stream rijen met COPY FROM STDIN naar een tabel, zonder ze eerst als
+    geheel in het geheugen te zetten. rows mag een generator zijn.
+    """
+    lines = ("\t".join(_copy_value(v) for v in row) + "\n" for row in rows)
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN",
+        _CopyStream(lines),
+        size=65536,
+    )
+    return cur.rowcount
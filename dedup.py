@@ -0,0 +1,103 @@
+import os
+import threading
+
+# Toleranties waarbinnen een meting als "niet veranderd" geldt
+DEDUP_LAT_LON_DEG = float(os.environ.get("DEDUP_LAT_LON_DEG", "0.0005"))  # ~50 m
+DEDUP_ALT_FT = float(os.environ.get("DEDUP_ALT_FT", "50"))
+DEDUP_GS_KTS = float(os.environ.get("DEDUP_GS_KTS", "5"))
+
+# Ook een stilstaand toestel krijgt minstens zo vaak een rij, zodat de
+# 3600 s-gap-regel en de tracks blijven kloppen
+DEDUP_HEARTBEAT_S = int(os.environ.get("DEDUP_HEARTBEAT_S", "300"))
+
+
+def _close(a, b, tol):
+    if a is None or b is None:
+        return a is b
+    if not isinstance(a, (int, float)) or not isinstance(b, (int, float)):
+        return a == b  # bv. alt_baro == "ground"
+    return abs(a - b) <= tol
+
+
+class ChangeFilter:
+    """
+    Onderdrukt metingen die niet wezenlijk verschillen van de laatst
+    opgeslagen meting van hetzelfde toestel (ICAO).
+
+    Rijen zijn tuples in db.POSITION_COLUMNS-volgorde. filter() laat de
+    state ongemoeid; roep remember() aan met de rijen die echt zijn
+    opgeslagen, zodat een mislukte insert niets onderdrukt.
+    """
+
+    def __init__(self, lat_lon_deg=DEDUP_LAT_LON_DEG, alt_ft=DEDUP_ALT_FT,
+                 gs_kts=DEDUP_GS_KTS, heartbeat_s=DEDUP_HEARTBEAT_S):
+        self.lat_lon_deg = lat_lon_deg
+        self.alt_ft = alt_ft
+        self.gs_kts = gs_kts
+        self.heartbeat_s = heartbeat_s
+        self._last = {}  # icao -> laatst opgeslagen rij
+        self._lock = threading.Lock()
+        self.seen = 0
+        self.suppressed = 0
+        self.duplicates = 0
+
+    def _unchanged(self, prev, row):
+        _, callsign, ts, lat, lon, alt_ft, gs_kts = row[:7]
+        return (
+            ts - prev[2] < self.heartbeat_s
+            and callsign == prev[1]
+            and _close(lat, prev[3], self.lat_lon_deg)
+            and _close(lon, prev[4], self.lat_lon_deg)
+            and _close(alt_ft, prev[5], self.alt_ft)
+            and _close(gs_kts, prev[6], self.gs_kts)
+        )
+
+    def filter(self, rows):
+        kept = []
+        batch_icaos = set()
+        with self._lock:
+            for row in rows:
+                self.seen += 1
+                icao = row[0]
+                if icao is not None:
+                    # hetzelfde toestel twee keer in één poll
+                    if icao in batch_icaos:
+                        self.duplicates += 1
+                        continue
+                    batch_icaos.add(icao)
+
+                    prev = self._last.get(icao)
+                    if prev is not None and self._unchanged(prev, row):
+                        self.suppressed += 1
+                        continue
+                kept.append(row)
+        return kept
+
+    def remember(self, rows, now):
+        with self._lock:
+            for row in rows:
+                if row[0] is not None:
+                    self._last[row[0]] = row
+            # toestellen die al een tijd weg zijn vergeten
+            cutoff = now - 2 * self.heartbeat_s
+            for icao in [k for k, v in self._last.items() if v[2] < cutoff]:
+                del self._last[icao]
+
+    def snapshot(self):
+        """State om met restore() terug te zetten als een transactie mislukt."""
+        with self._lock:
+            return dict(self._last), self.seen, self.suppressed, self.duplicates
+
+    def restore(self, state):
+        with self._lock:
+            last, self.seen, self.suppressed, self.duplicates = state
+            self._last = dict(last)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "seen": self.seen,
+                "suppressed": self.suppressed,
+                "duplicates": self.duplicates,
+                "tracked_aircraft": len(self._last),
+            }
@@ -0,0 +1,316 @@
+"""
+Export van positions of vlucht-samenvattingen (flights) over een tijdvenster.
+
+    python export.py positions --from 2026-05-01 --to 2026-06-01 --format parquet -o mei.parquet
+    python export.py flights --from 2026-05-01 --format csv > flights.csv
+
+Dezelfde stroom zit achter /api/export. De data komt uit COPY TO STDOUT
+(CSV) en gaat in blokken door: als CSV ongewijzigd, of via pyarrow als
+Arrow IPC-stream of Parquet. Het geheugengebruik is begrensd (een paar
+blokken), ongeacht de lengte van het venster. pyarrow staat in
+requirements.txt; zonder pyarrow is alleen CSV beschikbaar.
+"""
+import argparse
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pa_parquet
+except ImportError:
+    pa = None
+
+from db import POSITION_COLUMNS, cursor
+from segmentation import FLIGHT_COLUMNS, TS_MAX
+
+FORMATS = ("arrow", "parquet", "csv")
+
+MIMETYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+    "csv": "text/csv",
+}
+
+EXTENSIONS = {"arrow": "arrows", "parquet": "parquet", "csv": "csv"}
+
+# Blokgrootte (bytes CSV) per doorgegeven stuk / Arrow record batch, en het
+# aantal blokken dat tussen COPY en de lezer mag wachten
+CHUNK_BYTES = 1024 * 1024
+QUEUE_CHUNKS = 4
+
+EXPORTS = {
+    "positions": (
+        f"""
+        SELECT {', '.join(POSITION_COLUMNS)}
+        FROM positions
+        WHERE ts >= %(from_ts)s AND ts < %(to_ts)s
+        ORDER BY ts
+        """,
+        POSITION_COLUMNS,
+    ),
+    "flights": (
+        f"""
+        SELECT {', '.join(FLIGHT_COLUMNS)}
+        FROM flights
+        WHERE last_ts >= %(from_ts)s AND first_ts < %(to_ts)s
+        ORDER BY first_ts, callsign, flight_seq
+        """,
+        FLIGHT_COLUMNS,
+    ),
+}
+
+
+def arrow_types():
+    """Arrow-type per kolom (positions en flights)."""
+    return {
+        "icao": pa.string(),
+        "callsign": pa.string(),
+        "region": pa.string(),
+        "ts": pa.int64(),
+        "first_ts": pa.int64(),
+        "last_ts": pa.int64(),
+        "bubble_ts": pa.int64(),
+        "flight_seq": pa.int32(),
+        "points": pa.int32(),
+        "lat": pa.float64(),
+        "lon": pa.float64(),
+        "alt_ft": pa.float64(),
+        "gs_kts": pa.float64(),
+        "dist_km": pa.float32(),
+        "in_bubble": pa.bool_(),
+        "closed": pa.bool_(),
+    }
+
+
+def default_format():
+    return "arrow" if pa is not None else "csv"
+
+
+def check_format(fmt):
+    if fmt not in FORMATS:
+        raise ValueError("format must be one of " + ", ".join(FORMATS))
+    if fmt != "csv" and pa is None:
+        raise ValueError(f"format {fmt} needs pyarrow; use format=csv")
+
+
+def parse_time(value):
+    """Unix-seconden of een (UTC-)datum YYYY-MM-DD."""
+    if value.isdigit():
+        return int(value)
+    dt = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+# -------------------------------------------------------------------
+# COPY TO STDOUT als begrensde stroom
+# -------------------------------------------------------------------
+class _Pipe:
+    """
+    COPY schrijft (in een eigen thread) via write(); de lezer haalt blokken
+    op met chunks() of read(). De queue begrenst het geheugen en remt COPY
+    af als de lezer (bv. een trage client) achterloopt.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=QUEUE_CHUNKS)
+        self.cancelled = threading.Event()
+        self._out = []
+        self._out_size = 0
+        self._buf = b""
+        self._done = False
+        self.closed = False  # voor pyarrow (file-achtig)
+
+    # --- schrijfkant (COPY-thread) ---
+    def write(self, data):
+        self._out.append(data if isinstance(data, bytes) else data.encode())
+        self._out_size += len(data)
+        if self._out_size >= CHUNK_BYTES:
+            self._put(b"".join(self._out))
+            self._out = []
+            self._out_size = 0
+
+    def finish(self, error=None):
+        if error is None and self._out:
+            self._put(b"".join(self._out))
+        self._put(error or b"")
+
+    def _put(self, item):
+        while True:
+            if self.cancelled.is_set():
+                raise OSError("export cancelled")
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    # --- leeskant ---
+    def _get(self):
+        # pyarrow leest vooruit in een eigen thread: die mag na het afbreken
+        # niet op de queue blijven wachten
+        while True:
+            if self.cancelled.is_set():
+                raise OSError("export cancelled")
+            try:
+                item = self.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if isinstance(item, Exception):
+                raise item
+            return item
+
+    def chunks(self):
+        while True:
+            item = self._get()
+            if not item:
+                return
+            yield item
+
+    def read(self, size=-1):
+        """File-achtig, voor pyarrow.csv."""
+        while not self._done and (size < 0 or len(self._buf) < size):
+            item = self._get()
+            if not item:
+                self._done = True
+                break
+            self._buf += item
+        if size < 0:
+            size = len(self._buf)
+        data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+
+def copy_chunks(kind, from_ts=None, to_ts=None):
+    """CSV (met header) uit COPY TO STDOUT, in blokken van ~CHUNK_BYTES."""
+    sql, _ = EXPORTS[kind]
+    params = {
+        "from_ts": 0 if from_ts is None else from_ts,
+        "to_ts": TS_MAX if to_ts is None else to_ts,
+    }
+    pipe = _Pipe()
+
+    def run():
+        try:
+            with cursor() as cur:
+                query = cur.mogrify(sql, params).decode()
+                cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", pipe)
+            pipe.finish()
+        except Exception as e:
+            # afgebroken door de lezer: niemand meer om de fout aan door te geven
+            if not pipe.cancelled.is_set():
+                try:
+                    pipe.finish(e)
+                except OSError:
+                    pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return pipe, thread
+
+
+# -------------------------------------------------------------------
+# Formaten
+# -------------------------------------------------------------------
+class _Sink:
+    """Schrijfdoel voor pyarrow; wat erin komt wordt na elke batch doorgegeven."""
+
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def iter_export(kind, from_ts=None, to_ts=None, fmt="csv"):
+    """Genereert de export als bytes-blokken; sluiten van de generator breekt COPY af."""
+    check_format(fmt)
+    pipe, thread = copy_chunks(kind, from_ts, to_ts)
+    try:
+        if fmt == "csv":
+            yield from pipe.chunks()
+            return
+
+        _, columns = EXPORTS[kind]
+        types = arrow_types()
+        schema = pa.schema([(c, types[c]) for c in columns])
+        reader = pa_csv.open_csv(
+            pipe,
+            read_options=pa_csv.ReadOptions(block_size=CHUNK_BYTES),
+            convert_options=pa_csv.ConvertOptions(
+                column_types=schema,
+                true_values=["t"],
+                false_values=["f"],
+                strings_can_be_null=True,
+                quoted_strings_can_be_null=False,  # '' (callsign) is geen NULL
+            ),
+        )
+        sink = _Sink()
+        out = pa.PythonFile(sink, mode="w")
+        if fmt == "arrow":
+            writer = pa_ipc.new_stream(out, schema)
+        else:
+            # één row group per batch (~CHUNK_BYTES CSV): grotere groepen
+            # kosten geheugen en leveren met zstd nauwelijks winst op
+            writer = pa_parquet.ParquetWriter(out, schema, compression="zstd")
+        with writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                data = sink.take()
+                if data:
+                    yield data
+        yield sink.take()
+    finally:
+        # client weg of fout: COPY-thread stoppen (die geeft de verbinding terug)
+        pipe.cancelled.set()
+        thread.join()
+
+
+def filename(kind, from_ts, to_ts, fmt):
+    def day(ts):
+        return "" if ts is None else datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y%m%d")
+    return f"{kind}_{day(from_ts)}-{day(to_ts)}.{EXTENSIONS[fmt]}"
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("kind", choices=sorted(EXPORTS))
+    parser.add_argument("--from", dest="from_ts", type=parse_time,
+                        help="unix seconden of YYYY-MM-DD (UTC)")
+    parser.add_argument("--to", dest="to_ts", type=parse_time, help="exclusief")
+    parser.add_argument("--format", choices=FORMATS, default=default_format())
+    parser.add_argument("-o", "--output", help="bestand (standaard stdout)")
+    args = parser.parse_args(argv)
+    try:
+        check_format(args.format)
+    except ValueError as e:
+        parser.error(str(e))
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in iter_export(args.kind, args.from_ts, args.to_ts, args.format):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
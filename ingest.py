@@ -0,0 +1,102 @@
+import math
+
+import numpy as np
+
+# Gevectoriseerd filteren van een feed-batch (lijst aircraft-dicts zoals
+# adsb.fi ze levert) vóór het wegschrijven. lat/lon gaan één keer naar
+# arrays; afstand tot elke regio, regio-keuze, geldigheid en bubbel worden
+# in één doorgang over de hele batch berekend. Alleen de rijen die
+# overblijven worden weer Python-tuples voor de bulk-writer.
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def numeric(value):
+    """alt_baro kan "ground" zijn; alles wat geen getal is wordt NULL."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def icao(ac):
+    """
+    ICAO-adres van een meting: adsb.fi /v3 en readsb aircraft.json leveren
+    het als hex, traces (en oudere feeds) als icao. Kleine letters, of None.
+    """
+    value = ac.get("icao") or ac.get("hex")
+    if not isinstance(value, str) or not value.strip():
+        return None
+    return value.strip().lower()
+
+
+def coordinates(ac_list):
+    """lat/lon als float-arrays; een ontbrekende of ongeldige coördinaat wordt NaN."""
+    lat = np.array([numeric(ac.get("lat")) for ac in ac_list], dtype=float)
+    lon = np.array([numeric(ac.get("lon")) for ac in ac_list], dtype=float)
+    return lat, lon
+
+
+def locate(regions, lat, lon):
+    """
+    Per positie de index (in regions) van de dichtstbijzijnde regio binnen
+    wier opslagstraal hij valt, of -1, en de afstand daarheen in km.
+    """
+    best = np.full(lat.shape, -1)
+    best_km = np.full(lat.shape, np.inf)
+    with np.errstate(invalid="ignore"):  # NaN-coördinaten vallen overal buiten
+        phi = np.radians(lat)
+        cos_phi = np.cos(phi)
+        for i, region in enumerate(regions):
+            phi0 = math.radians(region.lat)
+            # zelfde volgorde van bewerkingen als de scalaire haversine, zodat
+            # een punt precies op de straal er ook hier binnen valt
+            a = (
+                np.sin(np.radians(lat - region.lat) / 2) ** 2 +
+                math.cos(phi0) * cos_phi *
+                np.sin(np.radians(lon - region.lon) / 2) ** 2
+            )
+            dist_km = EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+            closer = (dist_km <= region.track_km) & (dist_km < best_km)
+            best[closer] = i
+            best_km[closer] = dist_km[closer]
+    return best, best_km
+
+
+def position_rows(ac_list, regions, ts):
+    """
+    Rijen in db.POSITION_COLUMNS-volgorde voor de metingen met een positie
+    binnen de opslagstraal van een regio; dist_km en in_bubble t.o.v. die
+    regio. ts is het moment van de hele batch (unix seconden), of een lijst
+    met een ts per meting (bv. uit een readsb-trace).
+    """
+    if not ac_list:
+        return []
+    lat, lon = coordinates(ac_list)
+    index, dist_km = locate(regions, lat, lon)
+
+    keep = np.flatnonzero(index >= 0)
+    index = index[keep]
+    dist_km = dist_km[keep]
+    in_bubble = dist_km <= np.array([r.bubble_km for r in regions])[index]
+    names = [r.name for r in regions]
+    per_record = isinstance(ts, (list, tuple))
+
+    rows = []
+    for i, r, lat_i, lon_i, dist_i, bubble_i in zip(
+        keep.tolist(), index.tolist(), lat[keep].tolist(), lon[keep].tolist(),
+        dist_km.tolist(), in_bubble.tolist(),
+    ):
+        ac = ac_list[i]
+        rows.append((
+            icao(ac),
+            (ac.get("flight") or "").strip(),
+            ts[i] if per_record else ts,
+            lat_i,
+            lon_i,
+            numeric(ac.get("alt_baro")),
+            numeric(ac.get("gs")),
+            dist_i,
+            bubble_i,
+            names[r],
+        ))
+    return rows
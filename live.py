@@ -0,0 +1,150 @@
+import os
+import select
+import threading
+import time
+
+from cache import bump_data_version
+from db import get_conn
+
+# Live-updates voor /api/live (Server-Sent Events).
+#
+# De collector doet na elke batch, in dezelfde transactie, een NOTIFY op
+# LIVE_CHANNEL. Per web-worker luistert één thread daarop en bouwt dan één
+# snapshot (toestellen in bereik, last10, stats), dat via de Broadcaster
+# naar alle open streams van die worker gaat. Het aantal kijkers kost dus
+# geen extra queries; zonder kijkers wordt er niets opgebouwd.
+LIVE_CHANNEL = "flights_live"
+
+# Elke zoveel seconden een keepalive-comment (houdt proxies open en merkt
+# weggevallen clients op); na LIVE_MAX_S sluit de stream en verbindt de
+# EventSource opnieuw, zodat threads niet eeuwig vastzitten.
+LIVE_KEEPALIVE_S = float(os.environ.get("LIVE_KEEPALIVE_S", "15"))
+LIVE_MAX_S = float(os.environ.get("LIVE_MAX_S", "600"))
+LIVE_RETRY_S = float(os.environ.get("LIVE_RETRY_S", "5"))
+
+# Open streams per worker. Elke stream houdt een gunicorn-thread bezet, dus
+# dit moet ruim onder --threads blijven (render.yaml), anders wachten de
+# andere endpoints; daarboven krijgt een client een 503 met Retry-After.
+LIVE_MAX_SUBSCRIBERS = int(os.environ.get("LIVE_MAX_SUBSCRIBERS", "40"))
+
+# hoe vaak de listener kijkt of er een snapshot nodig is (nieuwe kijker)
+LISTEN_POLL_S = 1.0
+
+_thread_started = False
+_thread_lock = threading.Lock()
+
+
+class Broadcaster:
+    """
+    Laatste versie van elk onderdeel van de live-state, met een volgnummer.
+    Een stream onthoudt per onderdeel het laatst verstuurde nummer en krijgt
+    alleen wat daarna veranderd is; een trage client slaat tussenversies
+    over in plaats van een wachtrij op te bouwen.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._parts = {}  # naam -> (seq, data)
+        self._seq = 0
+        self.stale = True  # nieuwe data sinds de laatste publish
+        self.subscribers = 0
+
+    def subscribe(self, limit=None):
+        """False als er al `limit` kijkers zijn."""
+        with self._cond:
+            if limit is not None and self.subscribers >= limit:
+                return False
+            self.subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self._cond:
+            self.subscribers -= 1
+
+    def invalidate(self):
+        with self._cond:
+            self.stale = True
+
+    def publish(self, parts):
+        """Nieuwe state; onderdelen die niet veranderd zijn houden hun nummer."""
+        with self._cond:
+            for name, data in parts.items():
+                old = self._parts.get(name)
+                if old is None or old[1] != data:
+                    self._seq += 1
+                    self._parts[name] = (self._seq, data)
+            self.stale = False
+            self._cond.notify_all()
+
+    def _changes(self, seen):
+        return {
+            name: (seq, data)
+            for name, (seq, data) in self._parts.items()
+            if seq > seen.get(name, 0)
+        }
+
+    def wait(self, seen, timeout):
+        """
+        Onderdelen die nieuwer zijn dan `seen` ({naam: seq}, wordt bijgewerkt),
+        of {} als er binnen timeout seconden niets verandert.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: not self.stale and self._changes(seen), timeout)
+            if self.stale:
+                return {}
+            out = {}
+            for name, (seq, data) in self._changes(seen).items():
+                seen[name] = seq
+                out[name] = data
+            return out
+
+
+broadcaster = Broadcaster()
+
+
+def listen(build):
+    """
+    LISTEN op LIVE_CHANNEL (eigen verbinding, buiten de pool). build() geeft
+    de live-state als {naam: data}; die wordt alleen opgebouwd als er
+    kijkers zijn, hooguit één keer per batch.
+    """
+    conn = None
+    while True:
+        try:
+            if conn is None:
+                conn = get_conn()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {LIVE_CHANNEL}")
+                # batches tijdens het (her)verbinden zijn gemist
+                broadcaster.invalidate()
+
+            if select.select([conn], [], [], LISTEN_POLL_S)[0]:
+                conn.poll()
+                if conn.notifies:
+                    conn.notifies.clear()
+                    # nieuwe data: niet wachten op de volgende versie-poll
+                    bump_data_version()
+                    broadcaster.invalidate()
+
+            if broadcaster.stale and broadcaster.subscribers:
+                broadcaster.publish(build())
+        except Exception as e:
+            print("Live listener error:", e)
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = None
+            time.sleep(LIVE_RETRY_S)
+
+
+def start(build):
+    """Start de listener-thread van dit proces (eenmalig)."""
+    global _thread_started
+    with _thread_lock:
+        if _thread_started:
+            return
+        threading.Thread(target=listen, args=(build,), daemon=True).start()
+        _thread_started = True
@@ -0,0 +1,191 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+# positions is per maand gepartitioneerd op ts (unix epoch seconden).
+# Partities heten positions_yYYYYmMM en worden door de collector-leader
+# aangemaakt (deze en volgende maand) en na RETENTION_DAYS weer gedropt,
+# maar pas nadat hun dagen in position_days zijn samengevat.
+RETENTION_DAYS = int(os.environ.get("RETENTION_DAYS", "0"))  # 0 = alles bewaren
+MAINTENANCE_INTERVAL_S = int(os.environ.get("MAINTENANCE_INTERVAL_S", "3600"))
+
+PARTITION_PREFIX = "positions_y"
+
+
+def month_start(dt):
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(dt):
+    return (dt.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def partition_name(start):
+    return f"{PARTITION_PREFIX}{start.year:04d}m{start.month:02d}"
+
+
+def partition_bounds(name):
+    """(start_ts, end_ts) uit een partitienaam, of None voor andere tabellen."""
+    if not name.startswith(PARTITION_PREFIX):
+        return None
+    try:
+        start = datetime.strptime(name[len(PARTITION_PREFIX):], "%Ym%m")
+    except ValueError:
+        return None
+    start = start.replace(tzinfo=timezone.utc)
+    return int(start.timestamp()), int(next_month(start).timestamp())
+
+
+def ensure_partitions(cur, from_ts, to_ts):
+    """Maak maandpartities aan die [from_ts, to_ts] afdekken."""
+    month = month_start(datetime.fromtimestamp(from_ts, tz=timezone.utc))
+    end = datetime.fromtimestamp(to_ts, tz=timezone.utc)
+    while month <= end:
+        following = next_month(month)
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {partition_name(month)}
+            PARTITION OF positions
+            FOR VALUES FROM ({int(month.timestamp())}) TO ({int(following.timestamp())});
+        """)
+        month = following
+
+
+def list_partitions(cur):
+    cur.execute("""
+        SELECT c.relname AS name
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'positions'
+        ORDER BY c.relname;
+    """)
+    return [r["name"] for r in cur.fetchall()]
+
+
+# -------------------------------------------------------------------
+# Eenmalige migratie van de oude, ongepartitioneerde positions-tabel
+# -------------------------------------------------------------------
+def detach_legacy_positions(cur):
+    """
+    Hernoem een ongepartitioneerde positions-tabel naar positions_legacy,
+    zodat schema.sql de gepartitioneerde versie kan aanmaken. Geeft True
+    terug als er een legacy-tabel is om te importeren.
+    """
+    cur.execute("""
+        SELECT relkind FROM pg_class
+        WHERE relname = 'positions' AND relnamespace = 'public'::regnamespace;
+    """)
+    row = cur.fetchone()
+    if row is None or row["relkind"] != "r":
+        cur.execute("SELECT to_regclass('positions_legacy') IS NOT NULL AS pending")
+        return cur.fetchone()["pending"]
+
+    print("Migrating positions to a partitioned table...")
+    cur.execute("""
+        ALTER TABLE positions RENAME TO positions_legacy;
+        ALTER TABLE positions_legacy ALTER COLUMN id DROP DEFAULT;
+        ALTER SEQUENCE positions_id_seq OWNED BY NONE;
+        ALTER SEQUENCE positions_id_seq AS BIGINT;
+        DROP INDEX IF EXISTS idx_ts;
+        DROP INDEX IF EXISTS idx_icao;
+        DROP INDEX IF EXISTS uq_positions_icao_ts;
+    """)
+    return True
+
+
+def import_legacy_positions(cur):
+    cur.execute("SELECT MIN(ts) AS lo, MAX(ts) AS hi FROM positions_legacy")
+    row = cur.fetchone()
+    if row["lo"] is not None:
+        ensure_partitions(cur, row["lo"], row["hi"])
+    cur.execute("""
+        INSERT INTO positions (id, icao, callsign, ts, lat, lon, alt_ft, gs_kts)
+        SELECT id, icao, callsign, ts, lat, lon, alt_ft, gs_kts
+        FROM positions_legacy
+        WHERE ts IS NOT NULL
+        ON CONFLICT (icao, ts) DO NOTHING;
+    """)
+    print("Imported", cur.rowcount, "legacy positions")
+    cur.execute("DROP TABLE positions_legacy")
+
+
+# -------------------------------------------------------------------
+# Rollup per dag en retentie
+# -------------------------------------------------------------------
+def rollup_days(cur, now):
+    """
+    Vat alle volledige (UTC-)dagen die nog niet in position_days staan
+    samen. De laatst samengevatte dag wordt opnieuw berekend, voor het geval
+    er nog late metingen bij zijn gekomen.
+    """
+    today = int(
+        datetime.fromtimestamp(now, tz=timezone.utc)
+        .replace(hour=0, minute=0, second=0, microsecond=0)
+        .timestamp()
+    )
+    cur.execute("""
+        SELECT COALESCE(
+          (SELECT EXTRACT(EPOCH FROM MAX(day)::TIMESTAMP)::BIGINT FROM position_days),
+          (SELECT MIN(ts) - MIN(ts) % 86400 FROM positions)
+        ) AS start_ts;
+    """)
+    start_ts = cur.fetchone()["start_ts"]
+    if start_ts is None or start_ts >= today:
+        return 0
+
+    return summarize_days(cur, start_ts, today)
+
+
+def summarize_days(cur, from_ts, to_ts):
+    """(Her)bereken position_days voor de dagen in [from_ts, to_ts)."""
+    cur.execute("""
+        INSERT INTO position_days (day, points, aircraft, callsigns, first_ts, last_ts)
+        SELECT
+          (to_timestamp(ts) AT TIME ZONE 'UTC')::DATE AS day,
+          COUNT(*),
+          COUNT(DISTINCT icao),
+          COUNT(DISTINCT NULLIF(callsign, '')),
+          MIN(ts),
+          MAX(ts)
+        FROM positions
+        WHERE ts >= %s AND ts < %s
+        GROUP BY day
+        ON CONFLICT (day) DO UPDATE SET
+          points = EXCLUDED.points,
+          aircraft = EXCLUDED.aircraft,
+          callsigns = EXCLUDED.callsigns,
+          first_ts = EXCLUDED.first_ts,
+          last_ts = EXCLUDED.last_ts;
+    """, (from_ts, to_ts))
+    return cur.rowcount
+
+
+def apply_retention(cur, now, days=None):
+    """Drop partities die helemaal ouder zijn dan `days` en al samengevat zijn."""
+    if days is None:
+        days = RETENTION_DAYS
+    if days <= 0:
+        return []
+
+    cur.execute("""
+        SELECT EXTRACT(EPOCH FROM (MAX(day) + 1)::TIMESTAMP)::BIGINT AS rolled_until
+        FROM position_days;
+    """)
+    rolled_until = cur.fetchone()["rolled_until"] or 0
+    cutoff = min(now - days * 86400, rolled_until)
+
+    dropped = []
+    for name in list_partitions(cur):
+        bounds = partition_bounds(name)
+        if bounds is not None and bounds[1] <= cutoff:
+            cur.execute(f"DROP TABLE {name}")
+            dropped.append(name)
+    return dropped
+
+
+def maintain(cur, now):
+    """Periodiek onderhoud door de collector-leader."""
+    ensure_partitions(cur, now, now + 32 * 86400)
+    rolled = rollup_days(cur, now)
+    dropped = apply_retention(cur, now)
+    if rolled or dropped:
+        print(f"Maintenance: rolled up {rolled} days, dropped {dropped or 'nothing'}")
@@ -0,0 +1,66 @@
+import json
+
+# Regio's die de collector pollt: per regio een centrum, een ophaalstraal
+# (NM, voor de adsb.fi-URL), een opslagstraal en een statistieken-bubbel
+# (km). Een meting hoort bij de dichtstbijzijnde regio binnen wier
+# opslagstraal hij valt; dist_km en in_bubble gelden t.o.v. die regio.
+#
+# Configuratie via REGIONS (env), een JSON-lijst, bv.
+#   [{"name": "arnhem", "lat": 51.9851, "lon": 5.8987},
+#    {"name": "nijmegen", "lat": 51.8126, "lon": 5.8372, "bubble_km": 5}]
+# Velden die ontbreken krijgen de standaardwaarden van Region.
+
+ADSB_BASE_URL = "https://opendata.adsb.fi/api/v3"
+
+
+class Region:
+    def __init__(self, name, lat, lon, fetch_nm=10, track_km=20.0, bubble_km=7.5, url=None):
+        if not name or not isinstance(name, str) or "/" in name:
+            raise ValueError(f"invalid region name {name!r}")
+        if not 0 < bubble_km <= track_km:
+            raise ValueError(f"region {name}: need 0 < bubble_km <= track_km")
+        self.name = name
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self.fetch_nm = fetch_nm
+        self.track_km = float(track_km)
+        self.bubble_km = float(bubble_km)
+        self.url = url or f"{ADSB_BASE_URL}/lat/{self.lat}/lon/{self.lon}/dist/{fetch_nm}"
+
+    def __repr__(self):
+        return f"Region({self.name!r}, {self.lat}, {self.lon})"
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "lat": self.lat,
+            "lon": self.lon,
+            "fetch_nm": self.fetch_nm,
+            "track_km": self.track_km,
+            "bubble_km": self.bubble_km,
+        }
+
+
+def parse(text):
+    """Regio's uit de JSON van REGIONS."""
+    try:
+        items = json.loads(text)
+    except ValueError as e:
+        raise ValueError(f"REGIONS is not valid JSON: {e}") from None
+    if not isinstance(items, list) or not items:
+        raise ValueError("REGIONS must be a non-empty JSON list")
+
+    regions = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError("REGIONS entries must be objects")
+        try:
+            regions.append(Region(**item))
+        except TypeError as e:
+            raise ValueError(f"REGIONS entry {item!r}: {e}") from None
+
+    names = [r.name for r in regions]
+    if len(set(names)) != len(names):
+        raise ValueError("REGIONS names must be unique")
+    return regions
+
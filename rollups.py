@@ -0,0 +1,212 @@
+from collections import Counter
+from datetime import date, datetime, timezone
+
+import psycopg2.extras
+
+from segmentation import TS_MAX
+
+# Rollups van unieke vluchten in de bubbel, per UTC-dag, per dag × uur en
+# per callsign × dag (gedateerd op bubble_ts, net als segmentation.FlightSet).
+#
+# Alleen afgesloten vluchten staan erin: de collector telt een vlucht op
+# in dezelfde transactie waarin hij closed wordt (zie add_flights). Open
+# vluchten (idx_flights_open) komen er bij het opvragen bij. Zo zijn
+# daily_counts, hourly_heatmap, stats en top_callsigns O(dagen) in plaats
+# van O(vluchten).
+
+TABLES = "flight_days, flight_day_hours, flight_callsign_days"
+
+DAY_UPSERT_SQL = """
+    INSERT INTO flight_days AS r (day, flights) VALUES %s
+    ON CONFLICT (day) DO UPDATE SET flights = r.flights + EXCLUDED.flights;
+"""
+
+DAY_HOUR_UPSERT_SQL = """
+    INSERT INTO flight_day_hours AS r (day, hour, flights) VALUES %s
+    ON CONFLICT (day, hour) DO UPDATE SET flights = r.flights + EXCLUDED.flights;
+"""
+
+CALLSIGN_DAY_UPSERT_SQL = """
+    INSERT INTO flight_callsign_days AS r (callsign, day, flights) VALUES %s
+    ON CONFLICT (callsign, day) DO UPDATE SET flights = r.flights + EXCLUDED.flights;
+"""
+
+# Eenmalig, als de rollup-tabellen net zijn aangemaakt
+FILL_SQL = """
+    WITH closed AS (
+      SELECT
+        callsign,
+        (to_timestamp(bubble_ts) AT TIME ZONE 'UTC') AS t
+      FROM flights
+      WHERE closed
+        AND in_bubble
+    ),
+    days AS (
+      INSERT INTO flight_days (day, flights)
+      SELECT t::DATE, COUNT(*) FROM closed GROUP BY 1
+    ),
+    day_hours AS (
+      INSERT INTO flight_day_hours (day, hour, flights)
+      SELECT t::DATE, EXTRACT(HOUR FROM t), COUNT(*) FROM closed GROUP BY 1, 2
+    )
+    INSERT INTO flight_callsign_days (callsign, day, flights)
+    SELECT callsign, t::DATE, COUNT(*) FROM closed GROUP BY 1, 2;
+"""
+
+# Open vluchten in de bubbel binnen het venster, als (dag, uur, callsign)
+OPEN_FLIGHTS_SQL = """
+    WITH open AS (
+      SELECT
+        callsign,
+        (to_timestamp(bubble_ts) AT TIME ZONE 'UTC') AS t
+      FROM flights
+      WHERE NOT closed
+        AND in_bubble
+        AND bubble_ts >= %(from_ts)s
+        AND bubble_ts < %(to_ts)s
+    )
+"""
+
+DAILY_SQL = OPEN_FLIGHTS_SQL + """
+    SELECT to_char(day, 'YYYY-MM-DD') AS day, SUM(flights)::INTEGER AS flights
+    FROM (
+      SELECT day, flights
+      FROM flight_days
+      WHERE day >= %(from_day)s AND day < %(to_day)s
+      UNION ALL
+      SELECT t::DATE, 1 FROM open
+    ) d
+    GROUP BY day
+    ORDER BY day
+    LIMIT %(limit)s;
+"""
+
+HOURLY_SQL = OPEN_FLIGHTS_SQL + """
+    SELECT
+      EXTRACT(DOW FROM day)::INTEGER AS dow,
+      hour::INTEGER AS hour,
+      SUM(flights)::INTEGER AS flights
+    FROM (
+      SELECT day, hour, flights
+      FROM flight_day_hours
+      WHERE day >= %(from_day)s AND day < %(to_day)s
+      UNION ALL
+      SELECT t::DATE, EXTRACT(HOUR FROM t), 1 FROM open
+    ) h
+    GROUP BY 1, 2
+    ORDER BY 1, 2;
+"""
+
+CALLSIGNS_SQL = OPEN_FLIGHTS_SQL + """
+    SELECT callsign, SUM(flights)::INTEGER AS flights
+    FROM (
+      SELECT callsign, flights
+      FROM flight_callsign_days
+      WHERE day >= %(from_day)s AND day < %(to_day)s
+      UNION ALL
+      SELECT callsign, 1 FROM open
+    ) c
+    GROUP BY callsign
+    ORDER BY flights DESC, callsign
+    LIMIT %(limit)s OFFSET %(offset)s;
+"""
+
+PERIOD_SQL = """
+    SELECT
+      GREATEST(
+        LEAST(
+          (SELECT MIN(first_ts) FROM position_days
+           WHERE last_ts >= %(from_ts)s AND first_ts < %(to_ts)s),
+          (SELECT MIN(ts) FROM positions
+           WHERE ts >= %(from_ts)s AND ts < %(to_ts)s)
+        ),
+        %(from_ts)s
+      ) AS first_ts,
+      (SELECT MAX(ts) FROM positions
+       WHERE ts >= %(from_ts)s AND ts < %(to_ts)s) AS last_ts;
+"""
+
+
+# -------------------------------------------------------------------
+# Bijwerken (collector)
+# -------------------------------------------------------------------
+def add_flights(cur, flights, sign=1):
+    """Tel afgesloten vluchten (dicts met FLIGHT_COLUMNS) op in de rollups."""
+    days = Counter()
+    day_hours = Counter()
+    callsign_days = Counter()
+    for f in flights:
+        if not f["in_bubble"]:
+            continue
+        t = datetime.fromtimestamp(f["bubble_ts"], tz=timezone.utc)
+        days[t.date()] += sign
+        day_hours[(t.date(), t.hour)] += sign
+        callsign_days[(f["callsign"], t.date())] += sign
+
+    if days:
+        psycopg2.extras.execute_values(
+            cur, DAY_UPSERT_SQL, [(d, c) for d, c in days.items()]
+        )
+        psycopg2.extras.execute_values(
+            cur, DAY_HOUR_UPSERT_SQL, [(d, h, c) for (d, h), c in day_hours.items()]
+        )
+        psycopg2.extras.execute_values(
+            cur, CALLSIGN_DAY_UPSERT_SQL, [(cs, d, c) for (cs, d), c in callsign_days.items()]
+        )
+    return sum(days.values())
+
+
+def remove_flights(cur, flights):
+    """Trek vluchten weer af (backfill.rebuild); lege rijen verdwijnen."""
+    removed = -add_flights(cur, flights, sign=-1)
+    if removed:
+        for table in TABLES.split(", "):
+            cur.execute(f"DELETE FROM {table} WHERE flights <= 0")
+    return removed
+
+
+def fill(cur):
+    cur.execute(FILL_SQL)
+
+
+# -------------------------------------------------------------------
+# Opvragen (web)
+# -------------------------------------------------------------------
+def covers(from_ts, to_ts):
+    """Rollups zijn per dag: alleen bruikbaar voor vensters op daggrenzen."""
+    return all(ts is None or ts % 86400 == 0 for ts in (from_ts, to_ts))
+
+
+def window_params(from_ts, to_ts):
+    def day(ts, default):
+        if ts is None:
+            return default
+        return datetime.fromtimestamp(ts, tz=timezone.utc).date()
+
+    return {
+        "from_ts": 0 if from_ts is None else from_ts,
+        "to_ts": TS_MAX if to_ts is None else to_ts,
+        "from_day": day(from_ts, date.min),
+        "to_day": day(to_ts, date.max),
+    }
+
+
+def daily_counts(cur, from_ts=None, to_ts=None, limit=None):
+    cur.execute(DAILY_SQL, dict(window_params(from_ts, to_ts), limit=limit))
+    return [dict(r) for r in cur.fetchall()]
+
+
+def hourly_heatmap(cur, from_ts=None, to_ts=None):
+    cur.execute(HOURLY_SQL, window_params(from_ts, to_ts))
+    return [dict(r) for r in cur.fetchall()]
+
+
+def top_callsigns(cur, from_ts=None, to_ts=None, n=10, offset=0):
+    cur.execute(CALLSIGNS_SQL, dict(window_params(from_ts, to_ts), limit=n, offset=offset))
+    return [dict(r) for r in cur.fetchall()]
+
+
+def period(cur, from_ts=None, to_ts=None):
+    cur.execute(PERIOD_SQL, window_params(from_ts, to_ts))
+    row = cur.fetchone()
+    return row["first_ts"], row["last_ts"]
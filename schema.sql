@@ -1,13 +1,172 @@
+-- Partitioned by month on ts; partitions are created and dropped by
+-- partitions.py (positions_yYYYYmMM).
+CREATE SEQUENCE IF NOT EXISTS positions_id_seq AS BIGINT;
+
 CREATE TABLE IF NOT EXISTS positions (
-    id SERIAL PRIMARY KEY,
+    id BIGINT NOT NULL DEFAULT nextval('positions_id_seq'),
     icao TEXT,
     callsign TEXT,
-    ts BIGINT,        -- unix epoch seconds
+    ts BIGINT NOT NULL,        -- unix epoch seconds
     lat DOUBLE PRECISION,
     lon DOUBLE PRECISION,
     alt_ft DOUBLE PRECISION,
     gs_kts DOUBLE PRECISION
-);
+) PARTITION BY RANGE (ts);
+
+ALTER SEQUENCE positions_id_seq OWNED BY positions.id;
+
+-- Distance to the Arnhem center and bubble membership, computed at insert
+ALTER TABLE positions ADD COLUMN IF NOT EXISTS dist_km REAL;
+ALTER TABLE positions ADD COLUMN IF NOT EXISTS in_bubble BOOLEAN;
+
+-- Collector region (regions.py) the measurement belongs to; dist_km and
+-- in_bubble are relative to its center. Rows from before regions existed
+-- are all from the default region.
+ALTER TABLE positions ADD COLUMN IF NOT EXISTS region TEXT NOT NULL DEFAULT 'arnhem';
 
 CREATE INDEX IF NOT EXISTS idx_ts ON positions(ts);
-CREATE INDEX IF NOT EXISTS idx_icao ON positions(icao);
+
+-- No query reads positions by in_bubble (bubble queries go through flights)
+DROP INDEX IF EXISTS idx_positions_bubble;
+
+-- Serves every "PARTITION BY callsign ORDER BY ts" window and the per-flight
+-- track lookups as an (index-only) scan in the right order, so no sort is
+-- needed. Check with `python checks.py`.
+CREATE INDEX IF NOT EXISTS idx_positions_callsign_ts
+    ON positions(callsign, ts)
+    INCLUDE (gs_kts, alt_ft, lat, lon, in_bubble)
+    WHERE callsign <> '';
+
+-- icao lookups are covered by uq_positions_icao_ts; nothing queries icao alone
+DROP INDEX IF EXISTS idx_icao;
+
+-- One row per flight (callsign + flight_seq), maintained by save_positions.
+-- A new flight starts when a callsign has not been seen for more than 3600 s.
+CREATE TABLE IF NOT EXISTS flights (
+    callsign TEXT NOT NULL,
+    flight_seq INTEGER NOT NULL,
+    first_ts BIGINT NOT NULL,
+    last_ts BIGINT NOT NULL,
+    in_bubble BOOLEAN NOT NULL DEFAULT FALSE,
+    bubble_ts BIGINT,            -- last measurement inside the bubble
+    gs_kts DOUBLE PRECISION,     -- speed at bubble_ts
+    alt_ft DOUBLE PRECISION,     -- altitude at bubble_ts
+    PRIMARY KEY (callsign, flight_seq)
+);
+
+CREATE INDEX IF NOT EXISTS idx_flights_last_ts ON flights(last_ts);
+CREATE INDEX IF NOT EXISTS idx_flights_bubble_ts ON flights(bubble_ts) WHERE in_bubble;
+
+-- Maintained by the collector's streaming segmenter: number of polls in
+-- which the flight was seen, and whether the 3600 s gap has closed it.
+ALTER TABLE flights ADD COLUMN IF NOT EXISTS points INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE flights ADD COLUMN IF NOT EXISTS closed BOOLEAN NOT NULL DEFAULT FALSE;
+CREATE INDEX IF NOT EXISTS idx_flights_open ON flights(last_ts) WHERE NOT closed;
+
+-- Region of the flight's last bubble measurement (or of its last measurement
+-- if it never entered a bubble); serves the per-region stats endpoints.
+ALTER TABLE flights ADD COLUMN IF NOT EXISTS region TEXT NOT NULL DEFAULT 'arnhem';
+CREATE INDEX IF NOT EXISTS idx_flights_region_bubble_ts
+    ON flights(region, bubble_ts) WHERE in_bubble;
+
+-- Singleton row bumped by the collector after every batch; web workers poll
+-- it to invalidate their response caches.
+CREATE TABLE IF NOT EXISTS ingest_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    data_version BIGINT NOT NULL DEFAULT 0,
+    updated_ts BIGINT            -- unix epoch seconds of the last batch
+);
+
+INSERT INTO ingest_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+-- Ingest counters, accumulated over all batches (see dedup.ChangeFilter)
+ALTER TABLE ingest_state ADD COLUMN IF NOT EXISTS rows_seen BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE ingest_state ADD COLUMN IF NOT EXISTS rows_suppressed BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE ingest_state ADD COLUMN IF NOT EXISTS rows_written BIGINT NOT NULL DEFAULT 0;
+
+-- Replay of the collector's local spool (spool.py) after a database outage:
+-- batches replayed, batches dropped because the spool was full, and the age
+-- of the oldest batch in the last replayed chunk.
+ALTER TABLE ingest_state ADD COLUMN IF NOT EXISTS replayed_batches BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE ingest_state ADD COLUMN IF NOT EXISTS spool_dropped BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE ingest_state ADD COLUMN IF NOT EXISTS replay_lag_s BIGINT;
+
+-- Backlog in the spool at the last write (batches / bytes still to replay).
+ALTER TABLE ingest_state ADD COLUMN IF NOT EXISTS spool_pending_batches BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE ingest_state ADD COLUMN IF NOT EXISTS spool_pending_bytes BIGINT NOT NULL DEFAULT 0;
+
+-- At most one measurement per aircraft per poll. Existing duplicates are
+-- removed once, before the index is created.
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_indexes
+    WHERE tablename = 'positions' AND indexname = 'uq_positions_icao_ts'
+  ) THEN
+    DELETE FROM positions a
+    USING positions b
+    WHERE a.icao = b.icao
+      AND a.ts = b.ts
+      AND a.id > b.id;
+    CREATE UNIQUE INDEX uq_positions_icao_ts ON positions(icao, ts);
+  END IF;
+END $$;
+
+-- Per-day summary of raw positions (UTC days), kept after retention has
+-- dropped the underlying partitions.
+CREATE TABLE IF NOT EXISTS position_days (
+    day DATE PRIMARY KEY,
+    points BIGINT NOT NULL,
+    aircraft INTEGER NOT NULL,
+    callsigns INTEGER NOT NULL,
+    first_ts BIGINT NOT NULL,
+    last_ts BIGINT NOT NULL
+);
+
+-- Rollups of closed in-bubble flights, dated by bubble_ts (UTC). Updated by
+-- the collector in the same transaction that closes a flight (rollups.py).
+CREATE TABLE IF NOT EXISTS flight_days (
+    day DATE PRIMARY KEY,
+    flights INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS flight_day_hours (
+    day DATE NOT NULL,
+    hour SMALLINT NOT NULL,
+    flights INTEGER NOT NULL,
+    PRIMARY KEY (day, hour)
+);
+
+CREATE TABLE IF NOT EXISTS flight_callsign_days (
+    callsign TEXT NOT NULL,
+    day DATE NOT NULL,
+    flights INTEGER NOT NULL,
+    PRIMARY KEY (callsign, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_flight_callsign_days_day ON flight_callsign_days(day);
+
+-- Files imported by backfill.py, committed together with their rows so an
+-- interrupted import resumes where it stopped.
+CREATE TABLE IF NOT EXISTS backfill_files (
+    path TEXT PRIMARY KEY,
+    rows INTEGER NOT NULL,       -- positions kept after filtering
+    imported_ts BIGINT NOT NULL  -- unix epoch seconds
+);
+
+-- Every measurement of the last saved batch, including the ones the change
+-- filter skipped: the aircraft currently in range, for /api/live. Replaced
+-- by the collector in the batch's transaction; nothing here needs to survive
+-- a crash.
+CREATE UNLOGGED TABLE IF NOT EXISTS live_positions (
+    icao TEXT,
+    callsign TEXT,
+    ts BIGINT NOT NULL,
+    lat DOUBLE PRECISION,
+    lon DOUBLE PRECISION,
+    alt_ft DOUBLE PRECISION,
+    gs_kts DOUBLE PRECISION,
+    dist_km REAL,
+    in_bubble BOOLEAN,
+    region TEXT NOT NULL
+);
@@ -0,0 +1,540 @@
+import math
+import random
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+
+from cache import data_version
+from db import cursor, iter_rows
+
+# Eén gedeelde set "unieke vluchten in de bubbel" per data-versie.
+#
+# Het dashboard laadt stats, daily_counts, hourly_heatmap, top_callsigns,
+# hist_speed, hist_altitude en scatter tegelijk; die leiden allemaal af
+# uit dezelfde vluchten. FlightSet haalt die één keer op (één query) en
+# de aggregaties hieronder rekenen in Python verder.
+#
+# Dagen en uren zijn in UTC.
+#
+# Met een tijdvenster [from_ts, to_ts) gaat het venster mee de query in:
+# flights via de range op idx_flights_bubble_ts, positions via partition
+# pruning + idx_ts. Zo raakt "de laatste 7 dagen" alleen die 7 dagen.
+
+TS_MAX = 2 ** 62
+
+FLIGHTS_SQL = """
+    WITH period AS (
+      SELECT
+        GREATEST(
+          LEAST(
+            (SELECT MIN(first_ts) FROM position_days
+             WHERE last_ts >= %(from_ts)s AND first_ts < %(to_ts)s),
+            (SELECT MIN(ts) FROM positions
+             WHERE ts >= %(from_ts)s AND ts < %(to_ts)s)
+          ),
+          %(from_ts)s
+        ) AS first_ts,
+        (SELECT MAX(ts) FROM positions
+         WHERE ts >= %(from_ts)s AND ts < %(to_ts)s) AS last_ts
+    )
+    SELECT
+      p.first_ts,
+      p.last_ts,
+      f.callsign,
+      f.bubble_ts,
+      f.gs_kts,
+      f.alt_ft
+    FROM period p
+    LEFT JOIN flights f
+      ON f.in_bubble
+     AND f.bubble_ts >= %(from_ts)s
+     AND f.bubble_ts < %(to_ts)s
+    ORDER BY f.bubble_ts, f.callsign COLLATE "C";
+"""
+
+
+class FlightSet:
+    """Per-vlucht records (laatste meting in de bubbel), oplopend op (ts, callsign)."""
+
+    def __init__(self, rows):
+        self.first_ts = rows[0]["first_ts"] if rows else None
+        self.last_ts = rows[0]["last_ts"] if rows else None
+        rows = [r for r in rows if r["callsign"] is not None]
+
+        self.callsign = [r["callsign"] for r in rows]
+        self.ts = [r["bubble_ts"] for r in rows]
+        self.gs_kts = [r["gs_kts"] for r in rows]
+        self.alt_ft = [r["alt_ft"] for r in rows]
+
+        # dag-/uurindeling één keer uitrekenen (UTC, zondag = 0 zoals DOW)
+        day_names = {}
+        self.day = []
+        self.dow = []
+        self.hour = []
+        for ts in self.ts:
+            epoch_day = ts // 86400
+            name = day_names.get(epoch_day)
+            if name is None:
+                name = datetime.fromtimestamp(
+                    epoch_day * 86400, tz=timezone.utc
+                ).strftime("%Y-%m-%d")
+                day_names[epoch_day] = name
+            self.day.append(name)
+            self.dow.append((epoch_day + 4) % 7)  # 1970-01-01 was een donderdag
+            self.hour.append(ts % 86400 // 3600)
+
+    def __len__(self):
+        return len(self.ts)
+
+
+# per data-versie de FlightSets van de laatst gebruikte vensters
+MAX_WINDOWS = 8
+
+_current = (None, OrderedDict())  # (data-versie, {(from_ts, to_ts): FlightSet})
+_load_lock = threading.Lock()
+
+
+def load(from_ts=None, to_ts=None):
+    with cursor() as cur:
+        cur.execute(FLIGHTS_SQL, {
+            "from_ts": 0 if from_ts is None else from_ts,
+            "to_ts": TS_MAX if to_ts is None else to_ts,
+        })
+        return FlightSet(cur.fetchall())
+
+
+def reset():
+    """Vergeet de bewaarde FlightSets (bv. voor een koude meting in bench.py)."""
+    global _current
+    with _load_lock:
+        _current = (None, OrderedDict())
+
+
+def current(from_ts=None, to_ts=None):
+    """
+    De FlightSet voor de huidige data-versie en het venster [from_ts, to_ts);
+    hooguit één query per versie per venster.
+    """
+    global _current
+    version, _ = data_version()
+    key = (from_ts, to_ts)
+    with _load_lock:
+        if _current[0] != version:
+            _current = (version, OrderedDict())
+        sets = _current[1]
+        fs = sets.get(key)
+        if fs is None:
+            fs = sets[key] = load(from_ts, to_ts)
+            while len(sets) > MAX_WINDOWS:
+                sets.popitem(last=False)
+        else:
+            sets.move_to_end(key)
+        return fs
+
+
+# -------------------------------------------------------------------
+# Helpers
+# -------------------------------------------------------------------
+def iso(ts):
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+def percentile(sorted_values, p):
+    """Lineair geïnterpoleerd percentiel van een gesorteerde lijst."""
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    lo, hi = math.floor(k), math.ceil(k)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def to_nl_date(ymd):
+    if not ymd:
+        return None
+    try:
+        dt = datetime.strptime(ymd, "%Y-%m-%d")
+        return dt.strftime("%d-%m-%Y")
+    except Exception:
+        return ymd  # fallback
+
+
+# -------------------------------------------------------------------
+# Aggregaties
+# -------------------------------------------------------------------
+def day_counts(fs):
+    """{dag: aantal} in chronologische volgorde."""
+    counts = {}
+    for day in fs.day:
+        counts[day] = counts.get(day, 0) + 1
+    return counts
+
+
+def daily_counts(fs):
+    return [{"day": d, "flights": c} for d, c in day_counts(fs).items()]
+
+
+def stats(fs):
+    return stats_from_days(day_counts(fs), fs.first_ts, fs.last_ts)
+
+
+def stats_from_days(counts_by_day, first_ts, last_ts):
+    """stats uit {dag: aantal} (chronologisch), bv. uit de rollups."""
+    days = len(counts_by_day)
+    median = 0
+    max_flights = 0
+    max_day = None
+
+    if days > 0:
+        counts = list(counts_by_day.values())
+        sorted_counts = sorted(counts)
+        mid = days // 2
+        if days % 2 == 1:
+            median = sorted_counts[mid]
+        else:
+            median = (sorted_counts[mid - 1] + sorted_counts[mid]) / 2
+
+        max_flights = max(counts)
+        for d, c in counts_by_day.items():
+            if c == max_flights:
+                max_day = d
+                break
+
+    return {
+        "total_flights": sum(counts_by_day.values()),
+        "first_ts": iso(first_ts),
+        "last_ts": iso(last_ts),
+        "days": days,
+        "median_per_day": median,
+        "max_per_day": max_flights,
+        "max_per_day_date": to_nl_date(max_day)
+    }
+
+
+def hourly_heatmap(fs):
+    counts = Counter(zip(fs.dow, fs.hour))
+    return [
+        {"dow": dow, "hour": hour, "flights": c}
+        for (dow, hour), c in sorted(counts.items())
+    ]
+
+
+def top_callsigns(fs, n=10, offset=0):
+    """Meeste vluchten eerst, bij gelijke stand op callsign (zoals de rollup)."""
+    ranked = sorted(Counter(fs.callsign).items(), key=lambda kv: (-kv[1], kv[0]))
+    return [
+        {"callsign": cs, "flights": c}
+        for cs, c in ranked[offset:offset + n]
+    ]
+
+
+# Ruwe per-vlucht waarden rechtstreeks uit de database gestreamd, in
+# FlightSet-volgorde; voor de ongelimiteerde responses (zie app.stream_json).
+VALUES_SQL = """
+    SELECT {columns}
+    FROM flights
+    WHERE in_bubble
+      AND bubble_ts >= %(from_ts)s
+      AND bubble_ts < %(to_ts)s
+      AND {not_null}
+    ORDER BY bubble_ts, callsign COLLATE "C";
+"""
+
+
+def iter_values(columns, from_ts=None, to_ts=None):
+    """Yieldt dicts met `columns` van vluchten waarvan geen kolom NULL is."""
+    sql = VALUES_SQL.format(
+        columns=", ".join(columns),
+        not_null=" AND ".join(f"{c} IS NOT NULL" for c in columns),
+    )
+    return iter_rows(sql, {
+        "from_ts": 0 if from_ts is None else from_ts,
+        "to_ts": TS_MAX if to_ts is None else to_ts,
+    })
+
+
+MAX_BINS = 1000
+MAX_CELLS = 10000
+
+
+def in_range(v, lo, hi):
+    return v is not None and (lo is None or v >= lo) and (hi is None or v < hi)
+
+
+def bin_range(v_min, v_max, width, lo=None, hi=None):
+    """
+    (lo, hi, aantal bins). Een ontbrekende grens wordt op hele bins rond
+    de data (v_min / v_max, None als er geen data is) afgerond.
+    """
+    if lo is None:
+        lo = math.floor(v_min / width) * width if v_min is not None else 0
+    if hi is None:
+        hi = (math.floor(v_max / width) + 1) * width if v_max is not None else lo
+    n_bins = max(math.ceil(round((hi - lo) / width, 9)), 0)  # 0.3 / 0.1 != 3
+    return lo, hi, n_bins
+
+
+def bin_index(v, lo, width, n_bins):
+    return min(int((v - lo) // width), n_bins - 1)
+
+
+def histogram(values, width, lo=None, hi=None, percentiles=()):
+    """
+    Tellingen per bin van `width` over [lo, hi). Zonder lo/hi wordt het
+    bereik op hele bins rond de data afgerond. De grootte van het resultaat
+    hangt alleen af van het aantal bins, niet van het aantal vluchten.
+    """
+    values = sorted(v for v in values if in_range(v, lo, hi))
+    lo, hi, n_bins = bin_range(
+        values[0] if values else None, values[-1] if values else None, width, lo, hi
+    )
+    if n_bins > MAX_BINS:
+        raise ValueError(f"too many bins ({n_bins} > {MAX_BINS})")
+
+    counts = [0] * n_bins
+    for v in values:
+        counts[bin_index(v, lo, width, n_bins)] += 1
+
+    return {
+        "bin_width": width,
+        "min": lo,
+        "max": hi,
+        "counts": counts,
+        "total": len(values),
+        "percentiles": {f"p{p:g}": percentile(values, p) for p in percentiles},
+    }
+
+
+def scatter_pairs(gs_values, alt_values, gs_range=(None, None), alt_range=(None, None)):
+    return [
+        (gs, alt)
+        for gs, alt in zip(gs_values, alt_values)
+        if in_range(gs, *gs_range) and in_range(alt, *alt_range)
+    ]
+
+
+def scatter_density(pairs, gs_width, alt_width, gs_range=(None, None), alt_range=(None, None)):
+    """
+    Aantal vluchten per cel van gs_width × alt_width. Alleen niet-lege
+    cellen komen terug, met de ondergrens van de cel.
+    """
+    gs_lo, gs_hi, gs_bins = bin_range(
+        min((p[0] for p in pairs), default=None),
+        max((p[0] for p in pairs), default=None),
+        gs_width, *gs_range,
+    )
+    alt_lo, alt_hi, alt_bins = bin_range(
+        min((p[1] for p in pairs), default=None),
+        max((p[1] for p in pairs), default=None),
+        alt_width, *alt_range,
+    )
+    if gs_bins * alt_bins > MAX_CELLS:
+        raise ValueError(f"too many cells ({gs_bins * alt_bins} > {MAX_CELLS})")
+
+    counts = Counter(
+        (bin_index(gs, gs_lo, gs_width, gs_bins), bin_index(alt, alt_lo, alt_width, alt_bins))
+        for gs, alt in pairs
+    )
+    return {
+        "gs_bin": gs_width,
+        "alt_bin": alt_width,
+        "gs_min": gs_lo,
+        "gs_max": gs_hi,
+        "alt_min": alt_lo,
+        "alt_max": alt_hi,
+        "total": len(pairs),
+        "cells": [
+            {"gs_kts": gs_lo + i * gs_width, "alt_ft": alt_lo + j * alt_width, "flights": c}
+            for (i, j), c in sorted(counts.items())
+        ],
+    }
+
+
+def scatter_sample(pairs, max_points, seed=0):
+    """
+    Reservoir-steekproef (algoritme R) van hooguit max_points punten. Met
+    een vaste seed is de steekproef per data-versie stabiel (en dus ook de
+    ETag).
+    """
+    rng = random.Random(seed)
+    reservoir = []
+    for n, pair in enumerate(pairs):
+        if n < max_points:
+            reservoir.append(pair)
+        else:
+            k = rng.randint(0, n)
+            if k < max_points:
+                reservoir[k] = pair
+    return {
+        "total": len(pairs),
+        "points": [{"gs_kts": gs, "alt_ft": alt} for gs, alt in reservoir],
+    }
+
+
+# Vaste bins en bereiken voor het dashboard: de verdelingen daar zijn
+# altijd even groot, hoeveel vluchten (of uitschieters) er ook zijn. De
+# ruwe waarden staan achter /api/hist_* en /api/scatter.
+DASHBOARD_GS_BIN = 10        # kts
+DASHBOARD_ALT_BIN = 1000     # ft
+DASHBOARD_SCATTER_GS_BIN = 20
+DASHBOARD_SCATTER_ALT_BIN = 1000
+DASHBOARD_GS_RANGE = (0, 1000)
+DASHBOARD_ALT_RANGE = (-2000, 60000)
+
+
+def distributions(fs):
+    """hist_speed, hist_altitude en scatter (dichtheid) voor het dashboard."""
+    pairs = scatter_pairs(fs.gs_kts, fs.alt_ft, DASHBOARD_GS_RANGE, DASHBOARD_ALT_RANGE)
+    return {
+        "hist_speed": histogram(fs.gs_kts, DASHBOARD_GS_BIN, *DASHBOARD_GS_RANGE),
+        "hist_altitude": histogram(fs.alt_ft, DASHBOARD_ALT_BIN, *DASHBOARD_ALT_RANGE),
+        "scatter": scatter_density(
+            pairs, DASHBOARD_SCATTER_GS_BIN, DASHBOARD_SCATTER_ALT_BIN,
+            DASHBOARD_GS_RANGE, DASHBOARD_ALT_RANGE,
+        ),
+    }
+
+
+def dashboard(fs):
+    """Alle dashboard-aggregaties in één keer, uit dezelfde FlightSet."""
+    return dict({
+        "stats": stats(fs),
+        "daily_counts": daily_counts(fs),
+        "hourly_heatmap": hourly_heatmap(fs),
+        "top_callsigns": top_callsigns(fs),
+    }, **distributions(fs))
+
+
+# -------------------------------------------------------------------
+# Streaming segmentatie in de collector
+# -------------------------------------------------------------------
+FLIGHT_GAP_S = 3600
+
+# Kolommen van een vlucht-record (zoals in de flights-tabel)
+FLIGHT_COLUMNS = (
+    "callsign", "flight_seq", "first_ts", "last_ts", "in_bubble",
+    "bubble_ts", "gs_kts", "alt_ft", "points", "closed", "region",
+)
+
+# Vluchten die in het laatste uur nog metingen hadden; de rest is dicht.
+# Op last_ts: een backfill geeft oude vluchten soms een hogere flight_seq.
+REBUILD_SQL = """
+    WITH recent AS (
+      SELECT DISTINCT callsign
+      FROM positions
+      WHERE ts >= %(since)s
+        AND callsign <> ''
+    )
+    SELECT DISTINCT ON (f.callsign) f.*
+    FROM recent r
+    JOIN flights f ON f.callsign = r.callsign
+    ORDER BY f.callsign, f.last_ts DESC;
+"""
+
+CLOSE_STALE_SQL = """
+    UPDATE flights SET closed = TRUE
+    WHERE NOT closed
+      AND last_ts < %(cutoff)s
+    RETURNING *;
+"""
+
+
+class StreamingSegmenter:
+    """
+    Houdt per callsign de open vlucht bij en past de 3600 s-gap-regel toe
+    terwijl batches binnenkomen, zonder window-queries.
+
+    feed() rekent een batch door zonder de state aan te passen; pas na een
+    geslaagde write zet apply() de nieuwe state vast (net als
+    dedup.ChangeFilter). Een vlucht-record is een dict met FLIGHT_COLUMNS;
+    een nieuwe vlucht heeft flight_seq None tot de database er een heeft
+    toegekend (apply).
+    """
+
+    def __init__(self, gap_s=FLIGHT_GAP_S):
+        self.gap_s = gap_s
+        self.open = {}  # callsign -> vlucht-record
+
+    def rebuild(self, cur, now):
+        """
+        State opnieuw opbouwen na een (her)start, uit alleen het laatste uur
+        van positions. Vluchten die daarbuiten nog open staan worden gesloten;
+        die worden teruggegeven als afgeronde vluchten.
+        """
+        cur.execute(REBUILD_SQL, {"since": now - self.gap_s})
+        self.open = {
+            r["callsign"]: {c: r[c] for c in FLIGHT_COLUMNS}
+            for r in cur.fetchall()
+            if not r["closed"] and now - r["last_ts"] <= self.gap_s
+        }
+        cur.execute(CLOSE_STALE_SQL, {"cutoff": now - self.gap_s})
+        return [{c: r[c] for c in FLIGHT_COLUMNS} for r in cur.fetchall()]
+
+    def feed(self, now, measurements):
+        """
+        measurements: (callsign, ts, in_bubble, gs_kts, alt_ft, region) per
+        callsign. Een vlucht houdt de regio van zijn laatste bubbel-meting,
+        of zolang hij geen bubbel raakte die van de laatste meting.
+        Geeft (gewijzigde open vluchten per callsign, afgeronde vluchten).
+        """
+        changed = {}
+        closed = []
+        for callsign, ts, in_bubble, gs_kts, alt_ft, region in measurements:
+            flight = changed.get(callsign) or self.open.get(callsign)
+            if flight is not None and ts - flight["last_ts"] > self.gap_s:
+                closed.append(dict(flight, closed=True))
+                flight = None
+
+            if flight is None:
+                # niet flight_seq + 1: na een backfill kan dat nummer al van
+                # een oudere vlucht zijn; de database kent MAX + 1 toe
+                flight = {
+                    "callsign": callsign,
+                    "flight_seq": None,
+                    "first_ts": ts,
+                    "last_ts": ts,
+                    "in_bubble": False,
+                    "bubble_ts": None,
+                    "gs_kts": None,
+                    "alt_ft": None,
+                    "points": 0,
+                    "closed": False,
+                    "region": region,
+                }
+            else:
+                flight = dict(flight)
+
+            flight["last_ts"] = max(flight["last_ts"], ts)
+            flight["points"] += 1
+            if in_bubble:
+                flight.update(
+                    in_bubble=True, bubble_ts=ts, gs_kts=gs_kts, alt_ft=alt_ft, region=region
+                )
+            elif not flight["in_bubble"]:
+                flight["region"] = region
+            changed[callsign] = flight
+
+        # vluchten die al langer dan de gap niets meer zagen afsluiten
+        for callsign, flight in self.open.items():
+            if callsign not in changed and now - flight["last_ts"] > self.gap_s:
+                closed.append(dict(flight, closed=True))
+
+        return changed, closed
+
+    def snapshot(self):
+        """State om met restore() terug te zetten als een transactie mislukt."""
+        return dict(self.open)
+
+    def restore(self, state):
+        self.open = dict(state)
+
+    def apply(self, changed, closed, assigned_seqs):
+        """assigned_seqs: callsign -> flight_seq voor nieuwe vluchten."""
+        for flight in closed:
+            if flight["callsign"] not in changed:
+                self.open.pop(flight["callsign"], None)
+        for callsign, flight in changed.items():
+            if flight["flight_seq"] is None:
+                flight["flight_seq"] = assigned_seqs[callsign]
+            self.open[callsign] = flight
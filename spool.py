@@ -0,0 +1,156 @@
+import json
+import os
+import struct
+import zlib
+from collections import deque
+
+# Lokale write-ahead spool van de collector: gefilterde batches die (nog)
+# niet in PostgreSQL staan, zodat een database-uitval geen data kost.
+#
+# Eén append-only bestand met records [lengte, crc32, JSON (fetched_ts,
+# rows)]; de leespositie staat in <pad>.offset. Een half geschreven record
+# aan het eind (crash tijdens append) wordt bij het openen weggegooid.
+# Records gaan er in volgorde uit (peek + consume ná een geslaagde
+# commit); een crash tussen commit en consume speelt ze opnieuw af, wat
+# positions via ON CONFLICT (icao, ts) opvangt.
+SPOOL_PATH = os.environ.get("SPOOL_PATH", "collector.spool")
+
+# Groeit het bestand hierboven, dan vallen de oudste batches af
+SPOOL_MAX_BYTES = int(os.environ.get("SPOOL_MAX_MB", "256")) * 1024 * 1024
+
+HEADER = struct.Struct(">II")  # lengte van de payload, crc32
+
+
+class Spool:
+    """Append-only spoolbestand met batches (fetched_ts, rows); niet thread-safe."""
+
+    def __init__(self, path=SPOOL_PATH, max_bytes=SPOOL_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.pending = deque()  # (offset, grootte) per nog niet verwerkt record
+        self.appended = 0
+        self.replayed = 0
+        self.dropped = 0
+        self._file = open(path, "a+b")
+        self._recover()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def pending_bytes(self):
+        return sum(size for _, size in self.pending)
+
+    def _recover(self):
+        """Indexeer de records vanaf de leespositie; een kapotte staart gaat eraf."""
+        end = self._file.seek(0, os.SEEK_END)
+        pos = self._read_offset()
+        if pos > end:
+            pos = 0
+        while pos + HEADER.size <= end:
+            self._file.seek(pos)
+            length, crc = HEADER.unpack(self._file.read(HEADER.size))
+            payload = self._file.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            self.pending.append((pos, HEADER.size + length))
+            pos += HEADER.size + length
+        if pos < end:
+            print(f"Spool: discarded {end - pos} bytes of incomplete records")
+            self._file.truncate(pos)
+        if self.pending:
+            print(f"Spool: {len(self.pending)} batches pending from an earlier run")
+
+    def _read_offset(self):
+        try:
+            with open(self.path + ".offset") as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def _write_offset(self, offset):
+        tmp = self.path + ".offset.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+        os.replace(tmp, self.path + ".offset")
+
+    def _read(self, offset, size):
+        self._file.seek(offset + HEADER.size)
+        fetched_ts, rows = json.loads(self._file.read(size - HEADER.size))
+        return fetched_ts, [tuple(r) for r in rows]
+
+    def append(self, fetched_ts, rows):
+        payload = json.dumps([fetched_ts, rows], separators=(",", ":")).encode()
+        size = HEADER.size + len(payload)
+        if size > self.max_bytes:
+            self.dropped += 1
+            print(f"Spool: batch of {size} bytes exceeds SPOOL_MAX_MB, dropped")
+            return
+        self._make_room(size)
+
+        offset = self._file.seek(0, os.SEEK_END)
+        self._file.write(HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.pending.append((offset, size))
+        self.appended += 1
+
+    def _make_room(self, size):
+        """Houd het bestand onder max_bytes: oudste batches weg en de rest compacteren."""
+        if self._file.seek(0, os.SEEK_END) + size <= self.max_bytes:
+            return
+        pending_bytes = self.pending_bytes
+        while self.pending and pending_bytes + size > self.max_bytes * 3 // 4:
+            pending_bytes -= self.pending.popleft()[1]
+            self.dropped += 1
+        print(f"Spool: full, {self.dropped} batches dropped so far")
+
+        tmp = self.path + ".tmp"
+        moved = deque()
+        with open(tmp, "wb") as out:
+            for offset, record_size in self.pending:
+                self._file.seek(offset)
+                moved.append((out.tell(), record_size))
+                out.write(self._file.read(record_size))
+            out.flush()
+            os.fsync(out.fileno())
+        self._file.close()
+        os.replace(tmp, self.path)
+        self._write_offset(0)
+        self._file = open(self.path, "a+b")
+        self.pending = moved
+
+    def peek(self, n):
+        """De oudste (hooguit) n batches, zonder ze te verwijderen."""
+        return [self._read(offset, size) for offset, size in list(self.pending)[:n]]
+
+    def consume(self, n):
+        """Markeer de oudste n batches als verwerkt (na een geslaagde commit)."""
+        for _ in range(min(n, len(self.pending))):
+            self.pending.popleft()
+            self.replayed += 1
+        if self.pending:
+            self._write_offset(self.pending[0][0])
+        else:
+            # leeg: bestand weer vanaf nul
+            self._file.truncate(0)
+            self._write_offset(0)
+
+    def discard(self, n):
+        """Gooi de oudste n batches weg (bv. een batch die niet te schrijven is)."""
+        n = min(n, len(self.pending))
+        self.consume(n)
+        self.replayed -= n
+        self.dropped += n
+
+    def stats(self):
+        return {
+            "pending_batches": len(self.pending),
+            "pending_bytes": self.pending_bytes,
+            "appended": self.appended,
+            "replayed": self.replayed,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,272 @@
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psycopg2
+import pytest
+import requests
+
+import collector
+import regions
+from spool import Spool
+
+
+class StubFeed:
+    """
+    Lokale adsb.fi-stub. `responses` is een lijst (status, headers, ac) die
+    per request wordt afgelopen (de laatste blijft gelden); elke request
+    krijgt een monotonic timestamp in `hits`.
+    """
+
+    def __init__(self, responses, delay_s=0.0):
+        self.responses = list(responses)
+        self.delay_s = delay_s
+        self.hits = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.hits.append(time.monotonic())
+                time.sleep(stub.delay_s)
+                status, headers, ac = (
+                    stub.responses.pop(0) if len(stub.responses) > 1 else stub.responses[0]
+                )
+                body = json.dumps({"ac": ac}).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v3"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+AIRCRAFT = [{"hex": "484f6d", "flight": "KLM1234 ", "lat": 51.99, "lon": 5.90,
+             "alt_baro": 3000, "gs": 180, "seen_pos": 0.5}]
+
+
+@pytest.fixture
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(collector.random, "uniform", lambda a, b: 1.0)
+
+
+class DeadlineLock:
+    def __init__(self, seconds):
+        self.deadline = time.monotonic() + seconds
+
+    def held(self):
+        return time.monotonic() < self.deadline
+
+
+def use_feed(monkeypatch, feed, interval_s):
+    region = regions.Region("stub", 51.9851, 5.8987, url=feed.url)
+    monkeypatch.setattr(collector, "REGIONS", [region])
+    monkeypatch.setattr(collector, "POLL_INTERVAL_S", interval_s)
+
+
+def run_poll_loop(monkeypatch, feed, seconds, interval_s):
+    """poll_loop tegen de stub, `seconds` lang leader; geeft de batches terug."""
+    use_feed(monkeypatch, feed, interval_s)
+    batches = queue.Queue()
+    collector.poll_loop(DeadlineLock(seconds), batches)
+    out = []
+    while not batches.empty():
+        out.append(batches.get_nowait())
+    return out
+
+
+# -------------------------------------------------------------------
+# Backoff en Retry-After
+# -------------------------------------------------------------------
+def test_backoff_doubles_up_to_max(monkeypatch, no_jitter):
+    monkeypatch.setattr(collector, "POLL_INTERVAL_S", 10)
+    monkeypatch.setattr(collector, "BACKOFF_MAX_S", 300)
+    assert [collector.backoff_s(n) for n in (1, 2, 3, 4)] == [10, 20, 40, 80]
+    assert collector.backoff_s(20) == 300
+
+
+def test_retry_after_seconds_and_http_date():
+    def response(value):
+        r = requests.Response()
+        r.headers["Retry-After"] = value
+        return r
+
+    assert collector.retry_after_s(response("120")) == 120
+    assert collector.retry_after_s(response("-5")) == 0
+    assert collector.retry_after_s(response("Wed, 21 Oct 2015 07:28:00 GMT")) == 0
+    assert collector.retry_after_s(response("soon")) is None
+    assert collector.retry_after_s(None) is None
+
+
+def test_retry_after_overrides_shorter_backoff(monkeypatch, no_jitter):
+    monkeypatch.setattr(collector, "POLL_INTERVAL_S", 10)
+    r = requests.Response()
+    r.headers["Retry-After"] = "90"
+    assert collector.backoff_s(1, r) == 90
+    r.headers["Retry-After"] = "1"
+    assert collector.backoff_s(3, r) == 40
+
+
+# -------------------------------------------------------------------
+# Tegen een stub-server
+# -------------------------------------------------------------------
+def test_poll_cadence_does_not_drift(monkeypatch):
+    # elke fetch kost 50 ms; de cadans moet toch op 200 ms blijven
+    feed = StubFeed([(200, {}, AIRCRAFT)], delay_s=0.05)
+    try:
+        batches = run_poll_loop(monkeypatch, feed, seconds=1.1, interval_s=0.2)
+    finally:
+        feed.close()
+
+    hits = feed.hits
+    assert len(hits) >= 5
+    for k, t in enumerate(hits):
+        assert abs((t - hits[0]) - k * 0.2) < 0.08
+    assert len(batches) == len(hits)
+    assert batches[0][1] == AIRCRAFT
+
+
+def test_poll_backs_off_on_429_with_retry_after(monkeypatch, no_jitter):
+    feed = StubFeed([
+        (429, {"Retry-After": "1"}, []),
+        (200, {}, AIRCRAFT),
+    ])
+    try:
+        batches = run_poll_loop(monkeypatch, feed, seconds=1.5, interval_s=0.1)
+    finally:
+        feed.close()
+
+    # na de 429 pas na Retry-After (1 s) weer, niet na de 0,1 s-backoff
+    assert len(feed.hits) >= 2
+    assert feed.hits[1] - feed.hits[0] >= 0.95
+    # de mislukte poll levert geen batch op
+    assert len(batches) == len(feed.hits) - 1
+
+
+def test_poll_backs_off_exponentially_on_5xx(monkeypatch, no_jitter):
+    feed = StubFeed([(503, {}, [])])
+    try:
+        run_poll_loop(monkeypatch, feed, seconds=1.6, interval_s=0.1)
+    finally:
+        feed.close()
+
+    gaps = [b - a for a, b in zip(feed.hits, feed.hits[1:])]
+    # 0,1 -> 0,2 -> 0,4 -> 0,8 s (afgerond op de cadans)
+    assert len(gaps) >= 3
+    for gap, expected in zip(gaps, (0.1, 0.2, 0.4)):
+        assert gap >= expected - 0.02
+    assert gaps[2] > gaps[0] * 2
+
+
+# -------------------------------------------------------------------
+# Overlappende regio's
+# -------------------------------------------------------------------
+def test_merge_aircraft_keys_on_hex():
+    near = dict(AIRCRAFT[0], seen_pos=0.2)
+    far = dict(AIRCRAFT[0], hex="484F6D", seen_pos=3.0)
+    anonymous = {"flight": "X", "lat": 51.9, "lon": 5.9}
+    merged = collector.merge_aircraft([[far, anonymous], [near]])
+    assert merged == [near, anonymous]
+
+
+# -------------------------------------------------------------------
+# Leader-lock bij een database-herstart
+# -------------------------------------------------------------------
+class FakeConn:
+    """Verbinding met de advisory lock; alive=False = verbroken door de server."""
+
+    def __init__(self, locked):
+        self.locked = locked
+        self.alive = True
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if not self.conn.alive or self.conn.closed:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def fetchone(self):
+        return {"locked": self.conn.locked}
+
+
+def test_polling_continues_into_spool_while_database_restarts(monkeypatch, tmp_path):
+    feed = StubFeed([(200, {}, AIRCRAFT)])
+    use_feed(monkeypatch, feed, interval_s=0.1)
+    monkeypatch.setattr(collector, "SPOOL_RETRY_S", 60)
+
+    def save_batches(*args, **kwargs):
+        raise psycopg2.OperationalError("could not connect to server")
+
+    monkeypatch.setattr(collector, "save_batches", save_batches)
+
+    # lock-verbinding valt na 0,3 s weg; tot 1,0 s is de database onbereikbaar,
+    # daarna blijkt een andere sessie de lock te hebben
+    started = time.monotonic()
+    lock = collector.LeaderLock()
+    lock.conn = FakeConn(locked=True)
+    threading.Timer(0.3, lambda: setattr(lock.conn, "alive", False)).start()
+
+    def get_conn():
+        if time.monotonic() - started < 1.0:
+            raise psycopg2.OperationalError("could not connect to server")
+        return FakeConn(locked=False)
+
+    monkeypatch.setattr(collector, "get_conn", get_conn)
+
+    spool = Spool(str(tmp_path / "s"))
+    batches = queue.Queue()
+    writer = threading.Thread(target=collector.writer_loop, args=(batches, spool))
+    writer.start()
+    try:
+        collector.poll_loop(lock, batches)
+    finally:
+        feed.close()
+        # wat bij het aftreden nog in de queue stond gaat ook naar de spool
+        collector.stop_writer(batches, writer, spool)
+
+    stopped = time.monotonic() - started
+    assert 0.95 <= stopped < 1.5
+    # ook tijdens de storing (0,3 - 1,0 s) is doorgepold
+    assert sum(1 for t in feed.hits if t - started > 0.35) >= 5
+    assert len(spool) == len(feed.hits)
+    assert lock.conn is None
+    spool.close()
+
+
+def test_lost_lock_connection_is_reacquired(monkeypatch):
+    lock = collector.LeaderLock()
+    lock.conn = FakeConn(locked=True)
+    lock.conn.alive = False
+    fresh = FakeConn(locked=True)
+    monkeypatch.setattr(collector, "get_conn", lambda: fresh)
+    assert lock.held()
+    assert lock.conn is fresh
@@ -0,0 +1,65 @@
+from dedup import ChangeFilter
+
+
+def row(ts, icao="484f6d", callsign="KLM1", lat=51.98, lon=5.90, alt_ft=3000, gs_kts=180):
+    return (icao, callsign, ts, lat, lon, alt_ft, gs_kts, 1.0, True, "arnhem")
+
+
+def store(f, rows, now):
+    kept = f.filter(rows)
+    f.remember(kept, now)
+    return kept
+
+
+def test_unchanged_report_is_suppressed():
+    f = ChangeFilter(heartbeat_s=300)
+    store(f, [row(1000)], 1000)
+    assert store(f, [row(1010, lat=51.9801, alt_ft=3020, gs_kts=182)], 1010) == []
+    assert f.stats()["suppressed"] == 1
+
+
+def test_change_beyond_tolerance_is_kept():
+    f = ChangeFilter(heartbeat_s=300)
+    store(f, [row(1000)], 1000)
+    assert len(store(f, [row(1010, alt_ft=3100)], 1010)) == 1
+    assert len(store(f, [row(1020, alt_ft=3100, callsign="KLM2")], 1020)) == 1
+    assert len(store(f, [row(1030, alt_ft=3100, callsign="KLM2", lat=51.99)], 1030)) == 1
+
+
+def test_heartbeat_keeps_a_parked_aircraft():
+    f = ChangeFilter(heartbeat_s=300)
+    store(f, [row(1000)], 1000)
+    assert store(f, [row(1299)], 1299) == []
+    assert len(store(f, [row(1300)], 1300)) == 1
+
+
+def test_same_aircraft_twice_in_one_poll():
+    f = ChangeFilter()
+    kept = f.filter([row(1000), row(1000, lat=52.1)])
+    assert kept == [row(1000)]
+    assert f.stats()["duplicates"] == 1
+
+
+def test_rows_without_icao_are_never_suppressed():
+    f = ChangeFilter()
+    store(f, [row(1000, icao=None)], 1000)
+    assert len(store(f, [row(1010, icao=None), row(1010, icao=None)], 1010)) == 2
+
+
+def test_filter_without_remember_suppresses_nothing():
+    # mislukte insert: remember() niet aangeroepen
+    f = ChangeFilter()
+    f.filter([row(1000)])
+    assert len(f.filter([row(1010)])) == 1
+
+
+def test_snapshot_restore_and_forgetting():
+    f = ChangeFilter(heartbeat_s=300)
+    store(f, [row(1000)], 1000)
+    state = f.snapshot()
+    store(f, [row(1010, icao="aaaaaa")], 1010)
+    f.restore(state)
+    assert f.stats()["tracked_aircraft"] == 1
+    # na 2 × heartbeat vergeten
+    f.remember([], 1601)
+    assert f.stats()["tracked_aircraft"] == 0
@@ -0,0 +1,89 @@
+import io
+
+import pyarrow as pa
+import pyarrow.ipc as pa_ipc
+import pyarrow.parquet as pa_parquet
+import pytest
+
+import export
+
+# zoals COPY ... TO STDOUT WITH (FORMAT csv, HEADER) het levert: booleans als
+# t/f, NULL als leeg veld, een lege string als ""
+POSITIONS_CSV = (
+    "icao,callsign,ts,lat,lon,alt_ft,gs_kts,dist_km,in_bubble,region\n"
+    "484f6d,KLM1234,1000,51.98,5.9,3000,180,1.5,t,arnhem\n"
+    "4ca123,\"\",1010,52.01,5.95,,,4.25,f,arnhem\n"
+    "3c6444,,1020,51.9,5.8,35000,450.5,12,f,\n"
+)
+
+
+class FakeCursor:
+    """db.cursor() die voor elke COPY het vaste CSV-antwoord in stukjes schrijft."""
+
+    def __init__(self, csv):
+        self.csv = csv
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def mogrify(self, sql, params):
+        return sql.encode()
+
+    def copy_expert(self, sql, out):
+        for i in range(0, len(self.csv), 40):
+            out.write(self.csv[i:i + 40])
+
+
+@pytest.fixture
+def copy_csv(monkeypatch):
+    def use(csv):
+        monkeypatch.setattr(export, "cursor", lambda: FakeCursor(csv))
+    return use
+
+
+def export_bytes(fmt):
+    return b"".join(export.iter_export("positions", fmt=fmt))
+
+
+def check_table(table):
+    assert table.schema == pa.schema(
+        [(c, export.arrow_types()[c]) for c in export.POSITION_COLUMNS]
+    )
+    assert table.column("icao").to_pylist() == ["484f6d", "4ca123", "3c6444"]
+    # "" blijft een lege callsign, een leeg veld is NULL
+    assert table.column("callsign").to_pylist() == ["KLM1234", "", None]
+    assert table.column("in_bubble").to_pylist() == [True, False, False]
+    assert table.column("alt_ft").to_pylist() == [3000.0, None, 35000.0]
+    assert table.column("ts").to_pylist() == [1000, 1010, 1020]
+    assert table.column("region").to_pylist() == ["arnhem", "arnhem", None]
+
+
+def test_csv_passes_through_unchanged(copy_csv):
+    copy_csv(POSITIONS_CSV)
+    assert export_bytes("csv").decode() == POSITIONS_CSV
+
+
+def test_arrow_stream_round_trip(copy_csv):
+    copy_csv(POSITIONS_CSV)
+    check_table(pa_ipc.open_stream(export_bytes("arrow")).read_all())
+
+
+def test_parquet_round_trip(copy_csv):
+    copy_csv(POSITIONS_CSV)
+    check_table(pa_parquet.read_table(io.BytesIO(export_bytes("parquet"))))
+
+
+def test_copy_error_reaches_the_reader(monkeypatch):
+    class Broken:
+        def __enter__(self):
+            raise RuntimeError("connection lost")
+
+        def __exit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(export, "cursor", Broken)
+    with pytest.raises(RuntimeError):
+        export_bytes("arrow")
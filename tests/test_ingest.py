@@ -0,0 +1,152 @@
+import math
+import random
+
+import pytest
+
+import ingest
+import regions
+
+
+# -------------------------------------------------------------------
+# Scalaire referentie: de per-meting lus van vóór ingest.py
+# -------------------------------------------------------------------
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dphi / 2) ** 2 +
+        math.cos(phi1) * math.cos(phi2) *
+        math.sin(dlambda / 2) ** 2
+    )
+    return ingest.EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def scalar_rows(ac_list, region_list, ts):
+    rows = []
+    for i, ac in enumerate(ac_list):
+        lat = ingest.numeric(ac.get("lat"))
+        lon = ingest.numeric(ac.get("lon"))
+        if lat is None or lon is None:
+            continue
+        best, best_km = None, None
+        for region in region_list:
+            dist_km = haversine_km(region.lat, region.lon, lat, lon)
+            if dist_km <= region.track_km and (best_km is None or dist_km < best_km):
+                best, best_km = region, dist_km
+        if best is None:
+            continue
+        rows.append((
+            ingest.icao(ac),
+            (ac.get("flight") or "").strip(),
+            ts[i] if isinstance(ts, (list, tuple)) else ts,
+            lat,
+            lon,
+            ingest.numeric(ac.get("alt_baro")),
+            ingest.numeric(ac.get("gs")),
+            best_km,
+            best_km <= best.bubble_km,
+            best.name,
+        ))
+    return rows
+
+
+ARNHEM = regions.Region("arnhem", 51.9851, 5.8987)
+NIJMEGEN = regions.Region("nijmegen", 51.8126, 5.8372, bubble_km=5)
+
+# punten precies op de opslag- en bubbelstraal: de stralen zijn de scalaire
+# afstand van die punten
+EDGE_TRACK = (52.1, 6.05)
+EDGE_BUBBLE = (52.03, 5.93)
+EDGE = regions.Region(
+    "edge", 51.98, 5.95,
+    track_km=haversine_km(51.98, 5.95, *EDGE_TRACK),
+    bubble_km=haversine_km(51.98, 5.95, *EDGE_BUBBLE),
+)
+
+
+def ac(lat, lon, **fields):
+    return dict({"hex": "484f6d", "flight": "KLM1 ", "lat": lat, "lon": lon,
+                 "alt_baro": 3000, "gs": 180}, **fields)
+
+
+def assert_same(ac_list, region_list, ts=1000):
+    got = ingest.position_rows(ac_list, region_list, ts)
+    want = scalar_rows(ac_list, region_list, ts)
+    assert len(got) == len(want)
+    for g, w in zip(got, want):
+        assert g[:7] == w[:7]
+        assert g[7] == pytest.approx(w[7], rel=1e-12)
+        assert g[8:] == w[8:]
+    return got
+
+
+def test_nearest_of_two_overlapping_regions():
+    # tussen Arnhem en Nijmegen: in beider opslagstraal
+    between = [ac(51.90, 5.87), ac(51.86, 5.85), ac(51.95, 5.89), ac(51.8126, 5.8372)]
+    rows = assert_same(between, [ARNHEM, NIJMEGEN])
+    assert [r[9] for r in rows] == ["arnhem", "nijmegen", "arnhem", "nijmegen"]
+    # volgorde van de regio's maakt niet uit
+    assert_same(between, [NIJMEGEN, ARNHEM])
+
+
+def test_points_exactly_on_track_and_bubble_radius():
+    rows = assert_same([ac(*EDGE_TRACK), ac(*EDGE_BUBBLE)], [EDGE])
+    assert [(r[9], r[8]) for r in rows] == [("edge", False), ("edge", True)]
+
+
+def test_points_just_outside_the_radius():
+    assert assert_same([ac(EDGE_TRACK[0] + 1e-6, EDGE_TRACK[1])], [EDGE]) == []
+    assert assert_same([ac(53.0, 5.9), ac(0.0, 0.0)], [EDGE, ARNHEM]) == []
+
+
+def test_missing_nan_and_non_numeric_coordinates_are_skipped():
+    records = [
+        ac(None, 5.9),
+        ac(51.98, None),
+        ac(float("nan"), 5.9),
+        ac(51.98, float("nan")),
+        ac("51.98", 5.9),
+        ac(51.98, "5.9"),
+        ac(True, 5.9),
+        ac(51.98, 5.9),
+    ]
+    rows = assert_same(records, [ARNHEM])
+    assert len(rows) == 1
+
+
+def test_hex_and_icao_give_the_same_address():
+    records = [
+        ac(51.98, 5.9, hex="484F6D "),
+        ac(51.98, 5.9, hex=None, icao="4ca123"),
+        ac(51.98, 5.9, hex="", icao=None),
+    ]
+    rows = assert_same(records, [ARNHEM])
+    assert [r[0] for r in rows] == ["484f6d", "4ca123", None]
+
+
+def test_per_record_timestamps():
+    records = [ac(51.98, 5.9), ac(53.0, 5.9), ac(51.97, 5.91)]
+    rows = assert_same(records, [ARNHEM], ts=[1000, 1005, 1010])
+    assert [r[2] for r in rows] == [1000, 1010]
+
+
+def test_non_numeric_altitude_and_speed_become_null():
+    rows = assert_same([ac(51.98, 5.9, alt_baro="ground", gs=None)], [ARNHEM])
+    assert rows[0][5:7] == (None, None)
+
+
+def test_empty_batch():
+    assert ingest.position_rows([], [ARNHEM], 1000) == []
+
+
+def test_random_batch_matches_scalar_path():
+    rng = random.Random(42)
+    records = [
+        ac(rng.uniform(51.6, 52.2), rng.uniform(5.5, 6.3),
+           hex=rng.choice(["484f6d", "4CA123", None]),
+           alt_baro=rng.choice([3000, "ground", None]))
+        for _ in range(2000)
+    ]
+    assert_same(records, [ARNHEM, NIJMEGEN, EDGE], ts=list(range(len(records))))
@@ -0,0 +1,86 @@
+from segmentation import FLIGHT_GAP_S, StreamingSegmenter
+
+
+def seen(ts, callsign="KLM1", in_bubble=False, gs_kts=None, alt_ft=None, region="arnhem"):
+    return (callsign, ts, in_bubble, gs_kts, alt_ft, region)
+
+
+def feed_and_apply(seg, now, measurements, seqs=None):
+    changed, closed = seg.feed(now, measurements)
+    seg.apply(changed, closed, seqs or {})
+    return changed, closed
+
+
+def test_new_flight_gets_seq_from_database():
+    seg = StreamingSegmenter()
+    changed, closed = seg.feed(1000, [seen(1000)])
+    assert closed == []
+    assert changed["KLM1"]["flight_seq"] is None
+    seg.apply(changed, closed, {"KLM1": 7})
+    assert seg.open["KLM1"]["flight_seq"] == 7
+
+
+def test_measurements_within_gap_extend_the_flight():
+    seg = StreamingSegmenter()
+    feed_and_apply(seg, 1000, [seen(1000)], {"KLM1": 1})
+    changed, closed = feed_and_apply(seg, 1000 + FLIGHT_GAP_S, [seen(1000 + FLIGHT_GAP_S)])
+    assert closed == []
+    flight = changed["KLM1"]
+    assert (flight["flight_seq"], flight["first_ts"], flight["last_ts"]) == (1, 1000, 4600)
+    assert flight["points"] == 2
+
+
+def test_gap_over_3600_s_starts_next_flight():
+    seg = StreamingSegmenter()
+    feed_and_apply(seg, 1000, [seen(1000)], {"KLM1": 1})
+    ts = 1000 + FLIGHT_GAP_S + 1
+    changed, closed = seg.feed(ts, [seen(ts)])
+    assert [(f["flight_seq"], f["closed"], f["last_ts"]) for f in closed] == [(1, True, 1000)]
+    assert changed["KLM1"]["flight_seq"] is None
+    assert changed["KLM1"]["first_ts"] == ts
+    seg.apply(changed, closed, {"KLM1": 2})
+    assert seg.open["KLM1"]["flight_seq"] == 2
+
+
+def test_next_flight_does_not_reuse_a_backfilled_seq():
+    # een backfill van oudere data gaf vlucht 6 aan een vlucht van een jaar
+    # eerder; de open vlucht is 5. De volgende mag niet op 6 uitkomen (dat
+    # zou via ON CONFLICT de oude vlucht overschrijven) maar krijgt MAX + 1.
+    seg = StreamingSegmenter()
+    feed_and_apply(seg, 1000, [seen(1000)], {"KLM1": 5})
+    ts = 1000 + FLIGHT_GAP_S + 1
+    changed, closed = seg.feed(ts, [seen(ts)])
+    assert [f["flight_seq"] for f in closed] == [5]
+    assert changed["KLM1"]["flight_seq"] is None
+    seg.apply(changed, closed, {"KLM1": 7})
+    assert seg.open["KLM1"]["flight_seq"] == 7
+
+
+def test_unseen_flight_closes_after_gap():
+    seg = StreamingSegmenter()
+    feed_and_apply(seg, 1000, [seen(1000)], {"KLM1": 1})
+    assert seg.feed(1000 + FLIGHT_GAP_S, [])[1] == []
+    changed, closed = feed_and_apply(seg, 1000 + FLIGHT_GAP_S + 1, [])
+    assert changed == {}
+    assert [f["callsign"] for f in closed] == ["KLM1"]
+    assert seg.open == {}
+
+
+def test_last_bubble_measurement_wins():
+    seg = StreamingSegmenter()
+    feed_and_apply(seg, 1000, [seen(1000, in_bubble=True, gs_kts=150, alt_ft=2000)], {"KLM1": 1})
+    changed, _ = feed_and_apply(seg, 1010, [seen(1010, gs_kts=180, alt_ft=3000, region="x")])
+    flight = changed["KLM1"]
+    # buiten de bubbel: bubble_ts/gs/alt en regio blijven van de bubbel-meting
+    assert (flight["in_bubble"], flight["bubble_ts"], flight["gs_kts"]) == (True, 1000, 150)
+    assert flight["region"] == "arnhem"
+
+
+def test_feed_does_not_change_state_until_apply():
+    seg = StreamingSegmenter()
+    feed_and_apply(seg, 1000, [seen(1000)], {"KLM1": 1})
+    state = seg.snapshot()
+    seg.feed(1010, [seen(1010)])
+    assert seg.open["KLM1"]["last_ts"] == 1000
+    seg.restore(state)
+    assert seg.open["KLM1"]["points"] == 1
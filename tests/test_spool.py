@@ -0,0 +1,85 @@
+import os
+
+from spool import HEADER, Spool
+
+ROWS = [("484f6d", "KLM1", 1000, 51.98, 5.9, 3000, 180, 1.0, True, "arnhem")]
+
+
+def test_batches_come_back_in_order(tmp_path):
+    spool = Spool(str(tmp_path / "s"))
+    spool.append(1000, ROWS)
+    spool.append(1010, [])
+    assert spool.peek(10) == [(1000, ROWS), (1010, [])]
+    spool.consume(1)
+    assert spool.peek(10) == [(1010, [])]
+    spool.close()
+
+
+def test_pending_batches_survive_a_restart(tmp_path):
+    path = str(tmp_path / "s")
+    spool = Spool(path)
+    for ts in (1000, 1010, 1020):
+        spool.append(ts, ROWS)
+    spool.consume(1)
+    spool.close()
+
+    spool = Spool(path)
+    assert [ts for ts, _ in spool.peek(10)] == [1010, 1020]
+    spool.close()
+
+
+def test_torn_tail_is_discarded(tmp_path):
+    path = str(tmp_path / "s")
+    spool = Spool(path)
+    spool.append(1000, ROWS)
+    spool.append(1010, ROWS)
+    spool.close()
+    good_size = os.path.getsize(path)
+
+    # crash halverwege een append: header plus een deel van de payload
+    with open(path, "ab") as f:
+        f.write(HEADER.pack(500, 0) + b'[1020,[["48')
+
+    spool = Spool(path)
+    assert len(spool) == 2
+    assert os.path.getsize(path) == good_size
+    # na herstel gaat appenden gewoon verder
+    spool.append(1020, ROWS)
+    assert [ts for ts, _ in spool.peek(10)] == [1000, 1010, 1020]
+    spool.close()
+
+
+def test_corrupt_record_ends_the_spool(tmp_path):
+    path = str(tmp_path / "s")
+    spool = Spool(path)
+    spool.append(1000, ROWS)
+    spool.append(1010, ROWS)
+    spool.close()
+
+    with open(path, "r+b") as f:
+        f.seek(-3, os.SEEK_END)
+        f.write(b"XXX")
+
+    spool = Spool(path)
+    assert [ts for ts, _ in spool.peek(10)] == [1000]
+    spool.close()
+
+
+def test_full_spool_drops_oldest(tmp_path):
+    spool = Spool(str(tmp_path / "s"), max_bytes=1000)
+    for ts in range(20):
+        spool.append(ts, ROWS)
+    pending = [ts for ts, _ in spool.peek(100)]
+    assert spool.dropped > 0
+    assert pending == list(range(20 - len(pending), 20))
+    spool.close()
+
+
+def test_discard_counts_as_dropped(tmp_path):
+    spool = Spool(str(tmp_path / "s"))
+    spool.append(1000, ROWS)
+    spool.append(1010, ROWS)
+    spool.discard(1)
+    assert [ts for ts, _ in spool.peek(10)] == [1010]
+    assert (spool.dropped, spool.replayed) == (1, 0)
+    spool.close()
@@ -0,0 +1,40 @@
+import tracks
+
+# ~1,1 km per 0,01° noord; een zigzag van ~110 m om de lijn
+LATS = [51.90, 51.91, 51.92, 51.93, 51.94]
+LONS = [5.900, 5.9016, 5.900, 5.9016, 5.900]
+
+
+def test_short_or_unsimplified_tracks_are_kept():
+    assert tracks.simplify([51.9, 52.0], [5.9, 5.9], tolerance=1000) == [0, 1]
+    assert tracks.simplify(LATS, LONS) == [0, 1, 2, 3, 4]
+    assert tracks.simplify(LATS, LONS, max_points=10) == [0, 1, 2, 3, 4]
+
+
+def test_straight_line_collapses_to_endpoints():
+    lats = [51.90 + i * 0.01 for i in range(10)]
+    lons = [5.9] * 10
+    assert tracks.simplify(lats, lons, tolerance=1) == [0, 9]
+
+
+def test_tolerance_keeps_deviations_above_it():
+    assert tracks.simplify(LATS, LONS, tolerance=50) == [0, 1, 2, 3, 4]
+    assert tracks.simplify(LATS, LONS, tolerance=500) == [0, 4]
+
+
+def test_max_points_keeps_the_most_important():
+    keep = tracks.simplify(LATS, LONS, max_points=3)
+    assert len(keep) == 3
+    assert keep[0] == 0 and keep[-1] == 4
+    assert keep == sorted(keep)
+
+
+def test_encode_polyline_reference_example():
+    # voorbeeld uit de Google-documentatie
+    lats = [38.5, 40.7, 43.252]
+    lons = [-120.2, -120.95, -126.453]
+    assert tracks.encode_polyline(lats, lons) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def test_encode_polyline_empty():
+    assert tracks.encode_polyline([], []) == ""
@@ -0,0 +1,95 @@
+import math
+
+# Vereenvoudigen en compact coderen van tracks voor /api/tracks.
+#
+# Douglas-Peucker krijgt hier een "belang" per punt: de afwijking (m)
+# waarmee het punt gekozen werd, begrensd door die van zijn ouder. Punten
+# met belang >= tolerance zijn precies de Douglas-Peucker-uitkomst bij die
+# tolerance, en de max_points belangrijkste punten geven de beste
+# benadering met zoveel punten. Eén doorrekening dient dus beide.
+
+M_PER_DEG_LAT = 111_195.0
+
+
+def project(lats, lons):
+    """Lokale equirectangulaire projectie naar meters (rond het eerste punt)."""
+    lat0 = lats[0]
+    lon0 = lons[0]
+    kx = M_PER_DEG_LAT * math.cos(math.radians(lat0))
+    xs = [(lon - lon0) * kx for lon in lons]
+    ys = [(lat - lat0) * M_PER_DEG_LAT for lat in lats]
+    return xs, ys
+
+
+def segment_distance(px, py, ax, ay, bx, by):
+    dx = bx - ax
+    dy = by - ay
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length2))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def importance(lats, lons):
+    """Douglas-Peucker-belang per punt (m); begin- en eindpunt zijn oneindig."""
+    n = len(lats)
+    imp = [0.0] * n
+    if n == 0:
+        return imp
+    imp[0] = imp[-1] = math.inf
+    xs, ys = project(lats, lons)
+
+    stack = [(0, n - 1, math.inf)]
+    while stack:
+        a, b, parent = stack.pop()
+        if b - a < 2:
+            continue
+        best = -1.0
+        index = a + 1
+        for i in range(a + 1, b):
+            d = segment_distance(xs[i], ys[i], xs[a], ys[a], xs[b], ys[b])
+            if d > best:
+                best = d
+                index = i
+        imp[index] = min(best, parent)
+        stack.append((a, index, imp[index]))
+        stack.append((index, b, imp[index]))
+    return imp
+
+
+def simplify(lats, lons, tolerance=None, max_points=None):
+    """Indexen (oplopend) van de punten die overblijven."""
+    n = len(lats)
+    if n <= 2 or (not tolerance and (max_points is None or n <= max_points)):
+        return list(range(n))
+
+    imp = importance(lats, lons)
+    keep = [i for i in range(n) if imp[i] >= (tolerance or 0)]
+    if max_points is not None and len(keep) > max_points:
+        keep = sorted(sorted(keep, key=lambda i: imp[i], reverse=True)[:max(max_points, 2)])
+    return keep
+
+
+# -------------------------------------------------------------------
+# Google encoded polyline (precisie 5)
+# -------------------------------------------------------------------
+def _encode_value(value, out):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode_polyline(lats, lons, precision=5):
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lon = 0
+    for lat, lon in zip(lats, lons):
+        ilat = round(lat * factor)
+        ilon = round(lon * factor)
+        _encode_value(ilat - prev_lat, out)
+        _encode_value(ilon - prev_lon, out)
+        prev_lat, prev_lon = ilat, ilon
+    return "".join(out)